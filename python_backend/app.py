@@ -2,53 +2,138 @@ from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from routes.auth_routes import auth_bp
 from routes.document_routes import document_bp
 from routes.user_routes import user_bp
 from routes.ai_routes import ai_bp
+from routes.upload_routes import upload_bp
+from utils.metrics import init_metrics
+from utils.compression import init_compression
+from utils.change_feed import change_feed, init_change_feed
+from utils.search_index import search_indexes
+from utils.suggestions import suggestion_indexes
+from utils.stats_reconciler import init_stats_reconciler
+from utils.database import LazyDatabase
 
 # Load environment variables
 load_dotenv()
 
-# Create Flask app
-app = Flask(__name__)
-CORS(app)
 
-# Configure app
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB limit
-app.config['JWT_SECRET'] = os.environ.get('JWT_SECRET')
-app.config['MONGODB_URI'] = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/ai-document-app')
+def create_app(config=None):
+    """
+    Create and configure the Flask app
+    
+    Nothing is connected or started here: MongoDB connects on first use,
+    background jobs start with the first request of each worker, and heavy
+    libraries (OpenAI client, PDF/DOCX parsers, bcrypt) are imported when
+    first needed.
+    
+    Args:
+        config (dict): Settings overriding those read from the environment
+        
+    Returns:
+        Flask: The app
+    """
+    app = Flask(__name__)
+    CORS(app)
+    
+    # Configure app
+    app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB limit per request
+    app.config['MAX_RESUMABLE_UPLOAD_SIZE'] = int(os.environ.get('MAX_RESUMABLE_UPLOAD_SIZE', 512 * 1024 * 1024))  # 512MB
+    app.config['RESUMABLE_CHUNK_SIZE'] = 8 * 1024 * 1024  # Must stay below MAX_CONTENT_LENGTH
+    app.config['JWT_SECRET'] = os.environ.get('JWT_SECRET')
+    app.config['MONGODB_URI'] = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/ai-document-app')
+    app.config['OPENAI_API_KEY'] = os.environ.get('OPENAI_API_KEY')
+    
+    # Admission control for AI routes
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # 'memory' or 'mongo'
+    app.config['LLM_MAX_CONCURRENCY'] = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))
+    app.config['LLM_MAX_QUEUE'] = int(os.environ.get('LLM_MAX_QUEUE', 16))
+    app.config['LLM_QUEUE_TIMEOUT'] = float(os.environ.get('LLM_QUEUE_TIMEOUT', 10))
+    
+    # Coalescing of duplicate AI work: 'local' (threads of one process) or 'mongo' (all workers)
+    app.config['SINGLE_FLIGHT_BACKEND'] = os.environ.get('SINGLE_FLIGHT_BACKEND', 'local')
+    
+    # Question answering: chunks retrieved per question and the prompt budget for them
+    app.config['ASK_TOP_K'] = int(os.environ.get('ASK_TOP_K', 8))
+    app.config['ASK_CONTEXT_TOKENS'] = int(os.environ.get('ASK_CONTEXT_TOKENS', 1500))
+    
+    # Corpus-wide search: optional LLM re-rank/answer step limits
+    app.config['SEARCH_LLM_CANDIDATES'] = int(os.environ.get('SEARCH_LLM_CANDIDATES', 8))
+    app.config['SEARCH_LLM_TIMEOUT'] = float(os.environ.get('SEARCH_LLM_TIMEOUT', 5))
+    
+    # Instrumentation: request/span histograms on /metrics and Server-Timing headers
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    # Sampling profiler for requests sent with ?profile=1 or an X-Profile: 1 header
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    app.config['PROFILE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+    
+    # Cross-worker change feed: 'auto' (change streams, polling on standalone servers), 'stream', 'poll' or 'off'
+    app.config['CHANGE_FEED_MODE'] = os.environ.get('CHANGE_FEED_MODE', 'auto')
+    app.config['CHANGE_FEED_POLL_INTERVAL'] = float(os.environ.get('CHANGE_FEED_POLL_INTERVAL', 1))
+    
+    # Seconds between recomputations of each owner's library statistics (0 disables the job)
+    app.config['STATS_RECONCILE_INTERVAL'] = int(os.environ.get('STATS_RECONCILE_INTERVAL', 3600))
+    
+    # Near-duplicate detection: estimated similarity at which an upload is flagged, and at which
+    # a near-identical document's summary and key points are reused instead of calling OpenAI (0 disables)
+    app.config['NEAR_DUPLICATE_THRESHOLD'] = float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', 0.8))
+    app.config['AI_REUSE_SIMILARITY'] = float(os.environ.get('AI_REUSE_SIMILARITY', 0.9))
+    
+    # gzip/brotli compression of JSON and text responses larger than COMPRESSION_MIN_SIZE bytes
+    app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    
+    # Settings passed to the factory win over the environment
+    if config:
+        app.config.update(config)
+    app.config.setdefault('UPLOAD_TEMP_FOLDER', os.path.join(app.config['UPLOAD_FOLDER'], '.partial'))
+    
+    # MongoDB is connected on first use, in the process that serves requests
+    app.config.setdefault('DB', LazyDatabase(app.config['MONGODB_URI']))
+    
+    # Create uploads directory if it doesn't exist
+    if not os.path.exists(app.config['UPLOAD_FOLDER']):
+        os.makedirs(app.config['UPLOAD_FOLDER'])
+    
+    # Register request instrumentation
+    init_metrics(app)
+    
+    # Compress responses the client accepts compressed
+    init_compression(app)
+    
+    # Keep in-process indexes in step with writes made by other workers
+    change_feed.register('search_index', search_indexes.apply_change, search_indexes.clear)
+    change_feed.register('suggestions', suggestion_indexes.apply_change, suggestion_indexes.clear)
+    init_change_feed(app)
+    
+    # Periodically correct drift in the incrementally maintained library statistics
+    init_stats_reconciler(app)
+    
+    # Register blueprints
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(document_bp, url_prefix='/api/documents')
+    app.register_blueprint(user_bp, url_prefix='/api/users')
+    app.register_blueprint(ai_bp, url_prefix='/api/ai')
+    app.register_blueprint(upload_bp, url_prefix='/api/uploads')
+    
+    # Serve uploaded files
+    @app.route('/uploads/<path:filename>')
+    def uploaded_file(filename):
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    
+    # Root route
+    @app.route('/')
+    def index():
+        return jsonify({'message': 'AI Document Web App API is running'})
+    
+    return app
 
-# Create uploads directory if it doesn't exist
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
 
-# Connect to MongoDB
-try:
-    mongo_client = MongoClient(app.config['MONGODB_URI'])
-    db = mongo_client.get_database()
-    app.config['DB'] = db
-    print('Connected to MongoDB')
-except Exception as e:
-    print(f'MongoDB connection error: {e}')
-
-# Register blueprints
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(document_bp, url_prefix='/api/documents')
-app.register_blueprint(user_bp, url_prefix='/api/users')
-app.register_blueprint(ai_bp, url_prefix='/api/ai')
-
-# Serve uploaded files
-@app.route('/uploads/<path:filename>')
-def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-
-# Root route
-@app.route('/')
-def index():
-    return jsonify({'message': 'AI Document Web App API is running'})
+# Module-level app for `python app.py` and WSGI servers (app:app)
+app = create_app()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
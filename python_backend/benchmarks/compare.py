@@ -0,0 +1,57 @@
+"""
+Compare two benchmark result files
+
+Usage:
+    python benchmarks/compare.py BASELINE.json CANDIDATE.json [--threshold 0.10]
+
+Exits with status 1 if any benchmark's median got slower by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline, candidate, threshold):
+    """
+    Compare median timings of benchmarks present in both reports
+
+    Returns:
+        list: (name, baseline_ms, candidate_ms, change, regressed) tuples
+    """
+    rows = []
+    for name in sorted(set(baseline['results']) & set(candidate['results'])):
+        before = baseline['results'][name]['median_ms']
+        after = candidate['results'][name]['median_ms']
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change, change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown of the median counted as a regression')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    rows = compare(baseline, candidate, args.threshold)
+    width = max([len(row[0]) for row in rows] + [9])
+    print(f'{"benchmark":<{width}}  {"baseline":>12}  {"candidate":>12}  {"change":>8}')
+    for name, before, after, change, regressed in rows:
+        marker = '  REGRESSION' if regressed else ''
+        print(f'{name:<{width}}  {before:10.2f}ms  {after:10.2f}ms  {change:+7.1%}{marker}')
+
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f'{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import os
+import random
+
+# Target extracted-text sizes (bytes) for each corpus size
+SIZES = {
+    'small': 10 * 1024,
+    'medium': 200 * 1024,
+    'large': 2 * 1024 * 1024,
+}
+
+WORDS = (
+    'document search retrieval summary analysis report project quarterly revenue '
+    'customer product market strategy research data model system network security '
+    'policy review meeting schedule budget forecast growth team design interface '
+    'performance latency throughput storage index query result archive contract '
+    'invoice proposal roadmap feature release deployment monitoring incident audit'
+).split()
+
+
+def generate_text(size, seed=0):
+    """
+    Generate deterministic pseudo-English text of roughly the given size
+
+    Args:
+        size (int): Approximate size in bytes
+        seed (int): Random seed, so corpora are identical between runs
+
+    Returns:
+        list: Paragraphs of text
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    total = 0
+    while total < size:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+            sentences.append(' '.join(words).capitalize() + '.')
+        paragraph = ' '.join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 1
+    return paragraphs
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path, paragraphs, lines_per_page=60, chars_per_line=90):
+    """
+    Write a minimal multi-page PDF with one Helvetica text object per page
+    """
+    lines = []
+    for paragraph in paragraphs:
+        while paragraph:
+            lines.append(paragraph[:chars_per_line])
+            paragraph = paragraph[chars_per_line:]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = []
+    page_ids = []
+    first_page_id = 4
+    for index, page_lines in enumerate(pages):
+        page_id = first_page_id + index * 2
+        page_ids.append(page_id)
+        stream = 'BT /F1 10 Tf 12 TL 40 800 Td\n'
+        stream += ''.join(f'({_pdf_escape(line)}) Tj T*\n' for line in page_lines)
+        stream += 'ET'
+        objects.append((page_id, f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                                 f'/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>'))
+        objects.append((page_id + 1, f'<< /Length {len(stream.encode("latin-1"))} >>\nstream\n{stream}\nendstream'))
+
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    objects = [
+        (1, '<< /Type /Catalog /Pages 2 0 R >>'),
+        (2, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'),
+        (3, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'),
+    ] + objects
+
+    output = b'%PDF-1.4\n'
+    offsets = {}
+    for object_id, body in objects:
+        offsets[object_id] = len(output)
+        output += f'{object_id} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+
+    xref_offset = len(output)
+    output += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    for object_id in range(1, len(objects) + 1):
+        output += f'{offsets[object_id]:010d} 00000 n \n'.encode('latin-1')
+    output += (f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n'
+               f'startxref\n{xref_offset}\n%%EOF\n').encode('latin-1')
+
+    with open(path, 'wb') as f:
+        f.write(output)
+
+
+def write_docx(path, paragraphs):
+    import docx
+
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def write_txt(path, paragraphs):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(paragraphs))
+
+
+WRITERS = {
+    'pdf': write_pdf,
+    'docx': write_docx,
+    'txt': write_txt,
+}
+
+
+def build_corpus(directory, sizes=None, file_types=None):
+    """
+    Generate one file per (file type, size) into a directory
+
+    Returns:
+        dict: Maps (file_type, size_name) to the generated file path
+    """
+    os.makedirs(directory, exist_ok=True)
+    corpus = {}
+    for size_name in sizes or SIZES:
+        paragraphs = generate_text(SIZES[size_name], seed=len(size_name))
+        for file_type in file_types or WRITERS:
+            path = os.path.join(directory, f'{size_name}.{file_type}')
+            if not os.path.exists(path):
+                WRITERS[file_type](path, paragraphs)
+            corpus[(file_type, size_name)] = path
+    return corpus
@@ -0,0 +1,94 @@
+"""
+Startup budget check based on `python -X importtime`
+
+Usage (from python_backend/):
+    python benchmarks/import_time.py [--budget-ratio 0.5] [--budget-ms MS] [--repeat 5] [--top 15]
+
+Imports flask and pymongo, then app.py, in fresh interpreters and reports the
+median import time of the app's own modules and the slowest imports. Wall-clock
+times vary too much between runs and machines for a fixed budget, so the app's
+own import time is compared with that of flask and pymongo in the same
+interpreter. Exits with status 1 when a dependency that must be imported lazily
+shows up at startup, when the median ratio exceeds --budget-ratio, or, if
+given, when the median total exceeds --budget-ms.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies that are imported on first use, never at startup
+LAZY_MODULES = ('openai', 'PyPDF2', 'docx', 'bcrypt')
+
+# Imported first as the reference the app's own import time is compared with
+REFERENCE_MODULES = ('flask', 'pymongo')
+
+
+def import_times(modules=REFERENCE_MODULES + ('app',)):
+    """
+    Import modules in order in a fresh interpreter with -X importtime
+
+    Returns:
+        dict: Module name -> (self µs, cumulative µs)
+    """
+    env = dict(os.environ, JWT_SECRET=os.environ.get('JWT_SECRET', 'import-time'), CHANGE_FEED_MODE='off')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {", ".join(modules)}'],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the startup import time of the app')
+    parser.add_argument('--budget-ratio', type=float, default=0.5,
+                        help='Maximum median import time of the app\'s own modules, relative to flask and pymongo')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='Maximum median total import time, for machines with a known baseline')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters measured')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports listed')
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.repeat)]
+    references = [sum(run[name][1] for name in REFERENCE_MODULES) / 1000 for run in runs]
+    own = [run['app'][1] / 1000 for run in runs]
+    reference_median = statistics.median(references)
+    own_median = statistics.median(own)
+    ratio = statistics.median(app_ms / reference_ms for app_ms, reference_ms in zip(own, references))
+    total = statistics.median(app_ms + reference_ms for app_ms, reference_ms in zip(own, references))
+
+    last = runs[-1]
+    print(f'{"cumulative ms":>14}  {"self ms":>8}  module')
+    for name, (self_us, cumulative_us) in sorted(last.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f'{cumulative_us / 1000:14.1f}  {self_us / 1000:8.1f}  {name}')
+
+    failed = False
+    eager = [name for name in last if name.split('.')[0] in LAZY_MODULES]
+    if eager:
+        print(f'\nImported at startup but should be lazy: {", ".join(sorted(eager)[:10])}')
+        failed = True
+
+    print(f'\nimport flask, pymongo: median {reference_median:.1f} ms over {args.repeat} runs')
+    print(f'import app after them: median {own_median:.1f} ms, {ratio:.2f}x the reference '
+          f'(budget {args.budget_ratio:.2f}x)')
+    print(f'total: median {total:.1f} ms' + (f' (budget {args.budget_ms:.0f} ms)' if args.budget_ms else ''))
+    if ratio > args.budget_ratio:
+        print('Over budget relative to flask and pymongo')
+        failed = True
+    if args.budget_ms and total > args.budget_ms:
+        print('Over budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,419 @@
+"""
+Offline benchmark suite for the Python backend hot paths
+
+Usage (from python_backend/):
+    python benchmarks/run_benchmarks.py [--mongo mongomock|local] [--quick] [--output FILE]
+
+MongoDB is replaced by mongomock (or a local mongod with --mongo local) and
+OpenAI by a local stub server, so no network access is needed. Results are
+written as JSON; compare two runs with benchmarks/compare.py.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.corpus import build_corpus, generate_text, SIZES  # noqa: E402
+from benchmarks.stub_openai import StubOpenAIServer  # noqa: E402
+
+
+def measure(fn, repeat, warmup=1, setup=None, nbytes=None):
+    """
+    Time fn over several runs
+
+    Args:
+        fn (callable): Code being measured
+        repeat (int): Number of measured runs
+        warmup (int): Unmeasured runs done first
+        setup (callable): Called before every run, outside the timed section
+        nbytes (int): Bytes processed per run, to report throughput
+
+    Returns:
+        dict: Timing statistics in milliseconds
+    """
+    times = []
+    for i in range(warmup + repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            times.append(elapsed)
+
+    times.sort()
+    result = {
+        'repeat': repeat,
+        'min_ms': times[0] * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'p95_ms': times[min(len(times) - 1, int(len(times) * 0.95))] * 1000,
+        'p99_ms': times[min(len(times) - 1, int(len(times) * 0.99))] * 1000,
+        'mean_ms': statistics.mean(times) * 1000,
+    }
+    if nbytes:
+        result['mb_per_s'] = nbytes / (1024 * 1024) / statistics.median(times)
+    return result
+
+
+def expect(response, status):
+    if response.status_code != status:
+        raise RuntimeError(f'Expected {status}, got {response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return response
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def create_database(backend):
+    if backend == 'mongomock':
+        import mongomock
+        return mongomock.MongoClient().get_database('benchmark')
+
+    from pymongo import MongoClient
+    uri = os.environ.get('BENCH_MONGODB_URI', 'mongodb://localhost:27017/ai-document-benchmark')
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    client.admin.command('ping')
+    db = client.get_database()
+    client.drop_database(db.name)
+    return db
+
+
+def seed_documents(db, owner_id, count):
+    docs = []
+    now = datetime.now()
+    for i in range(count):
+        content = '\n'.join(generate_text(4 * 1024, seed=i))
+        docs.append({
+            'title': f'Synthetic report {i}',
+            'originalFilename': f'report-{i}.txt',
+            'fileType': 'txt',
+            'fileSize': len(content),
+            'filePath': '',
+            'content': content,
+            'owner': owner_id,
+            'tags': ['synthetic', f'batch-{i % 10}'],
+            'isFavorite': i % 7 == 0,
+            'summary': None,
+            'keyPoints': [],
+            'createdAt': now - timedelta(minutes=i),
+            'updatedAt': now - timedelta(minutes=i),
+        })
+    document_ids = db.documents.insert_many(docs).inserted_ids
+
+    # Chunk features for question answering and corpus-wide search
+    from models.chunk import DocumentChunk
+    for document in docs:
+        DocumentChunk.replace_for_document(document)
+    return document_ids
+
+
+def bench_search_index(chunk_count, repeat):
+    """
+    Time warm BM25 queries against an in-memory index of chunk_count chunks
+    """
+    from bson import ObjectId
+    from utils.retrieval import chunk_features, split_into_chunks
+    from utils.search_index import OwnerIndex
+
+    text = '\n'.join(generate_text(1200 * 1000, seed=7))
+    chunks = [dict(chunk_features(chunk_text), _id=i, index=i, start=start)
+              for i, (start, chunk_text) in enumerate(split_into_chunks(text))]
+    index = OwnerIndex()
+    while len(index.chunks) < chunk_count:
+        index.add_document(ObjectId(), chunks[:chunk_count - len(index.chunks)])
+
+    queries = [['quarterly', 'revenue', 'forecast'], ['incident', 'audit'], ['latency', 'storage', 'index']]
+    for terms in queries:
+        index.search(terms, 50)
+    return measure(lambda: [index.search(terms, 50) for terms in queries], repeat), index
+
+
+def bench_fuzzy_expand(index, repeat):
+    """
+    Time expansion of misspelled terms against the vocabulary of an index
+    """
+    queries = [['quartrly', 'revenu', 'forcast'], ['incidnet', 'audti'], ['latncy', 'storgae', 'indx']]
+    index.expand_terms(queries[0])
+    return measure(lambda: [index.expand_terms(terms) for terms in queries], repeat)
+
+
+def bench_during_ai_burst(app, stub, headers, target, fn, repeat, threads=8, llm_latency=0.2):
+    """
+    Time a non-AI request while other clients keep hitting an uncached AI route
+
+    Rate limiting and the LLM concurrency cap are on during the burst, as in
+    production, so the p99 shows how much AI load leaks into other routes.
+    """
+    stopped = threading.Event()
+    outcomes = {}
+    outcomes_lock = threading.Lock()
+
+    def burst():
+        client = app.test_client()
+        while not stopped.is_set():
+            status = client.post(f'/api/ai/generate-tags/{target}', headers=headers).status_code
+            with outcomes_lock:
+                outcomes[status] = outcomes.get(status, 0) + 1
+
+    previous_latency, stub.server.latency = stub.server.latency, llm_latency
+    app.config['RATE_LIMIT_ENABLED'] = True
+    workers = [threading.Thread(target=burst, daemon=True) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    try:
+        time.sleep(llm_latency)
+        result = measure(fn, repeat)
+    finally:
+        stopped.set()
+        for worker in workers:
+            worker.join()
+        app.config['RATE_LIMIT_ENABLED'] = False
+        stub.server.latency = previous_latency
+
+    result['ai_responses'] = {str(status): count for status, count in sorted(outcomes.items())}
+    return result
+
+
+def run(args):
+    stub = StubOpenAIServer(latency=args.llm_latency).start()
+
+    # Environment must be in place before app.py is imported
+    os.environ.update({
+        'JWT_SECRET': 'benchmark-secret',
+        'OPENAI_API_KEY': 'sk-benchmark',
+        'OPENAI_API_BASE': stub.api_base,
+        'RATE_LIMIT_ENABLED': 'false',
+        'CHANGE_FEED_MODE': 'off',  # No other workers; keep the poller out of the timings
+        'STATS_RECONCILE_INTERVAL': '0',
+    })
+
+    import jwt
+    import openai
+    from app import create_app
+    from models.user import User
+    from utils.parser_registry import extract
+
+    openai.api_base = stub.api_base
+    work_dir = tempfile.mkdtemp(prefix='ai-doc-bench-')
+    db = create_database(args.mongo)
+    app = create_app({'UPLOAD_FOLDER': os.path.join(work_dir, 'uploads'), 'DB': db})
+
+    sizes = ['small', 'medium'] if args.quick else list(SIZES)
+    repeat = 3 if args.quick else args.repeat
+    corpus = build_corpus(os.path.join(work_dir, 'corpus'), sizes=sizes)
+    results = {}
+
+    # Cold start of a fresh interpreter importing the app (see also benchmarks/import_time.py)
+    env = dict(os.environ, CHANGE_FEED_MODE='off')
+    results['startup.import_app'] = measure(
+        lambda: subprocess.run([sys.executable, '-c', 'import app'], cwd=BACKEND_DIR, env=env, check=True,
+                               stdout=subprocess.DEVNULL),
+        repeat
+    )
+
+    # Parsers, including format sniffing and parser selection
+    for (file_type, size_name), path in sorted(corpus.items()):
+        results[f'parser.{file_type}.{size_name}'] = measure(
+            lambda: extract(path), repeat, nbytes=os.path.getsize(path)
+        )
+
+    # Near-duplicate signature of extracted text; mb_per_s is the signature cost per MB
+    from utils.minhash import signature
+    text = '\n'.join(generate_text(1024 * 1024, seed=5))
+    results['minhash.signature.1mb'] = measure(lambda: signature(text), repeat, nbytes=len(text.encode()))
+
+    client = app.test_client()
+    with app.app_context():
+        user = User.create({'fullName': 'Bench User', 'email': 'bench@example.com', 'password': 'benchmark'})
+        user_id = user['_id']
+        document_ids = seed_documents(db, user_id, args.documents)
+
+    token = jwt.encode({'userId': str(user_id), 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       'benchmark-secret', algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    # Authentication
+    results['auth.login'] = measure(
+        lambda: expect(client.post('/api/auth/login', json={'email': 'bench@example.com', 'password': 'benchmark'}), 200),
+        repeat
+    )
+    results['auth.jwt_me'] = measure(lambda: expect(client.get('/api/auth/me', headers=headers), 200), repeat * 10)
+
+    # Upload end-to-end (multipart parsing, save, extraction, insert)
+    for (file_type, size_name), path in sorted(corpus.items()):
+        with open(path, 'rb') as f:
+            data = f.read()
+        results[f'upload.{file_type}.{size_name}'] = measure(
+            lambda: expect(client.post(
+                '/api/documents/upload',
+                headers=headers,
+                data={'document': (io.BytesIO(data), f'{size_name}.{file_type}'), 'title': size_name},
+                content_type='multipart/form-data'
+            ), 201),
+            repeat,
+            nbytes=len(data)
+        )
+
+    # Listing
+    # Bodies are read so streamed responses are fully serialized inside the timing
+    results['documents.list'] = measure(
+        lambda: expect(client.get('/api/documents/', headers=headers), 200).get_data(), repeat
+    )
+    results['documents.list.gzip'] = measure(
+        lambda: expect(client.get('/api/documents/', headers=dict(headers, **{'Accept-Encoding': 'gzip'})), 200).get_data(),
+        repeat
+    )
+    # Repeat views revalidate with the ETag and get a 304 without the documents being loaded
+    etag = expect(client.get('/api/documents/', headers=headers), 200).headers['ETag']
+    results['documents.list.not_modified'] = measure(
+        lambda: expect(client.get('/api/documents/', headers=dict(headers, **{'If-None-Match': etag})), 304), repeat
+    )
+    viewed = f'/api/documents/{document_ids[0]}'
+    results['documents.get'] = measure(lambda: expect(client.get(viewed, headers=headers), 200).get_data(), repeat * 10)
+    etag = expect(client.get(viewed, headers=headers), 200).headers['ETag']
+    results['documents.get.not_modified'] = measure(
+        lambda: expect(client.get(viewed, headers=dict(headers, **{'If-None-Match': etag})), 304), repeat * 10
+    )
+    results['documents.list_favorites'] = measure(
+        lambda: expect(client.get('/api/documents/?filterType=favorites', headers=headers), 200), repeat
+    )
+    # Dashboard: recents page and aggregate counters instead of the full library
+    results['documents.list_recent'] = measure(
+        lambda: expect(client.get('/api/documents/?sort=newest&limit=5', headers=headers), 200), repeat
+    )
+    results['documents.stats'] = measure(lambda: expect(client.get('/api/documents/stats', headers=headers), 200), repeat)
+    # Typeahead; the first call loads the owner's prefix index
+    expect(client.get('/api/documents/suggest?q=re', headers=headers), 200)
+    results['documents.suggest'] = measure(
+        lambda: expect(client.get('/api/documents/suggest?q=re', headers=headers), 200), repeat * 10
+    )
+
+    # Full-text search needs a real $text index, which mongomock does not support
+    if args.mongo == 'local':
+        db.documents.create_index([('title', 'text'), ('content', 'text'), ('tags', 'text')])
+        results['documents.search'] = measure(
+            lambda: expect(client.get('/api/documents/?query=quarterly%20revenue', headers=headers), 200), repeat
+        )
+
+    # Corpus-wide search: in-memory index at scale, then the endpoint on the seeded library
+    chunk_count = 10000 if args.quick else 100000
+    results[f'search.index.{chunk_count // 1000}k_chunks'], index = bench_search_index(chunk_count, repeat)
+    results[f'search.fuzzy_expand.{chunk_count // 1000}k_chunks'] = bench_fuzzy_expand(index, repeat)
+    results['ai.search'] = measure(
+        lambda: expect(client.post('/api/ai/search', headers=headers, json={'query': 'quarterly revenue forecast'}), 200),
+        repeat
+    )
+    results['ai.search.fuzzy'] = measure(
+        lambda: expect(client.post('/api/ai/search', headers=headers,
+                                   json={'query': 'quartrly revenu forcast', 'fuzzy': True}), 200),
+        repeat
+    )
+
+    # AI routes against the stub server
+    target = str(document_ids[0])
+    results['ai.summarize.cached'] = measure(
+        lambda: expect(client.post(f'/api/ai/summarize/{target}', headers=headers), 200), repeat * 10,
+        setup=lambda: db.documents.update_one({'_id': document_ids[0]}, {'$set': {'summary': 'cached'}})
+    )
+    results['ai.summarize.uncached'] = measure(
+        lambda: expect(client.post(f'/api/ai/summarize/{target}', headers=headers), 200), repeat,
+        setup=lambda: db.documents.update_one({'_id': document_ids[0]}, {'$set': {'summary': None}})
+    )
+    results['ai.generate_tags'] = measure(
+        lambda: expect(client.post(f'/api/ai/generate-tags/{target}', headers=headers), 200), repeat
+    )
+
+    # Non-AI latency while AI requests pile up; compare p99_ms with documents.get
+    results['burst.documents.get'] = bench_during_ai_burst(
+        app, stub, headers, target,
+        lambda: expect(client.get(viewed, headers=headers), 200).get_data(), repeat * 20
+    )
+
+
+    # Question answering should stay flat as documents grow (bounded prompt)
+    for size_name in sizes:
+        with open(corpus[('txt', size_name)], 'rb') as f:
+            uploaded = expect(client.post(
+                '/api/documents/upload',
+                headers=headers,
+                data={'document': (io.BytesIO(f.read()), f'ask-{size_name}.txt')},
+                content_type='multipart/form-data'
+            ), 201).get_json()
+        results[f'ai.ask.{size_name}'] = measure(
+            lambda: expect(client.post(f'/api/ai/ask/{uploaded["_id"]}', headers=headers,
+                                       json={'question': 'What is the quarterly revenue forecast?'}), 200),
+            repeat,
+            setup=lambda: db.answers.delete_many({})
+        )
+        # In-document find answers from the positional index, without the content
+        results[f'documents.find.{size_name}'] = measure(
+            lambda: expect(client.get(f'/api/documents/{uploaded["_id"]}/find', headers=headers,
+                                      query_string={'q': 'revenue forecast'}), 200),
+            repeat
+        )
+        results[f'documents.similar.{size_name}'] = measure(
+            lambda: expect(client.get(f'/api/documents/{uploaded["_id"]}/similar', headers=headers), 200),
+            repeat
+        )
+
+    stub.stop()
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mongo': args.mongo,
+            'documents': args.documents,
+            'llm_latency_s': args.llm_latency,
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the python_backend benchmark suite')
+    parser.add_argument('--mongo', choices=['mongomock', 'local'], default='mongomock',
+                        help='Database stand-in: mongomock (default) or a local mongod')
+    parser.add_argument('--repeat', type=int, default=10, help='Measured runs per benchmark')
+    parser.add_argument('--documents', type=int, default=500, help='Documents seeded for listing/search')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='Seconds the stub OpenAI server waits')
+    parser.add_argument('--quick', action='store_true', help='Smaller corpus and fewer runs')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<commit>.json)')
+    args = parser.parse_args()
+
+    report = run(args)
+
+    output = args.output or os.path.join(BACKEND_DIR, 'benchmarks', 'results', f'{report["meta"]["commit"]}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    width = max(len(name) for name in report['results'])
+    for name, stats in sorted(report['results'].items()):
+        throughput = f'  {stats["mb_per_s"]:8.2f} MB/s' if 'mb_per_s' in stats else ''
+        print(f'{name:<{width}}  median {stats["median_ms"]:9.2f} ms  p95 {stats["p95_ms"]:9.2f} ms  '
+              f'p99 {stats["p99_ms"]:9.2f} ms{throughput}')
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(self.server.latency)
+
+        prompt = payload.get('messages', [{}])[-1].get('content', '')
+        if 'JSON array' in prompt:
+            content = json.dumps(['benchmark', 'synthetic', 'report', 'analysis', 'data'])
+        else:
+            content = 'This is a stub summary produced by the benchmark server.'
+
+        body = json.dumps({
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'gpt-3.5-turbo'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': 20,
+                      'total_tokens': len(prompt) // 4 + 20}
+        }).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubOpenAIServer:
+    """
+    Local stand-in for the OpenAI chat completions API
+
+    Args:
+        latency (float): Seconds to wait before answering, to mimic model time
+    """
+    def __init__(self, latency=0.0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.latency = latency
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def api_base(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,333 @@
+"""
+Offline bulk import of a directory tree of documents
+
+Usage (from python_backend/):
+    python import_documents.py DIRECTORY --owner EMAIL_OR_ID [--workers N] [--batch-size N]
+                               [--tags TAGS] [--checkpoint FILE]
+
+Files are parsed in a process pool with the same parser registry as uploads,
+copied to a staging folder and written in batches with insert_many. Every
+document and its file are recorded in the checkpoint file before its batch is
+moved into the upload folder and written, so an interrupted import can be run
+again with the same checkpoint: files whose documents were written in full,
+with their chunks and signature, are skipped; partly written documents and
+copied files are removed and the files imported again.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from bson import ObjectId
+from werkzeug.utils import secure_filename
+
+from models.chunk import DocumentChunk
+from models.document import Document
+from models.document_text import DocumentText
+from models.library_stats import LibraryStats
+from models.signature import DocumentSignature
+from models.user import User
+from utils.ingestion import allowed_file, hash_file, document_fields, stored_file_path
+from utils.parser_registry import select_parser, extract, UnsupportedFormatError
+
+# Files handed to the pool ahead of the writer, per worker
+PENDING_PER_WORKER = 4
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5
+
+
+def find_files(directory):
+    """
+    Walk a directory tree for files with an allowed extension, in a stable order
+
+    Returns:
+        list: Paths relative to the directory
+    """
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if allowed_file(name):
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return found
+
+
+def prepare_document(directory, relative_path, owner, tags, upload_folder, staging_folder):
+    """
+    Parse one file and build its document, chunks and signature (runs in a worker process)
+
+    The file is copied to the staging folder; the writer moves it to the document's
+    filePath in the upload folder once the document is recorded in the checkpoint.
+
+    Returns:
+        dict: 'path' plus either 'document', 'staged', 'text', 'chunks', 'signature' and 'bytes', or 'error'
+    """
+    source = os.path.join(directory, relative_path)
+    try:
+        parser, detected = select_parser(source)
+    except UnsupportedFormatError as e:
+        return {'path': relative_path, 'error': str(e)}
+
+    filename = secure_filename(os.path.basename(relative_path))
+    stored_path = stored_file_path(os.path.join(upload_folder, str(uuid.uuid4())), detected)
+    file_path = os.path.join(staging_folder, os.path.basename(stored_path))
+    shutil.copyfile(source, file_path)
+    file_hash = hash_file(file_path).hexdigest()
+
+    parser_info = {'name': parser.name, 'version': parser.version, 'format': detected}
+    page_offsets = []
+    try:
+        extraction = extract(file_path, parser, detected)
+        content = extraction.text
+        page_offsets = extraction.page_offsets
+        parser_info['durationMs'] = extraction.duration_ms
+    except Exception as e:
+        content = 'Error extracting content from file.'
+        parser_info['error'] = str(e)
+
+    document = document_fields(file_path, filename, owner, None, tags, file_hash,
+                               content, page_offsets, parser_info)
+    document['_id'] = ObjectId()
+    document['filePath'] = stored_path
+    full_document = dict(document, content=content)
+    return {
+        'path': relative_path,
+        'document': document,
+        'staged': file_path,
+        'text': content if document['contentTruncated'] else None,
+        'chunks': DocumentChunk.build(full_document),
+        'signature': DocumentSignature.compute(full_document),
+        'bytes': document['fileSize']
+    }
+
+
+class Checkpoint:
+    """
+    Append-only record of (relative path, document _id, file path) for every document about to be written
+    """
+    def __init__(self, path, upload_folder):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry['path']] = (ObjectId(entry['id']), entry.get('file'))
+        # Files staged by an earlier run with this checkpoint were never recorded or moved; drop them
+        checkpoint_key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+        self.staging_folder = os.path.join(upload_folder, '.import', checkpoint_key)
+        shutil.rmtree(self.staging_folder, ignore_errors=True)
+        os.makedirs(self.staging_folder)
+        self._file = open(path, 'a')
+
+    def completed(self, db):
+        """
+        Paths whose documents were written in full by an earlier run
+
+        A document written without its chunks or signature would never be found by
+        search or near-duplicate detection, so it is deleted and its file imported
+        again; the copied files and stored texts of documents never written are removed.
+        """
+        paths = set()
+        items = list(self.entries.items())
+        for start in range(0, len(items), 1000):
+            batch = dict(items[start:start + 1000])
+            document_ids = [document_id for document_id, _ in batch.values()]
+            documents = {document['_id']: document for document in db.documents.find(
+                {'_id': {'$in': document_ids}}, {'owner': 1, 'contentLength': 1})}
+            chunked = set(db.document_chunks.distinct('document', {'document': {'$in': list(documents)}}))
+            signed = {signature['_id'] for signature in db.document_signatures.find(
+                {'_id': {'$in': list(documents)}}, {'_id': 1})}
+
+            incomplete = {}
+            removed = []
+            for path, (document_id, file_path) in batch.items():
+                document = documents.get(document_id)
+                # Documents with no text have no chunks
+                if document and document_id in signed and (document_id in chunked or not document.get('contentLength')):
+                    paths.add(path)
+                    continue
+                if document:
+                    incomplete.setdefault(document['owner'], []).append(document_id)
+                removed.append(document_id)
+                if file_path:
+                    try:
+                        os.remove(file_path)
+                    except OSError:
+                        pass
+
+            for owner, owner_ids in incomplete.items():
+                DocumentChunk.delete_for_documents(owner_ids, owner)
+                Document.delete_many({'_id': {'$in': owner_ids}})
+            if incomplete:
+                DocumentSignature.delete_for_documents([i for owner_ids in incomplete.values() for i in owner_ids])
+            if removed:
+                DocumentText.delete_for_documents(removed)
+        return paths
+
+    def record(self, prepared):
+        for item in prepared:
+            self._file.write(json.dumps({
+                'path': item['path'],
+                'id': str(item['document']['_id']),
+                'file': item['document']['filePath']
+            }) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+        shutil.rmtree(self.staging_folder, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(self.staging_folder))
+        except OSError:
+            pass  # Another import is still staging files
+
+
+class Progress:
+    def __init__(self, total):
+        self.total = total
+        self.imported = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (f'{self.imported + self.failed}/{self.total} files, {self.imported} imported, {self.failed} failed, '
+                f'{self.imported / elapsed:.1f} docs/s, {self.bytes / (1024 * 1024) / elapsed:.2f} MB/s')
+
+    def report(self, force=False):
+        now = time.perf_counter()
+        if force or now - self._reported >= PROGRESS_INTERVAL:
+            self._reported = now
+            print(self.line(), flush=True)
+
+
+def write_batch(prepared, checkpoint, progress):
+    """
+    Write a batch of parsed files: documents, then their chunks and signatures
+    """
+    checkpoint.record(prepared)
+    for item in prepared:
+        os.replace(item['staged'], item['document']['filePath'])
+    # Full texts too long to be stored inline go first, so no document is written without its text
+    DocumentText.insert_many([(item['document']['_id'], item['document']['contentHash'], item['text'])
+                              for item in prepared if item['text']])
+    inserted = {document['_id'] for document in Document.create_many([item['document'] for item in prepared])}
+
+    written = [item for item in prepared if item['document']['_id'] in inserted]
+    DocumentChunk.insert_many([chunk for item in written for chunk in item['chunks']])
+    DocumentSignature.insert_many([
+        (item['document']['_id'], item['document']['owner'], item['document']['contentHash'], item['signature'])
+        for item in written
+    ])
+
+    failed = []
+    for item in prepared:
+        if item['document']['_id'] in inserted:
+            progress.imported += 1
+            progress.bytes += item['bytes']
+        else:
+            progress.failed += 1
+            failed.append(item['document']['_id'])
+            print(f"Failed to write {item['path']}", file=sys.stderr)
+            try:
+                os.remove(item['document']['filePath'])
+            except OSError:
+                pass
+    if failed:
+        DocumentText.delete_for_documents(failed)
+
+
+def run_import(args, app):
+    directory = os.path.abspath(args.directory)
+    db = app.config['DB']
+
+    owner = User.find_by_id(args.owner) if ObjectId.is_valid(args.owner) else User.find_by_email(args.owner)
+    if not owner:
+        print(f'User not found: {args.owner}', file=sys.stderr)
+        return 1
+
+    checkpoint = Checkpoint(args.checkpoint, app.config['UPLOAD_FOLDER'])
+    completed = checkpoint.completed(db)
+    paths = [path for path in find_files(directory) if path not in completed]
+    print(f'{len(paths)} files to import ({len(completed)} already imported) with {args.workers} workers', flush=True)
+
+    progress = Progress(len(paths))
+    batch = []
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            remaining = iter(paths)
+            pending = {}
+            while True:
+                # Keep the pool busy without parsing far ahead of the writer
+                for path in remaining:
+                    future = executor.submit(prepare_document, directory, path, owner['_id'],
+                                             args.tags, app.config['UPLOAD_FOLDER'], checkpoint.staging_folder)
+                    pending[future] = path
+                    if len(pending) >= args.workers * PENDING_PER_WORKER:
+                        break
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'path': path, 'error': str(e)}
+                    if 'error' in result:
+                        progress.failed += 1
+                        print(f"Skipped {result['path']}: {result['error']}", file=sys.stderr)
+                        continue
+                    batch.append(result)
+                    if len(batch) >= args.batch_size:
+                        write_batch(batch, checkpoint, progress)
+                        batch = []
+                progress.report()
+
+        if batch:
+            write_batch(batch, checkpoint, progress)
+    finally:
+        checkpoint.close()
+
+    # Counters are rebuilt once rather than incremented per document
+    if LibraryStats.reconcile(owner['_id']) is None:
+        LibraryStats.reconcile(owner['_id'])
+
+    progress.report(force=True)
+    return 0 if not progress.failed else 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a directory tree of documents for one user')
+    parser.add_argument('directory', help='Directory to import, including subdirectories')
+    parser.add_argument('--owner', required=True, help='Email or ID of the user who will own the documents')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Parser processes')
+    parser.add_argument('--batch-size', type=int, default=200, help='Documents written per insert_many')
+    parser.add_argument('--tags', default='', help='Comma-separated tags added to every document')
+    parser.add_argument('--checkpoint', default='import-checkpoint.jsonl',
+                        help='File recording imported documents, to resume an interrupted import')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f'not a directory: {args.directory}')
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        sys.exit(run_import(args, app))
+
+
+if __name__ == '__main__':
+    main()
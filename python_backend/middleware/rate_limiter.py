@@ -0,0 +1,317 @@
+import math
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from flask import request, jsonify, current_app
+from pymongo import ReturnDocument
+
+
+class AdmissionError(Exception):
+    """
+    Raised when a request is rejected by rate limiting or load shedding
+    """
+    def __init__(self, message, retry_after, status_code=429):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        self.status_code = status_code
+
+
+def admission_error_response(error):
+    """
+    Build a JSON error response with a Retry-After header
+    """
+    response = jsonify({'message': error.message, 'retryAfter': error.retry_after})
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+class MemoryBucketStore:
+    """
+    In-process token buckets, shared by all threads of a worker
+
+    Buckets that have refilled completely hold no information and are dropped
+    by a periodic sweep, so idle users do not accumulate in memory.
+    """
+    def __init__(self, sweep_interval=60):
+        # key -> (tokens, updated, time at which the bucket is full again)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def _refilled(self, key, capacity, refill_per_second, now):
+        tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+        return min(capacity, tokens + (now - updated) * refill_per_second)
+
+    def _sweep(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        self._next_sweep = now + self.sweep_interval
+
+    def consume_all(self, checks):
+        """
+        Take one token from each bucket, or from none of them
+
+        Args:
+            checks (list): (key, capacity, refill_per_second) tuples
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until all buckets have one
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+            levels = [self._refilled(key, capacity, rate, now) for key, capacity, rate in checks]
+            wait = max([(1 - tokens) / rate for tokens, (_, _, rate) in zip(levels, checks) if tokens < 1],
+                       default=0)
+            if wait > 0:
+                return wait
+
+            for tokens, (key, capacity, rate) in zip(levels, checks):
+                self._buckets[key] = (tokens - 1, now, now + (capacity - tokens + 1) / rate)
+            return 0
+
+    def consume(self, key, capacity, refill_per_second):
+        """
+        Take one token from the bucket
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        return self.consume_all([(key, capacity, refill_per_second)])
+
+
+class MongoBucketStore:
+    """
+    Token buckets kept in MongoDB so that limits hold across worker processes
+    """
+    def __init__(self, collection_name='rate_limits'):
+        self.collection_name = collection_name
+
+    def consume(self, key, capacity, refill_per_second):
+        """
+        Atomically refill and take one token using a pipeline update
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        now = datetime.utcnow()
+        elapsed = {'$divide': [{'$subtract': [now, {'$ifNull': ['$updatedAt', now]}]}, 1000]}
+        refilled = {'$min': [capacity, {'$add': [
+            {'$ifNull': ['$tokens', capacity]},
+            {'$multiply': [elapsed, refill_per_second]}
+        ]}]}
+
+        bucket = current_app.config['DB'][self.collection_name].find_one_and_update(
+            {'_id': key},
+            [
+                {'$set': {'tokens': refilled, 'updatedAt': now}},
+                {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+                {'$set': {'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        if bucket['allowed']:
+            return 0
+        return (1 - bucket['tokens']) / refill_per_second
+
+    def refund(self, key):
+        """
+        Give back a token taken by consume
+        """
+        # The next consume caps the refilled level at the capacity
+        current_app.config['DB'][self.collection_name].update_one({'_id': key}, {'$inc': {'tokens': 1}})
+
+    def consume_all(self, checks):
+        """
+        Take one token from each bucket, or from none of them
+
+        Buckets are separate documents, so tokens already taken are given back
+        when a later bucket is empty.
+
+        Args:
+            checks (list): (key, capacity, refill_per_second) tuples
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until the empty bucket has one
+        """
+        taken = []
+        for key, capacity, refill_per_second in checks:
+            wait = self.consume(key, capacity, refill_per_second)
+            if wait > 0:
+                for taken_key in taken:
+                    self.refund(taken_key)
+                return wait
+            taken.append(key)
+        return 0
+
+
+_memory_store = MemoryBucketStore()
+_mongo_store = MongoBucketStore()
+
+
+def get_bucket_store():
+    """
+    Get the bucket store selected by the RATE_LIMIT_BACKEND setting
+    """
+    if current_app.config.get('RATE_LIMIT_BACKEND') == 'mongo':
+        return _mongo_store
+    return _memory_store
+
+
+def check_rate_limit(name, user_limit=None, route_limit=None):
+    """
+    Enforce token-bucket limits for a route, taking a token from every bucket
+    only if none of them is empty
+
+    Errors of the bucket store are logged and the request is let through,
+    so that an unavailable store does not take the AI routes down with it.
+
+    Args:
+        name (str): Bucket name for the route
+        user_limit (tuple): (requests, seconds) allowed per user
+        route_limit (tuple): (requests, seconds) allowed across all users
+
+    Raises:
+        AdmissionError: If one of the buckets is empty
+    """
+    if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+        return
+
+    checks = []
+    if user_limit:
+        requests_allowed, seconds = user_limit
+        checks.append((f'{name}:user:{request.user.get("userId")}', requests_allowed, requests_allowed / seconds))
+    if route_limit:
+        requests_allowed, seconds = route_limit
+        checks.append((f'{name}:route', requests_allowed, requests_allowed / seconds))
+
+    try:
+        wait = get_bucket_store().consume_all(checks)
+    except Exception as e:
+        print(f'Rate limiter error, request allowed: {e}')
+        return
+
+    if wait > 0:
+        raise AdmissionError('Too many requests. Please try again later.', wait)
+
+
+def rate_limit(name, user_limit=None, route_limit=None):
+    """
+    Decorator enforcing token-bucket limits for a route
+
+    Must be applied after authenticate_token so the user is known. Routes that
+    can answer from a cache call check_rate_limit before their LLM call instead.
+
+    Args:
+        name (str): Bucket name for the route
+        user_limit (tuple): (requests, seconds) allowed per user
+        route_limit (tuple): (requests, seconds) allowed across all users
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            try:
+                check_rate_limit(name, user_limit, route_limit)
+            except AdmissionError as e:
+                return admission_error_response(e)
+
+            return f(*args, **kwargs)
+
+        return decorated
+
+    return decorator
+
+
+class ConcurrencyLimiter:
+    """
+    Caps concurrent calls with a bounded wait queue and deadline-based shedding
+    """
+    def __init__(self, max_concurrency, max_queue, queue_timeout):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.avg_duration = 1.0
+        self._condition = threading.Condition()
+
+    def _estimated_wait(self):
+        return self.avg_duration * (self.waiting + 1) / self.max_concurrency
+
+    def acquire(self):
+        """
+        Wait for a free slot, shedding the call if the queue is full or the deadline passes
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        with self._condition:
+            if self.active >= self.max_concurrency and self.waiting >= self.max_queue:
+                raise AdmissionError('Server is busy. Please try again later.',
+                                     self._estimated_wait(), 503)
+
+            self.waiting += 1
+            try:
+                while self.active >= self.max_concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AdmissionError('Server is busy. Please try again later.',
+                                             self._estimated_wait(), 503)
+                    self._condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+            self.active += 1
+
+    def release(self, duration):
+        with self._condition:
+            self.active -= 1
+            # Exponentially weighted average, used for Retry-After estimates
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+            self._condition.notify()
+
+    def slot(self):
+        return _LimiterSlot(self)
+
+
+class _LimiterSlot:
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.started = None
+
+    def __enter__(self):
+        self.limiter.acquire()
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.limiter.release(time.monotonic() - self.started)
+        return False
+
+
+_llm_limiter = None
+_llm_limiter_lock = threading.Lock()
+
+
+def llm_slot():
+    """
+    Context manager holding one of the global LLM call slots
+
+    Raises:
+        AdmissionError: If no slot frees up before the queue deadline
+    """
+    global _llm_limiter
+    if _llm_limiter is None:
+        with _llm_limiter_lock:
+            if _llm_limiter is None:
+                _llm_limiter = ConcurrencyLimiter(
+                    current_app.config.get('LLM_MAX_CONCURRENCY', 4),
+                    current_app.config.get('LLM_MAX_QUEUE', 16),
+                    current_app.config.get('LLM_QUEUE_TIMEOUT', 10)
+                )
+    return _llm_limiter.slot()
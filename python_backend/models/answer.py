@@ -0,0 +1,48 @@
+from flask import current_app
+from datetime import datetime, timedelta
+from utils.metrics import timed
+
+# How long cached answers are kept
+ANSWER_TTL = timedelta(days=30)
+
+class AnswerCache:
+    _indexes_ready = False
+    
+    @staticmethod
+    def make_key(text_hash, normalized_question):
+        """
+        Build the cache key for a question about a specific document content
+        """
+        return f'{text_hash}:{normalized_question}'
+    
+    @staticmethod
+    @timed('db', 'answers.get')
+    def get(key):
+        """
+        Get a cached answer
+        """
+        return current_app.config['DB'].answers.find_one({'_id': key})
+    
+    @staticmethod
+    @timed('db', 'answers.put')
+    def put(key, answer, sources):
+        """
+        Store an answer
+        """
+        AnswerCache.ensure_indexes()
+        current_app.config['DB'].answers.replace_one(
+            {'_id': key},
+            {'answer': answer, 'sources': sources, 'createdAt': datetime.now()},
+            upsert=True
+        )
+    
+    @staticmethod
+    def ensure_indexes():
+        """
+        Expire old answers, once per process
+        """
+        if AnswerCache._indexes_ready:
+            return
+        current_app.config['DB'].answers.create_index('createdAt', name='createdAt_ttl',
+                                                      expireAfterSeconds=int(ANSWER_TTL.total_seconds()))
+        AnswerCache._indexes_ready = True
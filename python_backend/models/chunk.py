@@ -0,0 +1,109 @@
+from flask import current_app
+from bson import ObjectId
+from utils.metrics import timed
+from utils.retrieval import split_into_chunks, chunk_features, content_hash
+from utils.search_index import search_indexes
+
+class DocumentChunk:
+    _indexes_ready = False
+    
+    @staticmethod
+    def build(document):
+        """
+        Split a document into chunk records with their lexical features (no database access)
+        """
+        text = document.get('content') or ''
+        text_hash = document.get('contentHash') or content_hash(text)
+        
+        chunks = []
+        for index, (start, chunk_text) in enumerate(split_into_chunks(text)):
+            chunk = {
+                'document': document['_id'],
+                'owner': document['owner'],
+                'contentHash': text_hash,
+                'index': index,
+                'start': start,
+                'text': chunk_text
+            }
+            chunk.update(chunk_features(chunk_text))
+            chunks.append(chunk)
+        return chunks
+    
+    @staticmethod
+    @timed('db', 'document_chunks.replace_for_document')
+    def replace_for_document(document):
+        """
+        Split a document into chunks and store their lexical features,
+        replacing any chunks stored for an older version of its content
+        """
+        DocumentChunk.ensure_indexes()
+        collection = current_app.config['DB'].document_chunks
+        text_hash = document.get('contentHash') or content_hash(document.get('content') or '')
+        chunks = DocumentChunk.build(document)
+        
+        collection.delete_many({'document': document['_id']})
+        if chunks:
+            collection.insert_many(chunks, ordered=False)
+        
+        # Keep this process's search index in step
+        search_indexes.add_document(document['owner'], document['_id'], chunks, text_hash)
+        return chunks
+    
+    @staticmethod
+    @timed('db', 'document_chunks.insert_many')
+    def insert_many(chunks):
+        """
+        Store chunks of new documents in one round trip, e.g. built by a bulk import
+        """
+        DocumentChunk.ensure_indexes()
+        if chunks:
+            current_app.config['DB'].document_chunks.insert_many(chunks, ordered=False)
+    
+    @staticmethod
+    @timed('db', 'document_chunks.find_features')
+    def find_features(document_id, text_hash):
+        """
+        Get the lexical features (without text) of a document's current chunks
+        """
+        if isinstance(document_id, str):
+            document_id = ObjectId(document_id)
+        
+        return list(current_app.config['DB'].document_chunks.find(
+            {'document': document_id, 'contentHash': text_hash},
+            {'index': 1, 'terms': 1, 'length': 1}
+        ))
+    
+    @staticmethod
+    @timed('db', 'document_chunks.find_texts')
+    def find_texts(chunk_ids):
+        """
+        Get the text of selected chunks
+        """
+        return list(current_app.config['DB'].document_chunks.find(
+            {'_id': {'$in': list(chunk_ids)}},
+            {'document': 1, 'index': 1, 'start': 1, 'text': 1}
+        ))
+    
+    @staticmethod
+    @timed('db', 'document_chunks.delete_for_documents')
+    def delete_for_documents(document_ids, owner):
+        """
+        Delete the chunks of the given documents
+        """
+        document_ids = [ObjectId(i) if isinstance(i, str) else i for i in document_ids]
+        if isinstance(owner, str):
+            owner = ObjectId(owner)
+        
+        search_indexes.remove_documents(owner, document_ids)
+        return current_app.config['DB'].document_chunks.delete_many({'document': {'$in': document_ids}})
+    
+    @staticmethod
+    def ensure_indexes():
+        """
+        Create the indexes used by chunk lookups (once per process)
+        """
+        if DocumentChunk._indexes_ready:
+            return
+        current_app.config['DB'].document_chunks.create_index([('document', 1), ('contentHash', 1)])
+        current_app.config['DB'].document_chunks.create_index([('owner', 1)])
+        DocumentChunk._indexes_ready = True
@@ -1,13 +1,22 @@
 from flask import current_app
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 from datetime import datetime
+from utils.metrics import timed
+from models.tombstone import DocumentTombstone
 
 class Document:
     @staticmethod
+    @timed('db', 'documents.create')
     def create(document_data):
         """
         Create a new document in the database
         """
+        # Convert string ID to ObjectId if present
+        if 'owner' in document_data and isinstance(document_data['owner'], str):
+            document_data['owner'] = ObjectId(document_data['owner'])
+        
         # Add timestamps
         document_data['createdAt'] = datetime.now()
         document_data['updatedAt'] = datetime.now()
@@ -24,7 +33,36 @@ class Document:
         return current_app.config['DB'].documents.find_one({'_id': result.inserted_id})
     
     @staticmethod
-    def find(filters, sort_by='createdAt', sort_desc=True):
+    @timed('db', 'documents.create_many')
+    def create_many(documents):
+        """
+        Insert many new documents in one round trip, continuing past failed ones
+        
+        Returns:
+            list: The documents that were inserted
+        """
+        now = datetime.now()
+        for document_data in documents:
+            if 'owner' in document_data and isinstance(document_data['owner'], str):
+                document_data['owner'] = ObjectId(document_data['owner'])
+            document_data['createdAt'] = now
+            document_data['updatedAt'] = now
+            document_data.setdefault('isFavorite', False)
+            document_data.setdefault('summary', None)
+            document_data.setdefault('keyPoints', [])
+        
+        if not documents:
+            return []
+        try:
+            current_app.config['DB'].documents.insert_many(documents, ordered=False)
+            return documents
+        except BulkWriteError as e:
+            failed = {error['index'] for error in e.details.get('writeErrors', [])}
+            return [document for i, document in enumerate(documents) if i not in failed]
+    
+    @staticmethod
+    @timed('db', 'documents.find')
+    def find(filters, sort_by='createdAt', sort_desc=True, limit=0, skip=0, projection=None):
         """
         Find documents with filters and sorting
         """
@@ -37,11 +75,13 @@ class Document:
         
         # Find documents
         return list(current_app.config['DB'].documents.find(
-            filters
-        ).sort(sort_by, sort_direction))
+            filters,
+            projection
+        ).sort(sort_by, sort_direction).skip(skip).limit(limit))
     
     @staticmethod
-    def text_search(query, filters, sort_by='createdAt', sort_desc=True):
+    @timed('db', 'documents.text_search')
+    def text_search(query, filters, sort_by='createdAt', sort_desc=True, limit=0, skip=0, projection=None):
         """
         Perform text search on documents
         """
@@ -63,11 +103,12 @@ class Document:
         # Find documents with text search
         return list(current_app.config['DB'].documents.find(
             search_filters,
-            {'score': {'$meta': 'textScore'}}
-        ).sort([('score', {'$meta': 'textScore'}), (sort_by, sort_direction)]))
+            dict(projection or {}, score={'$meta': 'textScore'})
+        ).sort([('score', {'$meta': 'textScore'}), (sort_by, sort_direction)]).skip(skip).limit(limit))
     
     @staticmethod
-    def find_one(filters):
+    @timed('db', 'documents.find_one')
+    def find_one(filters, projection=None):
         """
         Find a single document
         """
@@ -78,9 +119,10 @@ class Document:
             filters['owner'] = ObjectId(filters['owner'])
         
         # Find document
-        return current_app.config['DB'].documents.find_one(filters)
+        return current_app.config['DB'].documents.find_one(filters, projection)
     
     @staticmethod
+    @timed('db', 'documents.update_one')
     def update_one(filters, update_data):
         """
         Update a document
@@ -101,6 +143,25 @@ class Document:
         return current_app.config['DB'].documents.find_one(filters)
     
     @staticmethod
+    @timed('db', 'documents.find_one_and_update')
+    def find_one_and_update(filters, update_data):
+        """
+        Update a document, returning it as it was before the update
+        """
+        # Convert string ID to ObjectId if present
+        if '_id' in filters and isinstance(filters['_id'], str):
+            filters['_id'] = ObjectId(filters['_id'])
+        if 'owner' in filters and isinstance(filters['owner'], str):
+            filters['owner'] = ObjectId(filters['owner'])
+        
+        return current_app.config['DB'].documents.find_one_and_update(
+            filters,
+            {'$set': update_data},
+            return_document=ReturnDocument.BEFORE
+        )
+    
+    @staticmethod
+    @timed('db', 'documents.delete_one')
     def delete_one(filters):
         """
         Delete a document
@@ -112,7 +173,68 @@ class Document:
             filters['owner'] = ObjectId(filters['owner'])
         
         # Delete document
-        return current_app.config['DB'].documents.delete_one(filters)
+        result = current_app.config['DB'].documents.delete_one(filters)
+        
+        # Let other workers see the deletion
+        if result.deleted_count and isinstance(filters.get('_id'), ObjectId):
+            DocumentTombstone.record([filters['_id']], filters.get('owner'))
+        
+        return result
+    
+    @staticmethod
+    @timed('db', 'documents.find_by_ids')
+    def find_by_ids(ids, owner, projection=None):
+        """
+        Find the documents among the given IDs that belong to an owner, in one query
+        """
+        if isinstance(owner, str):
+            owner = ObjectId(owner)
+        
+        return list(current_app.config['DB'].documents.find(
+            {'_id': {'$in': list(ids)}, 'owner': owner},
+            projection
+        ))
+    
+    @staticmethod
+    @timed('db', 'documents.bulk_write')
+    def bulk_write(operations):
+        """
+        Apply a list of write operations in one round trip
+        """
+        return current_app.config['DB'].documents.bulk_write(operations)
+    
+    @staticmethod
+    @timed('db', 'documents.delete_many')
+    def delete_many(filters, projection=None):
+        """
+        Delete all documents matching the filters
+        
+        Each document is removed with its own find_one_and_delete, so of several
+        concurrent deletes of the same document only one gets it back.
+        
+        Returns:
+            list: The documents this call deleted, with the projected fields and owner
+        """
+        if 'owner' in filters and isinstance(filters['owner'], str):
+            filters['owner'] = ObjectId(filters['owner'])
+        if projection:
+            projection = dict(projection, owner=1)
+        
+        collection = current_app.config['DB'].documents
+        deleted = []
+        for candidate in collection.find(filters, {'_id': 1}):
+            document = collection.find_one_and_delete(dict(filters, _id=candidate['_id']), projection)
+            if document:
+                deleted.append(document)
+        
+        # Let other workers see the deletions
+        by_owner = {}
+        for doc in deleted:
+            by_owner.setdefault(doc.get('owner'), []).append(doc['_id'])
+        for owner, document_ids in by_owner.items():
+            DocumentTombstone.record(document_ids, owner)
+        
+        return deleted
     
     @staticmethod
     def get_current_time():
@@ -0,0 +1,94 @@
+from flask import current_app
+from bson import ObjectId
+from utils.metrics import timed
+
+# Characters per record; at most 4 bytes each in UTF-8, well under the BSON size limit
+SEGMENT_SIZE = 1000000
+
+def _segments(document_id, text_hash, text):
+    return [{
+        'document': document_id,
+        'contentHash': text_hash,
+        'part': part,
+        'text': text[start:start + SEGMENT_SIZE]
+    } for part, start in enumerate(range(0, len(text), SEGMENT_SIZE))]
+
+class DocumentText:
+    _indexes_ready = False
+    
+    @staticmethod
+    @timed('db', 'document_texts.replace_for_document')
+    def replace_for_document(document_id, text_hash, text):
+        """
+        Store the full extracted text of a document whose inline content is truncated,
+        replacing the text of an older version of it
+        """
+        DocumentText.ensure_indexes()
+        collection = current_app.config['DB'].document_texts
+        records = _segments(document_id, text_hash, text)
+        
+        collection.delete_many({'document': document_id})
+        if records:
+            collection.insert_many(records, ordered=False)
+        return len(records)
+    
+    @staticmethod
+    @timed('db', 'document_texts.insert_many')
+    def insert_many(texts):
+        """
+        Store the full text of new documents, e.g. written by a bulk import
+        
+        Args:
+            texts (list): (document _id, contentHash, text) tuples
+        """
+        DocumentText.ensure_indexes()
+        records = [record for document_id, text_hash, text in texts
+                   for record in _segments(document_id, text_hash, text)]
+        if records:
+            current_app.config['DB'].document_texts.insert_many(records, ordered=False)
+    
+    @staticmethod
+    @timed('db', 'document_texts.iter_segments')
+    def iter_segments(document_id, text_hash):
+        """
+        Get the stored text of a document's current content, one segment at a time
+        """
+        if isinstance(document_id, str):
+            document_id = ObjectId(document_id)
+        
+        records = current_app.config['DB'].document_texts.find(
+            {'document': document_id, 'contentHash': text_hash},
+            {'text': 1}
+        ).sort('part', 1)
+        return (record['text'] for record in records)
+    
+    @staticmethod
+    def full_content(document):
+        """
+        Get the full text of a document, which is only stored inline when it is short enough
+        
+        Args:
+            document (dict): The document, with at least _id, content, contentHash and contentTruncated
+        """
+        if not document.get('contentTruncated'):
+            return document.get('content') or ''
+        return ''.join(DocumentText.iter_segments(document['_id'], document.get('contentHash')))
+    
+    @staticmethod
+    @timed('db', 'document_texts.delete_for_documents')
+    def delete_for_documents(document_ids):
+        """
+        Delete the stored text of the given documents
+        """
+        document_ids = [ObjectId(i) if isinstance(i, str) else i for i in document_ids]
+        return current_app.config['DB'].document_texts.delete_many({'document': {'$in': document_ids}})
+    
+    @staticmethod
+    def ensure_indexes():
+        """
+        Create the lookup index once per process
+        """
+        if DocumentText._indexes_ready:
+            return
+        current_app.config['DB'].document_texts.create_index([('document', 1), ('part', 1)])
+        DocumentText._indexes_ready = True
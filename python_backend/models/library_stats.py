@@ -0,0 +1,226 @@
+from flask import current_app
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
+from utils.metrics import timed
+
+# Most recent documents kept in each owner's aggregate
+RECENT_LIMIT = 20
+
+# Fields of a document that contribute to the counters
+COUNTED_FIELDS = {'fileType': 1, 'fileSize': 1, 'tags': 1, 'isFavorite': 1}
+RECENT_FIELDS = {'title': 1, 'fileType': 1, 'createdAt': 1, 'isFavorite': 1}
+
+
+def escape_key(key):
+    """
+    Make a tag or file type usable as a field name ('.' and a leading '$' are not allowed)
+    """
+    return key.replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+
+def unescape_key(key):
+    return key.replace('%24', '$').replace('%2E', '.').replace('%25', '%')
+
+
+def _recent_entry(document):
+    return {field: document.get(field) for field in ('_id', *RECENT_FIELDS)}
+
+
+def _counted_tags(document):
+    """
+    Distinct tags of a document that are counted: non-empty strings only,
+    with a tags field holding a single string counted as one tag, like $unwind does
+    """
+    tags = document.get('tags') or []
+    if not isinstance(tags, list):
+        tags = [tags]
+    return {tag for tag in tags if isinstance(tag, str) and tag}
+
+
+def _counter_changes(documents, sign, inc):
+    """
+    Add the counter contributions of documents to an $inc specification
+    """
+    for document in documents:
+        inc['documentCount'] = inc.get('documentCount', 0) + sign
+        inc['totalBytes'] = inc.get('totalBytes', 0) + sign * (document.get('fileSize') or 0)
+        if document.get('isFavorite'):
+            inc['favoriteCount'] = inc.get('favoriteCount', 0) + sign
+        file_type_key = f"fileTypes.{escape_key(document.get('fileType') or 'unknown')}"
+        inc[file_type_key] = inc.get(file_type_key, 0) + sign
+        for tag in _counted_tags(document):
+            tag_key = f'tags.{escape_key(tag)}'
+            inc[tag_key] = inc.get(tag_key, 0) + sign
+    return inc
+
+
+class LibraryStats:
+    @staticmethod
+    @timed('db', 'library_stats.find')
+    def find(owner):
+        """
+        Get the aggregate of an owner
+        """
+        if isinstance(owner, str):
+            owner = ObjectId(owner)
+        
+        return current_app.config['DB'].library_stats.find_one({'_id': owner})
+    
+    @staticmethod
+    @timed('db', 'library_stats.record_created')
+    def record_created(document):
+        """
+        Count a new document
+        """
+        LibraryStats._apply(document['owner'], [([document], 1)], {
+            '$push': {'recent': {
+                '$each': [_recent_entry(document)],
+                '$sort': {'createdAt': -1},
+                '$slice': RECENT_LIMIT
+            }}
+        })
+    
+    @staticmethod
+    @timed('db', 'library_stats.record_changed')
+    def record_changed(owner, before, after):
+        """
+        Apply the difference between documents before and after an update
+        
+        Args:
+            owner (ObjectId): Owner of the documents
+            before (list): Documents as they were, with the counted fields
+            after (list): The same documents as they are now
+        """
+        LibraryStats._apply(owner, [(before, -1), (after, 1)])
+        
+        # Keep the recent list in step with renamed or (un)favorited documents
+        collection = current_app.config['DB'].library_stats
+        previous = {document['_id']: document for document in before}
+        for document in after:
+            old = previous.get(document['_id'], {})
+            changed = {f'recent.$.{field}': document.get(field) for field in ('title', 'isFavorite')
+                       if field in document and document.get(field) != old.get(field)}
+            if changed:
+                try:
+                    collection.update_one({'_id': owner, 'recent._id': document['_id']}, {'$set': changed})
+                except Exception as e:
+                    print(f'Error updating library stats: {e}')
+    
+    @staticmethod
+    @timed('db', 'library_stats.record_deleted')
+    def record_deleted(owner, documents):
+        """
+        Stop counting deleted documents
+        """
+        LibraryStats._apply(owner, [(documents, -1)], {
+            '$pull': {'recent': {'_id': {'$in': [document['_id'] for document in documents]}}}
+        })
+    
+    @staticmethod
+    def _apply(owner, changes, extra=None):
+        # Only owners whose aggregate was built by reconcile() are maintained incrementally;
+        # changes are (documents, +1 or -1) pairs
+        try:
+            if isinstance(owner, str):
+                owner = ObjectId(owner)
+            inc = {}
+            for documents, sign in changes:
+                _counter_changes(documents, sign, inc)
+            inc = {key: value for key, value in inc.items() if value}
+            inc['version'] = 1
+            update = {'$inc': inc, '$set': {'updatedAt': datetime.now()}}
+            update.update(extra or {})
+            current_app.config['DB'].library_stats.update_one({'_id': owner}, update)
+        except Exception as e:
+            # Never fail the write being counted; reconciliation corrects the drift
+            print(f'Error updating library stats: {e}')
+    
+    @staticmethod
+    @timed('db', 'library_stats.refill_recent')
+    def refill_recent(owner):
+        """
+        Reload the recent list after deletions shortened it
+        """
+        if isinstance(owner, str):
+            owner = ObjectId(owner)
+        
+        db = current_app.config['DB']
+        recent = [_recent_entry(document) for document in db.documents.find({'owner': owner}, RECENT_FIELDS)
+                  .sort('createdAt', -1)
+                  .limit(RECENT_LIMIT)]
+        db.library_stats.update_one({'_id': owner}, {'$set': {'recent': recent}})
+        return recent
+    
+    @staticmethod
+    @timed('db', 'library_stats.reconcile')
+    def reconcile(owner):
+        """
+        Recompute an owner's aggregate from the documents collection
+        
+        Returns:
+            dict: The new aggregate, or None if it changed while being recomputed
+        """
+        if isinstance(owner, str):
+            owner = ObjectId(owner)
+        
+        db = current_app.config['DB']
+        current = db.library_stats.find_one({'_id': owner}, {'version': 1})
+        version = current.get('version', 0) if current else None
+        
+        totals = list(db.documents.aggregate([
+            {'$match': {'owner': owner}},
+            {'$group': {
+                '_id': None,
+                'documentCount': {'$sum': 1},
+                'totalBytes': {'$sum': '$fileSize'},
+                'favoriteCount': {'$sum': {'$cond': ['$isFavorite', 1, 0]}}
+            }}
+        ]))
+        file_types = db.documents.aggregate([
+            {'$match': {'owner': owner}},
+            {'$group': {'_id': '$fileType', 'count': {'$sum': 1}}}
+        ])
+        # Tags are counted as _counted_tags() counts them: once per document, non-empty strings only
+        tags = db.documents.aggregate([
+            {'$match': {'owner': owner}},
+            {'$project': {'tags': {'$cond': [{'$isArray': '$tags'}, {'$setUnion': ['$tags', []]}, '$tags']}}},
+            {'$unwind': '$tags'},
+            {'$match': {'tags': {'$type': 'string', '$ne': ''}}},
+            {'$group': {'_id': '$tags', 'count': {'$sum': 1}}}
+        ])
+        recent = db.documents.find({'owner': owner}, RECENT_FIELDS).sort('createdAt', -1).limit(RECENT_LIMIT)
+        
+        totals = totals[0] if totals else {}
+        stats = {
+            '_id': owner,
+            'documentCount': totals.get('documentCount', 0),
+            'totalBytes': totals.get('totalBytes', 0),
+            'favoriteCount': totals.get('favoriteCount', 0),
+            'fileTypes': {escape_key(entry['_id'] or 'unknown'): entry['count'] for entry in file_types},
+            'tags': {escape_key(entry['_id']): entry['count'] for entry in tags},
+            'recent': [_recent_entry(document) for document in recent],
+            'version': (version or 0) + 1,
+            'reconciledAt': datetime.now(),
+            'updatedAt': datetime.now()
+        }
+        
+        # Only replace the aggregate if no increment landed while it was recomputed
+        if version is None:
+            try:
+                db.library_stats.insert_one(stats)
+                return stats
+            except DuplicateKeyError:
+                return None
+        result = db.library_stats.replace_one({'_id': owner, 'version': version}, stats)
+        return stats if result.modified_count else None
+    
+    @staticmethod
+    @timed('db', 'library_stats.find_stale')
+    def find_stale(reconciled_before, limit):
+        """
+        Get owners whose aggregate was last reconciled before a time
+        """
+        return [stats['_id'] for stats in current_app.config['DB'].library_stats.find(
+            {'reconciledAt': {'$lt': reconciled_before}}, {'_id': 1}
+        ).sort('reconciledAt', 1).limit(limit)]
@@ -0,0 +1,161 @@
+from flask import current_app
+from bson import ObjectId
+from utils.metrics import timed
+from utils.minhash import signature, band_keys, similarity
+from utils.retrieval import content_hash
+from models.document_text import DocumentText
+
+# Candidates sharing an LSH band that are compared per lookup
+MAX_SIMILAR_CANDIDATES = 500
+
+class DocumentSignature:
+    _indexes_ready = False
+    
+    @staticmethod
+    def compute(document):
+        """
+        MinHash signature of a document's content; documents whose extraction failed get none
+        """
+        if (document.get('parser') or {}).get('error'):
+            return []
+        return signature(document.get('content') or '')
+    
+    @staticmethod
+    @timed('db', 'document_signatures.store')
+    def store(document_id, owner, text_hash, values):
+        """
+        Save the signature of a document, replacing the one of an older version of it
+        """
+        DocumentSignature.ensure_indexes()
+        record = {
+            '_id': document_id,
+            'owner': owner,
+            'contentHash': text_hash,
+            'signature': values,
+            'bands': band_keys(values) if values else []
+        }
+        current_app.config['DB'].document_signatures.replace_one({'_id': document_id}, record, upsert=True)
+        return record
+    
+    @staticmethod
+    @timed('db', 'document_signatures.insert_many')
+    def insert_many(documents):
+        """
+        Save the signatures of new documents in one round trip
+        
+        Args:
+            documents (list): (document _id, owner, contentHash, signature) tuples
+        """
+        DocumentSignature.ensure_indexes()
+        records = [{
+            '_id': document_id,
+            'owner': owner,
+            'contentHash': text_hash,
+            'signature': values,
+            'bands': band_keys(values) if values else []
+        } for document_id, owner, text_hash, values in documents]
+        if records:
+            current_app.config['DB'].document_signatures.insert_many(records, ordered=False)
+    
+    @staticmethod
+    def replace_for_document(document):
+        """
+        Compute and save the signature of a document's current content
+        """
+        text_hash = document.get('contentHash') or content_hash(document.get('content') or '')
+        return DocumentSignature.store(document['_id'], document['owner'], text_hash,
+                                       DocumentSignature.compute(document))
+    
+    @staticmethod
+    def find_or_build(document):
+        """
+        Get the signature of a document, computing it for documents uploaded
+        before signatures existed or whose content changed
+        
+        Args:
+            document (dict): The document, with at least _id, owner and contentHash
+        """
+        text_hash = document.get('contentHash')
+        record = DocumentSignature.find(document['_id'], text_hash) if text_hash else None
+        if record is None:
+            documents = current_app.config['DB'].documents
+            full = documents.find_one({'_id': document['_id']},
+                                      {'content': 1, 'contentHash': 1, 'contentTruncated': 1, 'owner': 1, 'parser': 1})
+            full['content'] = DocumentText.full_content(full)
+            if not full.get('contentHash'):
+                full['contentHash'] = content_hash(full.get('content') or '')
+                documents.update_one({'_id': full['_id']}, {'$set': {'contentHash': full['contentHash']}})
+            record = DocumentSignature.replace_for_document(full)
+        return record
+    
+    @staticmethod
+    @timed('db', 'document_signatures.find')
+    def find(document_id, text_hash):
+        """
+        Get the signature of a document's current content
+        """
+        if isinstance(document_id, str):
+            document_id = ObjectId(document_id)
+        
+        return current_app.config['DB'].document_signatures.find_one(
+            {'_id': document_id, 'contentHash': text_hash}
+        )
+    
+    @staticmethod
+    @timed('db', 'document_signatures.find_similar')
+    def find_similar(owner, values, threshold, limit, exclude=None):
+        """
+        Find an owner's documents whose content is similar to a signature
+        
+        Only documents sharing at least one LSH band are compared, through the
+        multikey index on bands, so the cost depends on the number of
+        candidates rather than on the size of the library.
+        
+        Args:
+            owner (ObjectId): Owner of the documents
+            values (list): MinHash signature
+            threshold (float): Minimum estimated Jaccard similarity
+            limit (int): Maximum number of documents returned
+            exclude (ObjectId): Document left out, usually the one the signature belongs to
+        
+        Returns:
+            list: (similarity, document _id), most similar first
+        """
+        if not values:
+            return []
+        if isinstance(owner, str):
+            owner = ObjectId(owner)
+        
+        filters = {'owner': owner, 'bands': {'$in': band_keys(values)}}
+        if exclude is not None:
+            filters['_id'] = {'$ne': exclude}
+        candidates = current_app.config['DB'].document_signatures.find(
+            filters, {'signature': 1}
+        ).limit(MAX_SIMILAR_CANDIDATES)
+        
+        matches = []
+        for candidate in candidates:
+            score = similarity(values, candidate['signature'])
+            if score >= threshold:
+                matches.append((score, candidate['_id']))
+        matches.sort(key=lambda match: -match[0])
+        return matches[:limit]
+    
+    @staticmethod
+    @timed('db', 'document_signatures.delete_for_documents')
+    def delete_for_documents(document_ids):
+        """
+        Delete the signatures of the given documents
+        """
+        document_ids = [ObjectId(i) if isinstance(i, str) else i for i in document_ids]
+        return current_app.config['DB'].document_signatures.delete_many({'_id': {'$in': document_ids}})
+    
+    @staticmethod
+    def ensure_indexes():
+        """
+        Create the band lookup index once per process
+        """
+        if DocumentSignature._indexes_ready:
+            return
+        current_app.config['DB'].document_signatures.create_index([('owner', 1), ('bands', 1)])
+        DocumentSignature._indexes_ready = True
@@ -0,0 +1,95 @@
+from flask import current_app
+from bson import ObjectId
+from utils.metrics import timed
+from utils.retrieval import term_positions, content_hash
+
+# Positions per record; very frequent terms of huge documents are split to stay under the BSON size limit
+MAX_POSITIONS_PER_RECORD = 50000
+
+class TermPositions:
+    _indexes_ready = False
+    
+    @staticmethod
+    @timed('db', 'document_term_positions.replace_for_document')
+    def replace_for_document(document):
+        """
+        Build the positional index of a document's content, replacing any
+        index built for an older version of it
+        """
+        TermPositions.ensure_indexes()
+        collection = current_app.config['DB'].document_term_positions
+        text = document.get('content') or ''
+        text_hash = document.get('contentHash') or content_hash(text)
+        
+        records = []
+        for term, (positions, offsets) in term_positions(text).items():
+            for part, start in enumerate(range(0, len(positions), MAX_POSITIONS_PER_RECORD)):
+                records.append({
+                    'document': document['_id'],
+                    'contentHash': text_hash,
+                    'term': term,
+                    'part': part,
+                    'positions': positions[start:start + MAX_POSITIONS_PER_RECORD],
+                    'offsets': offsets[start:start + MAX_POSITIONS_PER_RECORD]
+                })
+        
+        collection.delete_many({'document': document['_id']})
+        if records:
+            collection.insert_many(records, ordered=False)
+        return len(records)
+    
+    @staticmethod
+    @timed('db', 'document_term_positions.find')
+    def find(document_id, text_hash, terms):
+        """
+        Get the positions of the given terms in a document's current content
+        
+        Returns:
+            dict: term -> (token positions, character offsets)
+        """
+        if isinstance(document_id, str):
+            document_id = ObjectId(document_id)
+        
+        records = current_app.config['DB'].document_term_positions.find(
+            {'document': document_id, 'contentHash': text_hash, 'term': {'$in': list(set(terms))}},
+            {'term': 1, 'part': 1, 'positions': 1, 'offsets': 1}
+        ).sort([('term', 1), ('part', 1)])
+        
+        postings = {}
+        for record in records:
+            positions, offsets = postings.setdefault(record['term'], ([], []))
+            positions.extend(record['positions'])
+            offsets.extend(record['offsets'])
+        return postings
+    
+    @staticmethod
+    @timed('db', 'document_term_positions.exists')
+    def exists(document_id, text_hash):
+        """
+        Check whether a document's current content has been indexed
+        """
+        return current_app.config['DB'].document_term_positions.find_one(
+            {'document': document_id, 'contentHash': text_hash},
+            {'_id': 1}
+        ) is not None
+    
+    @staticmethod
+    @timed('db', 'document_term_positions.delete_for_documents')
+    def delete_for_documents(document_ids):
+        """
+        Delete the positional index of the given documents
+        """
+        document_ids = [ObjectId(i) if isinstance(i, str) else i for i in document_ids]
+        return current_app.config['DB'].document_term_positions.delete_many({'document': {'$in': document_ids}})
+    
+    @staticmethod
+    def ensure_indexes():
+        """
+        Create the lookup index once per process
+        """
+        if TermPositions._indexes_ready:
+            return
+        current_app.config['DB'].document_term_positions.create_index(
+            [('document', 1), ('term', 1), ('part', 1)]
+        )
+        TermPositions._indexes_ready = True
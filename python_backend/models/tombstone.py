@@ -0,0 +1,55 @@
+from flask import current_app
+from bson import ObjectId
+from datetime import datetime, timedelta
+from utils.metrics import timed
+
+# How long deletions stay visible to polling workers
+TOMBSTONE_TTL = timedelta(days=7)
+
+class DocumentTombstone:
+    _indexes_ready = False
+    
+    @staticmethod
+    @timed('db', 'document_tombstones.record')
+    def record(document_ids, owner):
+        """
+        Record deleted documents so workers without change streams can see the deletions
+        """
+        DocumentTombstone.ensure_indexes()
+        if isinstance(owner, str):
+            owner = ObjectId(owner)
+        
+        now = datetime.now()
+        tombstones = [{'document': document_id, 'owner': owner, 'deletedAt': now} for document_id in document_ids]
+        if tombstones:
+            current_app.config['DB'].document_tombstones.insert_many(tombstones, ordered=False)
+    
+    @staticmethod
+    @timed('db', 'document_tombstones.find_after')
+    def find_after(deleted_at, tombstone_id, limit):
+        """
+        Get tombstones recorded after a position, oldest first
+        """
+        filters = {'deletedAt': {'$gt': deleted_at}}
+        if tombstone_id is not None:
+            filters = {'$or': [
+                {'deletedAt': {'$gt': deleted_at}},
+                {'deletedAt': deleted_at, '_id': {'$gt': tombstone_id}}
+            ]}
+        
+        return list(current_app.config['DB'].document_tombstones.find(filters)
+                    .sort([('deletedAt', 1), ('_id', 1)])
+                    .limit(limit))
+    
+    @staticmethod
+    def ensure_indexes():
+        """
+        Create the polling index and expire old tombstones, once per process
+        """
+        if DocumentTombstone._indexes_ready:
+            return
+        collection = current_app.config['DB'].document_tombstones
+        collection.create_index([('deletedAt', 1), ('_id', 1)])
+        collection.create_index('deletedAt', name='deletedAt_ttl',
+                                expireAfterSeconds=int(TOMBSTONE_TTL.total_seconds()))
+        DocumentTombstone._indexes_ready = True
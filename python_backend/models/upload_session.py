@@ -0,0 +1,119 @@
+from flask import current_app
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from utils.metrics import timed
+
+class UploadSession:
+    @staticmethod
+    @timed('db', 'upload_sessions.create')
+    def create(session_data, ttl_hours=24):
+        """
+        Create a new resumable upload session
+        """
+        session_data['offset'] = 0
+        session_data['segments'] = []
+        session_data['pending'] = []
+        session_data['completing'] = False
+        session_data['createdAt'] = datetime.now()
+        session_data['expiresAt'] = datetime.now() + timedelta(hours=ttl_hours)
+        
+        current_app.config['DB'].upload_sessions.insert_one(session_data)
+        return session_data
+    
+    @staticmethod
+    @timed('db', 'upload_sessions.find_one')
+    def find_one(upload_id, owner):
+        """
+        Find an unexpired upload session of a user
+        """
+        return current_app.config['DB'].upload_sessions.find_one({
+            '_id': upload_id,
+            'owner': owner,
+            'expiresAt': {'$gt': datetime.now()}
+        })
+    
+    @staticmethod
+    @timed('db', 'upload_sessions.advance')
+    def advance(upload_id, expected_offset, new_offset, segment_path, digest):
+        """
+        Move the committed offset forward and record the new segment with its SHA-256,
+        only if nobody else moved it first
+        
+        The segment stays pending until its bytes are written into the upload's data file.
+        
+        Returns:
+            bool: True if the offset was updated
+        """
+        result = current_app.config['DB'].upload_sessions.update_one(
+            {'_id': upload_id, 'offset': expected_offset, 'completing': {'$ne': True}},
+            {
+                '$set': {'offset': new_offset, 'updatedAt': datetime.now()},
+                '$push': {
+                    'segments': {'offset': expected_offset, 'length': new_offset - expected_offset, 'sha256': digest},
+                    'pending': {'offset': expected_offset, 'path': segment_path}
+                }
+            }
+        )
+        return result.modified_count == 1
+    
+    @staticmethod
+    @timed('db', 'upload_sessions.mark_placed')
+    def mark_placed(upload_id, offset):
+        """
+        Record that the segment at an offset was written into the upload's data file
+        """
+        current_app.config['DB'].upload_sessions.update_one(
+            {'_id': upload_id},
+            {'$pull': {'pending': {'offset': offset}}}
+        )
+    
+    @staticmethod
+    @timed('db', 'upload_sessions.find_pending')
+    def find_pending(upload_id):
+        """
+        Get the segments of a session not yet written into its data file
+        """
+        session = current_app.config['DB'].upload_sessions.find_one({'_id': upload_id}, {'pending': 1})
+        return session.get('pending', []) if session else []
+    
+    @staticmethod
+    @timed('db', 'upload_sessions.claim_completion')
+    def claim_completion(upload_id, size):
+        """
+        Mark a fully uploaded session as being completed, so that only one request creates its document
+        
+        Returns:
+            dict: The session, or None if it is incomplete or already being completed
+        """
+        return current_app.config['DB'].upload_sessions.find_one_and_update(
+            {'_id': upload_id, 'offset': size, 'completing': {'$ne': True}},
+            {'$set': {'completing': True, 'updatedAt': datetime.now()}},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    @staticmethod
+    @timed('db', 'upload_sessions.release_completion')
+    def release_completion(upload_id):
+        """
+        Let a session be completed again after a failed attempt
+        """
+        current_app.config['DB'].upload_sessions.update_one(
+            {'_id': upload_id},
+            {'$set': {'completing': False, 'updatedAt': datetime.now()}}
+        )
+    
+    @staticmethod
+    @timed('db', 'upload_sessions.delete_one')
+    def delete_one(upload_id):
+        """
+        Delete an upload session
+        """
+        return current_app.config['DB'].upload_sessions.delete_one({'_id': upload_id})
+    
+    @staticmethod
+    @timed('db', 'upload_sessions.find_expired')
+    def find_expired():
+        """
+        Find upload sessions past their expiry time
+        """
+        return list(current_app.config['DB'].upload_sessions.find({'expiresAt': {'$lte': datetime.now()}}))
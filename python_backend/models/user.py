@@ -1,14 +1,17 @@
 from flask import current_app
 from bson import ObjectId
 from datetime import datetime
-import bcrypt
+from utils.metrics import timed
 
 class User:
     @staticmethod
+    @timed('db', 'users.create')
     def create(user_data):
         """
         Create a new user in the database
         """
+        import bcrypt  # Imported on first use to keep startup fast
+        
         # Hash password
         password = user_data.get('password')
         salt = bcrypt.gensalt()
@@ -30,6 +33,7 @@ class User:
         return current_app.config['DB'].users.find_one({'_id': result.inserted_id})
     
     @staticmethod
+    @timed('db', 'users.find_by_email')
     def find_by_email(email):
         """
         Find a user by email
@@ -37,6 +41,7 @@ class User:
         return current_app.config['DB'].users.find_one({'email': email})
     
     @staticmethod
+    @timed('db', 'users.find_by_id')
     def find_by_id(user_id):
         """
         Find a user by ID
@@ -47,6 +52,7 @@ class User:
         return current_app.config['DB'].users.find_one({'_id': user_id})
     
     @staticmethod
+    @timed('db', 'users.find_all')
     def find_all():
         """
         Find all users
@@ -54,6 +60,7 @@ class User:
         return list(current_app.config['DB'].users.find({}))
     
     @staticmethod
+    @timed('db', 'users.update_one')
     def update_one(filters, update_data):
         """
         Update a user
@@ -72,6 +79,7 @@ class User:
         return current_app.config['DB'].users.find_one(filters)
     
     @staticmethod
+    @timed('db', 'users.delete_one')
     def delete_one(filters):
         """
         Delete a user
@@ -84,10 +92,13 @@ class User:
         return current_app.config['DB'].users.delete_one(filters)
     
     @staticmethod
+    @timed('auth', 'bcrypt.checkpw')
     def compare_password(hashed_password, candidate_password):
         """
         Compare password with hashed password
         """
+        import bcrypt
+        
         return bcrypt.checkpw(
             candidate_password.encode('utf-8'),
             hashed_password.encode('utf-8')
@@ -1,12 +1,63 @@
 from flask import Blueprint, request, jsonify, current_app
-import openai
+import re
+import json
 from models.document import Document
+from models.chunk import DocumentChunk
+from models.answer import AnswerCache
+from models.library_stats import LibraryStats
+from models.signature import DocumentSignature
+from models.document_text import DocumentText
 from middleware.auth_middleware import authenticate_token
+from middleware.rate_limiter import (rate_limit, check_rate_limit, llm_slot, AdmissionError,
+                                     admission_error_response)
+from utils.single_flight import coalesce
+from utils.metrics import span
+from utils.llm import chat_completion
+from utils.retrieval import (tokenize, content_hash, normalize_question, bm25_scores,
+                             select_within_budget)
+from utils.search_index import search_indexes
+from utils.change_feed import publish_document
+from bson import ObjectId
 
 ai_bp = Blueprint('ai', __name__)
 
-# Initialize OpenAI client
-openai.api_key = current_app.config.get('OPENAI_API_KEY')
+# Score weight of a fuzzy expansion per edit away from the query term
+FUZZY_DISTANCE_DISCOUNT = 0.7
+
+# Helper function returning a stored AI result, polled by requests waiting on another worker
+def stored_result(document_id, field, since=None):
+    document = Document.find_one({'_id': document_id})
+    if not document or not document.get(field):
+        return None
+    if since and (not document.get(f'{field}GeneratedAt') or document[f'{field}GeneratedAt'] < since):
+        return None
+    return document[field]
+
+
+# Helper function copying an AI result from a near-identical document of the same owner, if any
+def reuse_similar_result(document, field):
+    threshold = current_app.config.get('AI_REUSE_SIMILARITY', 0.9)
+    if not threshold or not (request.get_json(silent=True) or {}).get('reuseSimilar', True):
+        return None, None
+    
+    with span('dedup', 'find_similar'):
+        record = DocumentSignature.find_or_build(document)
+        matches = DocumentSignature.find_similar(document['owner'], record['signature'], threshold, 5,
+                                                 exclude=document['_id'])
+    if not matches:
+        return None, None
+    
+    sources = {source['_id']: source for source in Document.find_by_ids(
+        [match_id for _, match_id in matches], document['owner'], {field: 1}
+    )}
+    for _, match_id in matches:
+        value = sources.get(match_id, {}).get(field)
+        if value:
+            Document.update_one({'_id': document['_id']}, {field: value, f'{field}ReusedFrom': str(match_id),
+                                                            'updatedAt': Document.get_current_time()})
+            return value, str(match_id)
+    return None, None
+
 
 @ai_bp.route('/summarize/<document_id>', methods=['POST'])
 @authenticate_token
@@ -25,28 +76,50 @@ def summarize_document(document_id):
         if document.get('summary'):
             return jsonify({'summary': document['summary']})
         
-        # Generate summary using OpenAI
-        content = document['content'][:10000]  # Limit content length for API
+        # Near-identical versions of a document share one summary
+        summary, reused_from = reuse_similar_result(document, 'summary')
+        if summary:
+            return jsonify({'summary': summary, 'reusedFrom': reused_from})
         
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that summarizes documents."},
-                {"role": "user", "content": f"Please provide a concise summary of the following document: {content}"}
-            ],
-            max_tokens=500
-        )
+        # Only requests that reach OpenAI count against the limits
+        check_rate_limit('ai:summarize', user_limit=(10, 60), route_limit=(120, 60))
         
-        summary = response.choices[0].message.content.strip()
+        def generate_summary():
+            # Generate summary using OpenAI
+            content = document['content'][:10000]  # Limit content length for API
+            
+            with llm_slot(), span('llm', 'summarize'):
+                response = chat_completion(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant that summarizes documents."},
+                        {"role": "user", "content": f"Please provide a concise summary of the following document: {content}"}
+                    ],
+                    max_tokens=500
+                )
+            
+            summary = response.choices[0].message.content.strip()
+            
+            # Update document with summary
+            Document.update_one(
+                {'_id': document_id},
+                {'summary': summary, 'updatedAt': Document.get_current_time()}
+            )
+            
+            return summary
         
-        # Update document with summary
-        Document.update_one(
-            {'_id': document_id},
-            {'summary': summary}
+        # Concurrent requests for the same document share one OpenAI call
+        summary = coalesce(
+            (document_id, 'summarize'),
+            generate_summary,
+            check=lambda: stored_result(document_id, 'summary')
         )
         
         return jsonify({'summary': summary})
     
+    except AdmissionError as e:
+        return admission_error_response(e)
+    
     except Exception as e:
         print(f'Summarize document error: {e}')
         return jsonify({'message': 'Server error while summarizing document'}), 500
@@ -69,47 +142,66 @@ def extract_key_points(document_id):
         if document.get('keyPoints') and len(document['keyPoints']) > 0:
             return jsonify({'keyPoints': document['keyPoints']})
         
-        # Extract key points using OpenAI
-        content = document['content'][:10000]  # Limit content length for API
+        # Near-identical versions of a document share one set of key points
+        key_points, reused_from = reuse_similar_result(document, 'keyPoints')
+        if key_points:
+            return jsonify({'keyPoints': key_points, 'reusedFrom': reused_from})
         
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that extracts key points from documents."},
-                {"role": "user", "content": f"Please extract 5-10 key points from the following document and format them as a JSON array of strings: {content}"}
-            ],
-            max_tokens=1000
-        )
-        
-        response_text = response.choices[0].message.content.strip()
+        # Only requests that reach OpenAI count against the limits
+        check_rate_limit('ai:extract-key-points', user_limit=(10, 60), route_limit=(120, 60))
         
-        # Parse key points from response
-        import re
-        import json
+        def extract():
+            # Extract key points using OpenAI
+            content = document['content'][:10000]  # Limit content length for API
+            
+            with llm_slot(), span('llm', 'extract_key_points'):
+                response = chat_completion(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant that extracts key points from documents."},
+                        {"role": "user", "content": f"Please extract 5-10 key points from the following document and format them as a JSON array of strings: {content}"}
+                    ],
+                    max_tokens=1000
+                )
+            
+            response_text = response.choices[0].message.content.strip()
+            
+            # Parse key points from response
+            key_points = []
+            try:
+                # Try to extract JSON array from response
+                json_match = re.search(r'\[([^\]]*)\]', response_text)
+                if json_match:
+                    key_points = json.loads(json_match.group(0))
+                else:
+                    # Fallback: split by newlines and clean up
+                    key_points = [line.replace(r'^\d+\.\s*|^-\s*|^\*\s*', '', 1).strip()
+                                  for line in response_text.split('\n')
+                                  if line.strip()]
+            except Exception as e:
+                print(f'Error parsing key points: {e}')
+                key_points = [response_text]
+            
+            # Update document with key points
+            Document.update_one(
+                {'_id': document_id},
+                {'keyPoints': key_points, 'updatedAt': Document.get_current_time()}
+            )
+            
+            return key_points
         
-        key_points = []
-        try:
-            # Try to extract JSON array from response
-            json_match = re.search(r'\[([^\]]*)\]', response_text)
-            if json_match:
-                key_points = json.loads(json_match.group(0))
-            else:
-                # Fallback: split by newlines and clean up
-                key_points = [line.replace(r'^\d+\.\s*|^-\s*|^\*\s*', '', 1).strip()
-                              for line in response_text.split('\n')
-                              if line.strip()]
-        except Exception as e:
-            print(f'Error parsing key points: {e}')
-            key_points = [response_text]
-        
-        # Update document with key points
-        Document.update_one(
-            {'_id': document_id},
-            {'keyPoints': key_points}
+        # Concurrent requests for the same document share one OpenAI call
+        key_points = coalesce(
+            (document_id, 'extract-key-points'),
+            extract,
+            check=lambda: stored_result(document_id, 'keyPoints')
         )
         
         return jsonify({'keyPoints': key_points})
     
+    except AdmissionError as e:
+        return admission_error_response(e)
+    
     except Exception as e:
         print(f'Extract key points error: {e}')
         return jsonify({'message': 'Server error while extracting key points'}), 500
@@ -117,6 +209,7 @@ def extract_key_points(document_id):
 
 @ai_bp.route('/generate-tags/<document_id>', methods=['POST'])
 @authenticate_token
+@rate_limit('ai:generate-tags', user_limit=(5, 60), route_limit=(60, 60))
 def generate_tags(document_id):
     try:
         # Find document
@@ -128,45 +221,312 @@ def generate_tags(document_id):
         if not document:
             return jsonify({'message': 'Document not found'}), 404
         
-        # Generate tags using OpenAI
-        content = document['content'][:10000]  # Limit content length for API
+        def generate():
+            # Generate tags using OpenAI
+            content = document['content'][:10000]  # Limit content length for API
+            
+            with llm_slot(), span('llm', 'generate_tags'):
+                response = chat_completion(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant that generates relevant tags for documents."},
+                        {"role": "user", "content": f"Please generate 5-10 relevant tags for the following document. Return only a JSON array of tag strings without any explanation: {content}"}
+                    ],
+                    max_tokens=500
+                )
+            
+            response_text = response.choices[0].message.content.strip()
+            
+            # Parse tags from response
+            tags = []
+            try:
+                # Try to extract JSON array from response
+                json_match = re.search(r'\[([^\]]*)\]', response_text)
+                if json_match:
+                    tags = json.loads(json_match.group(0))
+                else:
+                    # Fallback: split by commas or newlines
+                    tags = [tag.strip() for tag in re.split(r'[,\n]', response_text) if tag.strip()]
+            except Exception as e:
+                print(f'Error parsing tags: {e}')
+                tags = []
+            
+            # Update document with tags
+            update_data = {'tags': tags, 'tagsGeneratedAt': Document.get_current_time(),
+                           'updatedAt': Document.get_current_time()}
+            previous = Document.find_one_and_update({'_id': document_id}, update_data)
+            if previous:
+                updated = dict(previous, **update_data)
+                LibraryStats.record_changed(updated['owner'], [previous], [updated])
+                publish_document(updated)
+            
+            return tags
+        
+        # Concurrent requests for the same document share one OpenAI call
+        requested_at = Document.get_current_time()
+        tags = coalesce(
+            (document_id, 'generate-tags'),
+            generate,
+            check=lambda: stored_result(document_id, 'tags', since=requested_at)
+        )
+        
+        return jsonify({'tags': tags})
+    
+    except AdmissionError as e:
+        return admission_error_response(e)
+    
+    except Exception as e:
+        print(f'Generate tags error: {e}')
+        return jsonify({'message': 'Server error while generating tags'}), 500
+
+
+# Helper function returning a cached answer in the response format
+def cached_answer(cache_key):
+    cached = AnswerCache.get(cache_key)
+    if not cached:
+        return None
+    return {'answer': cached['answer'], 'sources': cached['sources']}
+
+
+@ai_bp.route('/ask/<document_id>', methods=['POST'])
+@authenticate_token
+def ask_question(document_id):
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Request body must be a JSON object'}), 400
+        question = (data.get('question') or '').strip()
+        
+        if not question:
+            return jsonify({'message': 'Question is required'}), 400
+        if len(question) > 1000:
+            return jsonify({'message': 'Question is too long'}), 400
         
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates relevant tags for documents."},
-                {"role": "user", "content": f"Please generate 5-10 relevant tags for the following document. Return only a JSON array of tag strings without any explanation: {content}"}
-            ],
-            max_tokens=500
+        # Find document without loading its content
+        document = Document.find_one(
+            {'_id': document_id, 'owner': request.user.get('userId')},
+            {'content': 0}
         )
         
-        response_text = response.choices[0].message.content.strip()
+        if not document:
+            return jsonify({'message': 'Document not found'}), 404
         
-        # Parse tags from response
-        import re
-        import json
+        # Documents uploaded before chunking was added have no content hash yet
+        text_hash = document.get('contentHash')
+        if not text_hash:
+            full_document = Document.find_one({'_id': document['_id']})
+            text_hash = content_hash(full_document.get('content') or '')
+            Document.update_one({'_id': document['_id']}, {'contentHash': text_hash})
         
-        tags = []
-        try:
-            # Try to extract JSON array from response
-            json_match = re.search(r'\[([^\]]*)\]', response_text)
-            if json_match:
-                tags = json.loads(json_match.group(0))
-            else:
-                # Fallback: split by commas or newlines
-                tags = [tag.strip() for tag in re.split(r'[,\n]', response_text) if tag.strip()]
-        except Exception as e:
-            print(f'Error parsing tags: {e}')
-            tags = []
+        # Answers are cached per document content and normalized question
+        normalized = normalize_question(question)
+        cache_key = AnswerCache.make_key(text_hash, normalized)
+        cached = cached_answer(cache_key)
+        if cached:
+            return jsonify(dict(cached, cached=True))
         
-        # Update document with tags
-        Document.update_one(
-            {'_id': document_id},
-            {'tags': tags}
+        # Only requests that reach OpenAI count against the limits
+        check_rate_limit('ai:ask', user_limit=(20, 60), route_limit=(240, 60))
+        
+        def answer():
+            # Load chunk features, chunking the document first if needed
+            chunks = DocumentChunk.find_features(document['_id'], text_hash)
+            if not chunks:
+                full_document = Document.find_one({'_id': document['_id']})
+                full_document['content'] = DocumentText.full_content(full_document)
+                full_document['contentHash'] = text_hash
+                chunks = DocumentChunk.replace_for_document(full_document)
+            
+            # Rank chunks and keep the best ones that fit the prompt budget
+            scores = bm25_scores(tokenize(question), chunks)
+            ranked = [chunk for score, chunk in sorted(zip(scores, chunks), key=lambda pair: -pair[0]) if score > 0]
+            if not ranked:
+                # Nothing matched lexically; fall back to the start of the document
+                ranked = sorted(chunks, key=lambda chunk: chunk['index'])
+            candidates = ranked[:current_app.config.get('ASK_TOP_K', 8)]
+            
+            texts = {chunk['_id']: chunk for chunk in DocumentChunk.find_texts(c['_id'] for c in candidates)}
+            selected = select_within_budget(
+                [texts[chunk['_id']] for chunk in candidates],
+                current_app.config.get('ASK_CONTEXT_TOKENS', 1500)
+            )
+            selected.sort(key=lambda chunk: chunk['index'])
+            context = '\n\n'.join(f'[Excerpt {i + 1}]\n{chunk["text"]}' for i, chunk in enumerate(selected))
+            
+            with llm_slot(), span('llm', 'ask'):
+                response = chat_completion(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant that answers questions about a document using only the provided excerpts. If the excerpts do not contain the answer, say so."},
+                        {"role": "user", "content": f"Excerpts from the document:\n\n{context}\n\nQuestion: {question}"}
+                    ],
+                    max_tokens=500
+                )
+            
+            answer_text = response.choices[0].message.content.strip()
+            sources = [{'index': chunk['index'], 'start': chunk['start']} for chunk in selected]
+            
+            AnswerCache.put(cache_key, answer_text, sources)
+            
+            return {'answer': answer_text, 'sources': sources}
+        
+        # Concurrent identical questions share one OpenAI call
+        result = coalesce(
+            (text_hash, 'ask', normalized),
+            answer,
+            check=lambda: cached_answer(cache_key)
         )
         
-        return jsonify({'tags': tags})
+        return jsonify(dict(result, cached=False))
+    
+    except AdmissionError as e:
+        return admission_error_response(e)
     
     except Exception as e:
-        print(f'Generate tags error: {e}')
-        return jsonify({'message': 'Server error while generating tags'}), 500
\ No newline at end of file
+        print(f'Ask question error: {e}')
+        return jsonify({'message': 'Server error while answering question'}), 500
+
+
+
+# Helper function cutting a snippet around the first query term found in a passage
+def make_snippet(text, query_terms, width=240):
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in query_terms]
+    positions = [position for position in positions if position != -1]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    snippet = text[start:start + width].strip()
+    return ('...' if start > 0 else '') + snippet + ('...' if start + width < len(text) else '')
+
+
+# Helper function running an optional LLM step over search candidates; None on timeout or overload
+def search_llm_call(name, system_prompt, user_prompt, max_tokens):
+    try:
+        with llm_slot(), span('llm', name):
+            response = chat_completion(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=max_tokens,
+                request_timeout=current_app.config.get('SEARCH_LLM_TIMEOUT', 5)
+            )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f'Search {name} skipped: {e}')
+        return None
+
+
+@ai_bp.route('/search', methods=['POST'])
+@authenticate_token
+@rate_limit('ai:search', user_limit=(60, 60))
+def search_documents():
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Request body must be a JSON object'}), 400
+        query = (data.get('query') or '').strip()
+        try:
+            limit = min(max(int(data.get('limit', 10)), 1), 50)
+        except (TypeError, ValueError):
+            return jsonify({'message': 'limit must be a number'}), 400
+        
+        if not query:
+            return jsonify({'message': 'Query is required'}), 400
+        
+        query_terms = tokenize(query)
+        if not query_terms:
+            return jsonify({'results': [], 'reranked': False, 'answer': None, 'expandedTerms': {}})
+        
+        # Rank chunks across all of the user's documents in memory
+        owner = ObjectId(request.user.get('userId'))
+        index = search_indexes.get(owner)
+        
+        # Typo tolerance: misspelled terms also match close vocabulary terms, weighted down by distance
+        expanded_terms = {}
+        term_boosts = {}
+        if data.get('fuzzy'):
+            with span('search', 'fuzzy_expand'):
+                expansions = index.expand_terms(query_terms)
+            for term, matches in expansions.items():
+                expanded_terms[term] = [match for match, _ in matches]
+                for match, distance in matches:
+                    term_boosts[match] = max(term_boosts.get(match, 0), FUZZY_DISTANCE_DISCOUNT ** distance)
+            query_terms = query_terms + [match for match in term_boosts if match not in query_terms]
+        
+        with span('search', 'bm25'):
+            hits = index.search(query_terms, limit * 5, term_boosts)
+        
+        # Group passages by document, best passage first
+        grouped = {}
+        for score, chunk_id, document_id, _, _ in hits:
+            grouped.setdefault(document_id, []).append((score, chunk_id))
+        ranked_documents = list(grouped)[:limit]
+        
+        passage_ids = [chunk_id for document_id in ranked_documents for _, chunk_id in grouped[document_id][:3]]
+        passages = {chunk['_id']: chunk for chunk in DocumentChunk.find_texts(passage_ids)}
+        documents = {document['_id']: document for document in Document.find_by_ids(
+            ranked_documents, owner, {'title': 1, 'fileType': 1, 'createdAt': 1, 'tags': 1}
+        )}
+        
+        results = []
+        for document_id in ranked_documents:
+            document = documents.get(document_id)
+            if not document:
+                continue
+            results.append({
+                'documentId': str(document_id),
+                'title': document.get('title'),
+                'fileType': document.get('fileType'),
+                'createdAt': document.get('createdAt'),
+                'tags': document.get('tags', []),
+                'score': round(grouped[document_id][0][0], 4),
+                'passages': [{
+                    'index': passages[chunk_id]['index'],
+                    'start': passages[chunk_id]['start'],
+                    'score': round(score, 4),
+                    'snippet': make_snippet(passages[chunk_id]['text'], query_terms)
+                } for score, chunk_id in grouped[document_id][:3] if chunk_id in passages]
+            })
+        
+        # Optional LLM steps, capped to a few candidates and bounded by a timeout
+        candidate_count = current_app.config.get('SEARCH_LLM_CANDIDATES', 8)
+        # Candidates keep their position in results, since results without passages are left out
+        candidates = [(position, result['passages'][0]) for position, result in enumerate(results[:candidate_count])
+                      if result['passages']]
+        numbered = '\n\n'.join(f'[{i + 1}] {results[position]["title"]}: {passage["snippet"]}'
+                                for i, (position, passage) in enumerate(candidates))
+        
+        reranked = False
+        if data.get('rerank') and len(candidates) > 1:
+            response_text = search_llm_call(
+                'search_rerank',
+                'You rank search results by relevance to a query.',
+                f'Query: {query}\n\nResults:\n{numbered}\n\nReturn only a JSON array of the result numbers, most relevant first.',
+                100
+            )
+            try:
+                order = [int(n) - 1 for n in json.loads(re.search(r'\[[^\]]*\]', response_text).group(0))]
+                order = [i for i in dict.fromkeys(order) if 0 <= i < len(candidates)]
+                order += [i for i in range(len(candidates)) if i not in order]
+                ranked_positions = [candidates[i][0] for i in order]
+                results = ([results[position] for position in ranked_positions]
+                           + [result for position, result in enumerate(results) if position not in ranked_positions])
+                reranked = True
+            except Exception:
+                pass
+        
+        answer = None
+        if data.get('synthesize') and candidates:
+            answer = search_llm_call(
+                'search_answer',
+                'You answer questions using only the provided search results, citing result numbers.',
+                f'Search results:\n{numbered}\n\nQuestion: {query}',
+                300
+            )
+        
+        return jsonify({'results': results, 'reranked': reranked, 'answer': answer, 'expandedTerms': expanded_terms})
+    
+    except Exception as e:
+        print(f'Search documents error: {e}')
+        return jsonify({'message': 'Server error while searching documents'}), 500
@@ -1,17 +1,86 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
 from werkzeug.utils import secure_filename
 from models.document import Document
+from models.chunk import DocumentChunk
+from models.term_position import TermPositions
+from models.signature import DocumentSignature
+from models.document_text import DocumentText
+from models.library_stats import LibraryStats, COUNTED_FIELDS, RECENT_LIMIT, unescape_key
 from middleware.auth_middleware import authenticate_token
-from utils.document_parser import extract_text_from_pdf, extract_text_from_docx, extract_text_from_txt
+from utils.metrics import span
+from utils.http_cache import make_etag, not_modified, json_response
+from utils.change_feed import publish_document, publish_deletions
+from utils.suggestions import suggestion_indexes
+from utils.search_index import search_indexes
+from utils.retrieval import tokenize, word_terms, find_phrase, page_number, content_hash
+from utils.ingestion import allowed_file, ingest_file
+from utils.parser_registry import UnsupportedFormatError
 
 document_bp = Blueprint('documents', __name__)
 
-# Helper function to check allowed file extensions
-def allowed_file(filename):
-    allowed_extensions = {'.pdf', '.doc', '.docx', '.txt', '.ppt', '.pptx'}
-    return os.path.splitext(filename.lower())[1] in allowed_extensions
+# Maximum number of IDs accepted by the bulk endpoints
+MAX_BULK_IDS = 1000
+
+# Maximum number of matches returned by in-document find
+MAX_FIND_MATCHES = 1000
+
+# Maximum number of typeahead suggestions
+MAX_SUGGESTIONS = 20
+
+# Maximum number of similar documents returned
+MAX_SIMILAR = 50
+
+# Fields that change whenever a document's JSON representation does, used for ETags
+VERSION_FIELDS = {'owner': 1, 'updatedAt': 1, 'contentHash': 1}
+
+# Sort options sent by the frontend, as (field, descending)
+SORT_OPTIONS = {
+    'newest': ('createdAt', True),
+    'oldest': ('createdAt', False),
+    'title': ('title', False)
+}
+
+# Helper function to parse the ID list of a bulk request
+def parse_bulk_ids(data):
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        raise ValueError('ids must be a non-empty list')
+    if len(ids) > MAX_BULK_IDS:
+        raise ValueError(f'At most {MAX_BULK_IDS} ids are allowed per request')
+    
+    object_ids = {}
+    invalid = []
+    for document_id in dict.fromkeys(str(i) for i in ids):
+        try:
+            object_ids[document_id] = ObjectId(document_id)
+        except InvalidId:
+            invalid.append(document_id)
+    return object_ids, invalid
+
+# Helper function reading an optional list of tags from a bulk request, raising ValueError if malformed
+def parse_tag_list(data, field):
+    tags = data.get(field, [])
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ValueError(f'{field} must be a list of strings')
+    return [tag.strip() for tag in tags if tag.strip()]
+
+# Helper function to remove a stored file, returning an error message on failure
+def remove_file(file_path):
+    try:
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        return None
+    except Exception as e:
+        print(f'Error deleting file: {e}')
+        return str(e)
 
 @document_bp.route('/upload', methods=['POST'])
 @authenticate_token
@@ -39,43 +108,21 @@ def upload_document():
         # Save file
         upload_folder = current_app.config['UPLOAD_FOLDER']
         file_path = os.path.join(upload_folder, unique_filename)
-        file.save(file_path)
-        
-        # Extract text based on file type
-        file_type = ext[1:].lower()  # Remove the dot
-        content = ''
+        with span('io', 'file.save'):
+            file.save(file_path)
         
+        # Extract text and create the document record
         try:
-            if file_type == 'pdf':
-                content = extract_text_from_pdf(file_path)
-            elif file_type in ['doc', 'docx']:
-                content = extract_text_from_docx(file_path)
-            elif file_type == 'txt':
-                content = extract_text_from_txt(file_path)
-            else:
-                # For other file types, just store metadata
-                content = 'Content extraction not supported for this file type.'
-        except Exception as e:
-            print(f'Error extracting content: {e}')
-            content = 'Error extracting content from file.'
-        
-        # Get form data
-        title = request.form.get('title', filename)
-        tags = request.form.get('tags', '')
-        
-        # Create document record
-        document_data = {
-            'title': title,
-            'originalFilename': filename,
-            'fileType': file_type,
-            'fileSize': os.path.getsize(file_path),
-            'filePath': file_path,
-            'content': content,
-            'owner': request.user.get('userId'),
-            'tags': [tag.strip() for tag in tags.split(',')] if tags else []
-        }
-        
-        document = Document.create(document_data)
+            document = ingest_file(
+                file_path,
+                filename,
+                request.user.get('userId'),
+                title=request.form.get('title', filename),
+                tags=request.form.get('tags', '')
+            )
+        except UnsupportedFormatError as e:
+            remove_file(file_path)
+            return jsonify({'message': str(e)}), 415
         
         # Convert ObjectId to string for JSON serialization
         document['_id'] = str(document['_id'])
@@ -88,6 +135,14 @@ def upload_document():
         return jsonify({'message': 'Server error during document upload'}), 500
 
 
+# Helper function appending fuzzy expansions of misspelled terms to a $text query
+def expand_query(query, owner):
+    with span('search', 'fuzzy_expand'):
+        expansions = search_indexes.get(owner).expand_terms(tokenize(query))
+    expanded = [term for matches in expansions.values() for term, _ in matches]
+    return ' '.join([query] + expanded) if expanded else query
+
+
 # Get all documents for current user
 @document_bp.route('/', methods=['GET'])
 @authenticate_token
@@ -99,54 +154,288 @@ def get_documents():
         sort_order = request.args.get('sortOrder', 'desc')
         filter_type = request.args.get('filterType', 'all')
         
+        # Shorthand parameters used by the dashboard: sort=newest|oldest|title, favorite, type, limit, page
+        sort_desc = sort_order == 'desc'
+        if request.args.get('sort') in SORT_OPTIONS:
+            sort_by, sort_desc = SORT_OPTIONS[request.args['sort']]
+        try:
+            limit = max(int(request.args.get('limit', 0)), 0)
+            page = max(int(request.args.get('page', 1)), 1)
+        except ValueError:
+            return jsonify({'message': 'limit and page must be numbers'}), 400
+        skip = (page - 1) * limit
+        
         # Build query
         filters = {'owner': request.user.get('userId')}
         
         # Apply filter type
-        if filter_type == 'favorites':
+        if filter_type == 'favorites' or request.args.get('favorite') == 'true':
             filters['isFavorite'] = True
+        if request.args.get('type'):
+            filters['fileType'] = request.args['type']
+        
+        # Typo tolerance: add close vocabulary terms for query terms the library does not contain
+        if query and request.args.get('fuzzy') == 'true':
+            query = expand_query(query, ObjectId(request.user.get('userId')))
         
-        # Apply search query if provided
-        if query:
-            # Text search in MongoDB
-            documents = Document.text_search(query, filters, sort_by, sort_order == 'desc')
-        else:
+        def find_documents(projection=None):
+            # Apply search query if provided
+            if query:
+                # Text search in MongoDB
+                return Document.text_search(query, filters, sort_by, sort_desc, limit, skip, projection)
             # Regular find with filters
-            documents = Document.find(filters, sort_by, sort_order == 'desc')
+            return Document.find(filters, sort_by, sort_desc, limit, skip, projection)
+        
+        def list_etag(documents):
+            # The list's version comes from the versions of its documents
+            return make_etag(request.full_path, [(doc['_id'], doc.get('updatedAt'), doc.get('contentHash')) for doc in documents])
+        
+        # Revalidations are answered from the versions alone, fetched without the documents' content
+        if request.if_none_match:
+            cached = not_modified(list_etag(find_documents(VERSION_FIELDS)))
+            if cached:
+                return cached
+        
+        # Otherwise the list is read once and its ETag describes exactly the body sent
+        documents = find_documents()
+        etag = list_etag(documents)
         
         # Convert ObjectId to string for JSON serialization
         for doc in documents:
             doc['_id'] = str(doc['_id'])
             doc['owner'] = str(doc['owner'])
         
-        return jsonify(documents)
+        return json_response(documents, etag)
     
     except Exception as e:
         print(f'Get documents error: {e}')
         return jsonify({'message': 'Server error while fetching documents'}), 500
 
 
+# Suggest completions of titles and tags while the user types
+@document_bp.route('/suggest', methods=['GET'])
+@authenticate_token
+def suggest_documents():
+    try:
+        prefix = request.args.get('q', '')
+        try:
+            limit = min(max(int(request.args.get('limit', 8)), 1), MAX_SUGGESTIONS)
+        except ValueError:
+            return jsonify({'message': 'limit must be a number'}), 400
+        
+        if not prefix.strip():
+            return jsonify({'suggestions': []})
+        
+        index = suggestion_indexes.get(ObjectId(request.user.get('userId')))
+        with span('suggest', 'prefix'):
+            suggestions = index.suggest(prefix, limit)
+        
+        return jsonify({'suggestions': suggestions})
+    
+    except Exception as e:
+        print(f'Suggest documents error: {e}')
+        return jsonify({'message': 'Server error while fetching suggestions'}), 500
+
+
+# Get library statistics for the dashboard
+@document_bp.route('/stats', methods=['GET'])
+@authenticate_token
+def get_library_stats():
+    try:
+        owner = request.user.get('userId')
+        try:
+            recent_limit = min(max(int(request.args.get('recent', 5)), 0), RECENT_LIMIT)
+            tag_limit = max(int(request.args.get('tags', 50)), 0)
+        except ValueError:
+            return jsonify({'message': 'recent and tags must be numbers'}), 400
+        
+        # Counters are maintained on every write; build them the first time
+        stats = LibraryStats.find(owner)
+        if not stats:
+            stats = LibraryStats.reconcile(owner) or LibraryStats.find(owner)
+        
+        # Deletions shorten the stored recent list; refill it from the documents
+        recent = stats.get('recent', [])
+        if len(recent) < min(recent_limit, stats.get('documentCount', 0)):
+            recent = LibraryStats.refill_recent(owner)
+        
+        tags = sorted(((unescape_key(tag), count) for tag, count in stats.get('tags', {}).items() if count > 0),
+                      key=lambda item: (-item[1], item[0]))
+        
+        return jsonify({
+            'documentCount': stats.get('documentCount', 0),
+            'totalBytes': stats.get('totalBytes', 0),
+            'favoriteCount': stats.get('favoriteCount', 0),
+            'fileTypes': {unescape_key(file_type): count
+                          for file_type, count in stats.get('fileTypes', {}).items() if count > 0},
+            'tags': [{'tag': tag, 'count': count} for tag, count in tags[:tag_limit]],
+            'recent': [dict(entry, _id=str(entry['_id'])) for entry in recent[:recent_limit]],
+            'reconciledAt': stats.get('reconciledAt')
+        })
+    
+    except Exception as e:
+        print(f'Get library stats error: {e}')
+        return jsonify({'message': 'Server error while fetching library statistics'}), 500
+
+
 # Get document by ID
 @document_bp.route('/<document_id>', methods=['GET'])
 @authenticate_token
 def get_document(document_id):
     try:
-        document = Document.find_one({'_id': document_id, 'owner': request.user.get('userId')})
+        filters = {'_id': document_id, 'owner': request.user.get('userId')}
+        
+        # Revalidations check the version only, so unchanged documents are never loaded
+        if request.if_none_match:
+            version = Document.find_one(filters, VERSION_FIELDS)
+            if not version:
+                return jsonify({'message': 'Document not found'}), 404
+            cached = not_modified(make_etag(version['_id'], version.get('updatedAt'), version.get('contentHash')))
+            if cached:
+                return cached
         
+        document = Document.find_one(filters)
         if not document:
             return jsonify({'message': 'Document not found'}), 404
         
+        # The ETag sent describes the document in the body
+        etag = make_etag(document['_id'], document.get('updatedAt'), document.get('contentHash'))
+        
         # Convert ObjectId to string for JSON serialization
         document['_id'] = str(document['_id'])
         document['owner'] = str(document['owner'])
         
-        return jsonify(document)
+        return json_response(document, etag)
     
     except Exception as e:
         print(f'Get document error: {e}')
         return jsonify({'message': 'Server error while fetching document'}), 500
 
 
+# Get the full extracted text of a document, streamed when it is too long to be stored inline
+@document_bp.route('/<document_id>/text', methods=['GET'])
+@authenticate_token
+def get_document_text(document_id):
+    try:
+        document = Document.find_one(
+            {'_id': document_id, 'owner': request.user.get('userId')},
+            {'content': 1, 'contentHash': 1, 'contentTruncated': 1}
+        )
+        
+        if not document:
+            return jsonify({'message': 'Document not found'}), 404
+        
+        if not document.get('contentTruncated'):
+            return Response(document.get('content') or '', mimetype='text/plain')
+        
+        segments = DocumentText.iter_segments(document['_id'], document['contentHash'])
+        return Response(stream_with_context(segments), mimetype='text/plain')
+    
+    except Exception as e:
+        print(f'Get document text error: {e}')
+        return jsonify({'message': 'Server error while fetching document text'}), 500
+
+
+# Find a word or phrase inside a document without sending its content
+@document_bp.route('/<document_id>/find', methods=['GET'])
+@authenticate_token
+def find_in_document(document_id):
+    try:
+        terms = word_terms(request.args.get('q', ''))
+        if not terms:
+            return jsonify({'message': 'q is required'}), 400
+        
+        try:
+            limit = min(max(int(request.args.get('limit', 200)), 1), MAX_FIND_MATCHES)
+        except ValueError:
+            return jsonify({'message': 'limit must be a number'}), 400
+        
+        document = Document.find_one(
+            {'_id': document_id, 'owner': request.user.get('userId')},
+            {'contentHash': 1, 'pageOffsets': 1}
+        )
+        
+        if not document:
+            return jsonify({'message': 'Document not found'}), 404
+        
+        text_hash = document.get('contentHash')
+        postings = TermPositions.find(document['_id'], text_hash, terms) if text_hash else {}
+        
+        # Index documents uploaded before positions existed, or whose indexing failed
+        if not postings and not (text_hash and TermPositions.exists(document['_id'], text_hash)):
+            full = Document.find_one({'_id': document['_id']}, {'content': 1, 'contentHash': 1, 'contentTruncated': 1})
+            text = DocumentText.full_content(full)
+            if not text_hash:
+                text_hash = content_hash(text)
+                Document.update_one({'_id': document['_id']}, {'contentHash': text_hash})
+            full.update(content=text, contentHash=text_hash)
+            TermPositions.replace_for_document(full)
+            postings = TermPositions.find(document['_id'], text_hash, terms)
+        
+        with span('find', 'phrase'):
+            occurrences = find_phrase(terms, postings)
+        
+        page_offsets = document.get('pageOffsets')
+        matches = [
+            {'offset': start, 'length': end - start, 'page': page_number(page_offsets, start)}
+            for start, end in occurrences[:limit]
+        ]
+        
+        return jsonify({
+            'query': ' '.join(terms),
+            'total': len(occurrences),
+            'matches': matches,
+            'truncated': len(occurrences) > limit
+        })
+    
+    except Exception as e:
+        print(f'Find in document error: {e}')
+        return jsonify({'message': 'Server error while searching document'}), 500
+
+
+# List near-duplicates of a document, most similar first
+@document_bp.route('/<document_id>/similar', methods=['GET'])
+@authenticate_token
+def similar_documents(document_id):
+    try:
+        try:
+            threshold = min(max(float(request.args.get('threshold', 0.5)), 0.0), 1.0)
+            limit = min(max(int(request.args.get('limit', 10)), 1), MAX_SIMILAR)
+        except ValueError:
+            return jsonify({'message': 'threshold and limit must be numbers'}), 400
+        
+        document = Document.find_one(
+            {'_id': document_id, 'owner': request.user.get('userId')},
+            {'owner': 1, 'contentHash': 1}
+        )
+        
+        if not document:
+            return jsonify({'message': 'Document not found'}), 404
+        
+        record = DocumentSignature.find_or_build(document)
+        matches = DocumentSignature.find_similar(
+            document['owner'], record['signature'], threshold, limit, exclude=document['_id']
+        )
+        
+        found = {doc['_id']: doc for doc in Document.find_by_ids(
+            [match_id for _, match_id in matches], document['owner'],
+            {'title': 1, 'fileType': 1, 'createdAt': 1}
+        )}
+        similar = [{
+            'documentId': str(match_id),
+            'title': found[match_id].get('title'),
+            'fileType': found[match_id].get('fileType'),
+            'createdAt': found[match_id].get('createdAt'),
+            'similarity': round(score, 3)
+        } for score, match_id in matches if match_id in found]
+        
+        return jsonify({'similar': similar})
+    
+    except Exception as e:
+        print(f'Similar documents error: {e}')
+        return jsonify({'message': 'Server error while finding similar documents'}), 500
+
+
 # Update document
 @document_bp.route('/<document_id>', methods=['PATCH'])
 @authenticate_token
@@ -160,15 +449,19 @@ def update_document(document_id):
         # Add updatedAt timestamp
         update_data['updatedAt'] = Document.get_current_time()
         
-        # Update document
-        document = Document.update_one(
+        # Update document, keeping the previous version to adjust the library counters
+        previous = Document.find_one_and_update(
             {'_id': document_id, 'owner': request.user.get('userId')},
             update_data
         )
         
-        if not document:
+        if not previous:
             return jsonify({'message': 'Document not found'}), 404
         
+        document = dict(previous, **update_data)
+        LibraryStats.record_changed(document['owner'], [previous], [document])
+        publish_document(document)
+        
         # Convert ObjectId to string for JSON serialization
         document['_id'] = str(document['_id'])
         document['owner'] = str(document['owner'])
@@ -191,6 +484,11 @@ def delete_document(document_id):
         if not document:
             return jsonify({'message': 'Document not found'}), 404
         
+        # Delete document from database; a concurrent delete that removed it first owns the cleanup
+        result = Document.delete_one({'_id': document['_id'], 'owner': document['owner']})
+        if not result.deleted_count:
+            return jsonify({'message': 'Document not found'}), 404
+        
         # Delete file from storage
         try:
             if os.path.exists(document['filePath']):
@@ -198,11 +496,124 @@ def delete_document(document_id):
         except Exception as e:
             print(f'Error deleting file: {e}')
         
-        # Delete document from database
-        Document.delete_one({'_id': document_id, 'owner': request.user.get('userId')})
+        DocumentChunk.delete_for_documents([document['_id']], document['owner'])
+        TermPositions.delete_for_documents([document['_id']])
+        DocumentSignature.delete_for_documents([document['_id']])
+        DocumentText.delete_for_documents([document['_id']])
+        LibraryStats.record_deleted(document['owner'], [document])
+        publish_deletions([document['_id']], document['owner'])
         
         return jsonify({'message': 'Document deleted successfully'})
     
     except Exception as e:
         print(f'Delete document error: {e}')
-        return jsonify({'message': 'Server error while deleting document'}), 500
\ No newline at end of file
+        return jsonify({'message': 'Server error while deleting document'}), 500
+
+
+# Update several documents at once
+@document_bp.route('/bulk/update', methods=['POST'])
+@authenticate_token
+def bulk_update_documents():
+    try:
+        data = request.get_json(silent=True)
+        try:
+            object_ids, invalid = parse_bulk_ids(data)
+            add_tags = parse_tag_list(data, 'addTags')
+            remove_tags = parse_tag_list(data, 'removeTags')
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        set_fields = {}
+        if 'isFavorite' in data:
+            if not isinstance(data['isFavorite'], bool):
+                return jsonify({'message': 'isFavorite must be true or false'}), 400
+            set_fields['isFavorite'] = data['isFavorite']
+        
+        if not (add_tags or remove_tags or set_fields):
+            return jsonify({'message': 'Nothing to update. Provide addTags, removeTags or isFavorite.'}), 400
+        
+        set_fields['updatedAt'] = Document.get_current_time()
+        
+        # Ownership check for all IDs in one query
+        owner = request.user.get('userId')
+        before = Document.find_by_ids(object_ids.values(), owner, dict(COUNTED_FIELDS, title=1, owner=1))
+        owned = {doc['_id'] for doc in before}
+        
+        # Tags are pulled before they are added, since one update cannot do both on the same field
+        operations = []
+        for object_id in owned:
+            filters = {'_id': object_id, 'owner': ObjectId(owner)}
+            if remove_tags:
+                operations.append(UpdateOne(filters, {'$pull': {'tags': {'$in': remove_tags}}}))
+            update = {'$set': set_fields}
+            if add_tags:
+                update['$addToSet'] = {'tags': {'$each': add_tags}}
+            operations.append(UpdateOne(filters, update))
+        
+        if operations:
+            Document.bulk_write(operations)
+            
+            # Apply the same change to the previous versions to adjust the library counters
+            after = []
+            for doc in before:
+                tags = [tag for tag in doc.get('tags', []) if tag not in remove_tags]
+                tags += [tag for tag in dict.fromkeys(add_tags) if tag not in tags]
+                after.append(dict(doc, tags=tags, **set_fields))
+            LibraryStats.record_changed(ObjectId(owner), before, after)
+            for doc in after:
+                publish_document(doc)
+        
+        results = [{'id': document_id, 'status': 'updated' if object_id in owned else 'not_found'}
+                   for document_id, object_id in object_ids.items()]
+        results += [{'id': document_id, 'status': 'invalid_id'} for document_id in invalid]
+        
+        return jsonify({'updated': len(owned), 'results': results})
+    
+    except Exception as e:
+        print(f'Bulk update documents error: {e}')
+        return jsonify({'message': 'Server error while updating documents'}), 500
+
+
+# Delete several documents at once
+@document_bp.route('/bulk/delete', methods=['POST'])
+@authenticate_token
+def bulk_delete_documents():
+    try:
+        try:
+            object_ids, invalid = parse_bulk_ids(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # Delete records first so a failed file removal never leaves a dangling record. The owner filter
+        # is the ownership check; documents removed by a concurrent delete are left to it, counters included
+        owner = request.user.get('userId')
+        deleted = Document.delete_many({'_id': {'$in': list(object_ids.values())}, 'owner': owner},
+                                       dict(COUNTED_FIELDS, filePath=1))
+        owned = {doc['_id']: doc.get('filePath') for doc in deleted}
+        if owned:
+            DocumentChunk.delete_for_documents(list(owned), owner)
+            TermPositions.delete_for_documents(list(owned))
+            DocumentSignature.delete_for_documents(list(owned))
+            DocumentText.delete_for_documents(list(owned))
+            LibraryStats.record_deleted(ObjectId(owner), deleted)
+            publish_deletions(list(owned), ObjectId(owner))
+        
+        # Remove the stored files concurrently
+        with ThreadPoolExecutor(max_workers=min(8, len(owned)) or 1) as executor:
+            file_errors = dict(zip(owned, executor.map(remove_file, owned.values())))
+        
+        results = []
+        for document_id, object_id in object_ids.items():
+            if object_id not in owned:
+                results.append({'id': document_id, 'status': 'not_found'})
+            elif file_errors[object_id]:
+                results.append({'id': document_id, 'status': 'deleted', 'fileError': file_errors[object_id]})
+            else:
+                results.append({'id': document_id, 'status': 'deleted'})
+        results += [{'id': document_id, 'status': 'invalid_id'} for document_id in invalid]
+        
+        return jsonify({'deleted': len(owned), 'results': results})
+    
+    except Exception as e:
+        print(f'Bulk delete documents error: {e}')
+        return jsonify({'message': 'Server error while deleting documents'}), 500
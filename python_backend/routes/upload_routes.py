@@ -0,0 +1,307 @@
+from flask import Blueprint, request, jsonify, current_app
+import glob
+import hashlib
+import os
+import shutil
+import uuid
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+from models.upload_session import UploadSession
+from middleware.auth_middleware import authenticate_token
+from utils.ingestion import allowed_file, ingest_file, hash_file
+from utils.parser_registry import UnsupportedFormatError
+from utils.metrics import span
+
+upload_bp = Blueprint('uploads', __name__)
+
+# Size of the blocks streamed from the request body to disk
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# Size of the blocks copied from a segment into the data file
+PLACE_BLOCK_SIZE = 1024 * 1024
+
+# Helper function to get the path of an upload's data file, preallocated to the declared size
+def data_file_path(upload_id):
+    return os.path.join(current_app.config['UPLOAD_TEMP_FOLDER'], f'{upload_id}.data')
+
+# Helper function to get the path of a new segment file; every chunk request writes its own,
+# so concurrent attempts at the same offset, on any worker, never write to the same file
+def new_segment_path(upload_id, offset):
+    return os.path.join(current_app.config['UPLOAD_TEMP_FOLDER'], f'{upload_id}.{offset}.{uuid.uuid4().hex}.part')
+
+# Helper function to remove a file, ignoring files already gone
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f'Error deleting partial upload: {e}')
+
+# Helper function to drop a session and all of its segment files
+def discard_upload(session):
+    UploadSession.delete_one(session['_id'])
+    # Also catches segments of attempts that lost the race or whose worker died
+    pattern = os.path.join(current_app.config['UPLOAD_TEMP_FOLDER'], f'{glob.escape(session["_id"])}.*')
+    for path in glob.glob(pattern):
+        remove_quietly(path)
+
+# Helper function writing a committed segment into the data file at its offset, then dropping it;
+# only the request that committed an offset, or a completion after it died, writes that range
+def place_segment(upload_id, offset, segment_path):
+    with span('io', 'upload.place_chunk'), open(segment_path, 'rb') as segment, \
+            open(data_file_path(upload_id), 'r+b') as output:
+        output.seek(offset)
+        for block in iter(lambda: segment.read(PLACE_BLOCK_SIZE), b''):
+            output.write(block)
+    UploadSession.mark_placed(upload_id, offset)
+    remove_quietly(segment_path)
+
+# Helper function placing the segments whose chunk requests stopped after committing them
+def place_pending(upload_id, pending):
+    for entry in pending:
+        try:
+            place_segment(upload_id, entry['offset'], entry['path'])
+        except FileNotFoundError:
+            # Placed meanwhile by the request that committed it
+            if any(p['offset'] == entry['offset'] for p in UploadSession.find_pending(upload_id)):
+                raise
+
+# Helper function to format a session for responses
+def session_status(session):
+    return {
+        'uploadId': session['_id'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'offset': session['offset'],
+        'expiresAt': session['expiresAt']
+    }
+
+
+# Start a resumable upload
+@upload_bp.route('/', methods=['POST'])
+@authenticate_token
+def init_upload():
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Request body must be a JSON object'}), 400
+        filename = secure_filename(data.get('filename') or '')
+        size = data.get('size')
+        
+        if not filename:
+            return jsonify({'message': 'filename is required'}), 400
+        if not allowed_file(filename):
+            return jsonify({'message': 'Invalid file type. Only PDF, DOC, DOCX, TXT, PPT, and PPTX files are allowed.'}), 400
+        if type(size) is not int or size <= 0:
+            return jsonify({'message': 'size must be a positive number of bytes'}), 400
+        if size > current_app.config['MAX_RESUMABLE_UPLOAD_SIZE']:
+            return jsonify({'message': 'File is too large'}), 413
+        
+        # Remove abandoned uploads
+        for expired in UploadSession.find_expired():
+            discard_upload(expired)
+        
+        upload_id = uuid.uuid4().hex
+        os.makedirs(current_app.config['UPLOAD_TEMP_FOLDER'], exist_ok=True)
+        
+        # Chunks are written into one file at their offsets; it stays sparse until they arrive
+        with open(data_file_path(upload_id), 'wb') as f:
+            f.truncate(size)
+        
+        session = UploadSession.create({
+            '_id': upload_id,
+            'owner': request.user.get('userId'),
+            'filename': filename,
+            'size': size,
+            'title': data.get('title') or filename,
+            'tags': data.get('tags', ''),
+            'checksum': (data.get('checksum') or '').lower() or None
+        })
+        
+        status = session_status(session)
+        status['chunkSize'] = current_app.config['RESUMABLE_CHUNK_SIZE']
+        return jsonify(status), 201
+    
+    except Exception as e:
+        print(f'Init upload error: {e}')
+        return jsonify({'message': 'Server error while starting upload'}), 500
+
+
+# Get the committed offset of an upload, to resume after a dropped connection
+@upload_bp.route('/<upload_id>', methods=['GET'])
+@authenticate_token
+def get_upload(upload_id):
+    try:
+        session = UploadSession.find_one(upload_id, request.user.get('userId'))
+        
+        if not session:
+            return jsonify({'message': 'Upload not found'}), 404
+        
+        return jsonify(session_status(session))
+    
+    except Exception as e:
+        print(f'Get upload error: {e}')
+        return jsonify({'message': 'Server error while fetching upload'}), 500
+
+
+# Append a chunk at the given offset; the body is streamed straight to disk
+@upload_bp.route('/<upload_id>', methods=['PUT'])
+@authenticate_token
+def put_chunk(upload_id):
+    try:
+        session = UploadSession.find_one(upload_id, request.user.get('userId'))
+        
+        if not session:
+            return jsonify({'message': 'Upload not found'}), 404
+        
+        try:
+            offset = int(request.args.get('offset', ''))
+        except ValueError:
+            return jsonify({'message': 'offset query parameter is required'}), 400
+        chunk_checksum = request.args.get('checksum', '').lower() or None
+        
+        # Chunks must be sent in order; tell the client where to resume
+        if offset != session['offset'] or session.get('completing'):
+            return jsonify({'message': 'Offset does not match the upload', 'offset': session['offset']}), 409
+        
+        remaining = session['size'] - offset
+        written = 0
+        sha256 = hashlib.sha256()
+        segment_path = new_segment_path(upload_id, offset)
+        committed = False
+        try:
+            with span('io', 'upload.write_chunk'), open(segment_path, 'wb') as f:
+                while True:
+                    try:
+                        block = request.stream.read(STREAM_BLOCK_SIZE)
+                    except RequestEntityTooLarge:
+                        # Tell the client to resend the same bytes in smaller chunks
+                        return jsonify({'message': 'Chunk exceeds the request size limit',
+                                        'offset': offset,
+                                        'chunkSize': current_app.config['RESUMABLE_CHUNK_SIZE']}), 413
+                    if not block:
+                        break
+                    if written + len(block) > remaining:
+                        return jsonify({'message': 'Chunk exceeds the declared file size', 'offset': offset}), 413
+                    f.write(block)
+                    sha256.update(block)
+                    written += len(block)
+            
+            if not written:
+                return jsonify({'uploadId': upload_id, 'offset': offset, 'size': session['size']})
+            
+            digest = sha256.hexdigest()
+            if chunk_checksum and chunk_checksum != digest:
+                return jsonify({'message': 'Chunk checksum mismatch. Send the chunk again.', 'offset': offset}), 422
+            
+            # The offset is claimed only now, atomically; a request that loses keeps nothing
+            committed = UploadSession.advance(upload_id, offset, offset + written, segment_path, digest)
+            if not committed:
+                current = UploadSession.find_one(upload_id, request.user.get('userId'))
+                return jsonify({'message': 'Upload was modified concurrently',
+                                'offset': current['offset'] if current else None}), 409
+        finally:
+            if not committed:
+                remove_quietly(segment_path)
+        
+        # The chunk is committed; if this fails, completion writes the segment into the data file instead
+        try:
+            place_segment(upload_id, offset, segment_path)
+        except Exception as e:
+            print(f'Error placing upload chunk: {e}')
+        
+        return jsonify({'uploadId': upload_id, 'offset': offset + written, 'size': session['size']})
+    
+    except Exception as e:
+        print(f'Upload chunk error: {e}')
+        return jsonify({'message': 'Server error while uploading chunk'}), 500
+
+
+# Verify the uploaded file and create the document; parsing happens only here
+@upload_bp.route('/<upload_id>/complete', methods=['POST'])
+@authenticate_token
+def complete_upload(upload_id):
+    try:
+        session = UploadSession.find_one(upload_id, request.user.get('userId'))
+        
+        if not session:
+            return jsonify({'message': 'Upload not found'}), 404
+        
+        if session['offset'] != session['size']:
+            return jsonify({'message': 'Upload is incomplete', 'offset': session['offset']}), 409
+        
+        # Only one request, on any worker, creates the document
+        session = UploadSession.claim_completion(upload_id, session['size'])
+        if not session:
+            return jsonify({'message': 'Upload is already being completed'}), 409
+        
+        # Verify the data file and move it into the upload folder; on failure it is moved back
+        # and the session released, so the completion can be retried
+        data_path = data_file_path(upload_id)
+        file_path = None
+        try:
+            place_pending(upload_id, session.get('pending', []))
+            
+            # Chunks are hashed as they arrive, but SHA-256 cannot be resumed from per-chunk digests
+            # across workers, so the whole-file hash costs one sequential read of the data file
+            with span('io', 'upload.hash'):
+                file_hash = hash_file(data_path).hexdigest()
+            if session['checksum'] and session['checksum'] != file_hash:
+                discard_upload(session)
+                return jsonify({'message': 'Checksum mismatch. The upload was discarded.'}), 422
+            
+            # A rename, as UPLOAD_TEMP_FOLDER is inside UPLOAD_FOLDER by default
+            ext = os.path.splitext(session['filename'])[1]
+            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f'{uuid.uuid4()}{ext}')
+            shutil.move(data_path, file_path)
+            
+            try:
+                document = ingest_file(
+                    file_path,
+                    session['filename'],
+                    session['owner'],
+                    title=session['title'],
+                    tags=session['tags'],
+                    file_hash=file_hash
+                )
+            except UnsupportedFormatError as e:
+                remove_quietly(file_path)
+                discard_upload(session)
+                return jsonify({'message': str(e)}), 415
+        except Exception:
+            if file_path and os.path.exists(file_path):
+                shutil.move(file_path, data_path)
+            UploadSession.release_completion(upload_id)
+            raise
+        
+        discard_upload(session)
+        
+        # Convert ObjectId to string for JSON serialization
+        document['_id'] = str(document['_id'])
+        document['owner'] = str(document['owner'])
+        
+        return jsonify(document), 201
+    
+    except Exception as e:
+        print(f'Complete upload error: {e}')
+        return jsonify({'message': 'Server error while completing upload'}), 500
+
+
+# Abort an upload
+@upload_bp.route('/<upload_id>', methods=['DELETE'])
+@authenticate_token
+def abort_upload(upload_id):
+    try:
+        session = UploadSession.find_one(upload_id, request.user.get('userId'))
+        
+        if not session:
+            return jsonify({'message': 'Upload not found'}), 404
+        
+        discard_upload(session)
+        
+        return jsonify({'message': 'Upload aborted'})
+    
+    except Exception as e:
+        print(f'Abort upload error: {e}')
+        return jsonify({'message': 'Server error while aborting upload'}), 500
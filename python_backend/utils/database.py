@@ -0,0 +1,29 @@
+import threading
+from pymongo import MongoClient
+
+
+class LazyDatabase:
+    """
+    Stands in for the pymongo Database and connects on first use
+
+    Creating the app opens no sockets and starts no pymongo monitor threads,
+    so it is safe in a prefork master and cheap for CLI tools.
+    """
+    def __init__(self, uri):
+        self._uri = uri
+        self._database = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        if self._database is None:
+            with self._lock:
+                if self._database is None:
+                    self._database = MongoClient(self._uri).get_database()
+                    print('Connected to MongoDB')
+        return self._database
+
+    def __getattr__(self, name):
+        return getattr(self.connect(), name)
+
+    def __getitem__(self, name):
+        return self.connect()[name]
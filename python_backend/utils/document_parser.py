@@ -1,31 +1,65 @@
+import mmap
 import os
-import PyPDF2
-import docx
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from utils.metrics import timed
 
+# Characters read at a time from text files
+TEXT_BLOCK_SIZE = 1024 * 1024
 
-def extract_text_from_pdf(file_path):
+# DrawingML namespace used for text in PPTX slides
+DRAWINGML_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+
+# Namespaces of the PPTX presentation part and its relationships, which give the slide order
+PRESENTATIONML_NS = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+RELATIONSHIP_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+PACKAGE_RELS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# Names of OLE2 directory entries, which also appear as UTF-16LE runs
+OLE_STREAM_NAMES = {
+    'Root Entry', 'WordDocument', '0Table', '1Table', 'Data', 'PowerPoint Document',
+    'Current User', 'Pictures', 'SummaryInformation', 'DocumentSummaryInformation', 'CompObj'
+}
+
+
+@timed('parser', 'pdf')
+def extract_pages_from_pdf(file_path):
     """
-    Extract text content from a PDF file
+    Extract the text of each page of a PDF file
     
     Args:
         file_path (str): Path to the PDF file
         
     Returns:
-        str: Extracted text content
+        list: Extracted text per page
     """
+    import PyPDF2  # Imported on first use to keep startup fast
+    
     try:
-        text = ""
         with open(file_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text()
-        return text
+            return [page.extract_text() for page in pdf_reader.pages]
     except Exception as e:
         print(f'Error extracting text from PDF: {e}')
         raise Exception('Failed to extract text from PDF')
 
 
+def extract_text_from_pdf(file_path):
+    """
+    Extract text content from a PDF file
+    
+    Args:
+        file_path (str): Path to the PDF file
+        
+    Returns:
+        str: Extracted text content
+    """
+    return ''.join(extract_pages_from_pdf(file_path))
+
+
+@timed('parser', 'docx')
 def extract_text_from_docx(file_path):
     """
     Extract text content from a DOCX file
@@ -36,6 +70,8 @@ def extract_text_from_docx(file_path):
     Returns:
         str: Extracted text content
     """
+    import docx  # Imported on first use to keep startup fast
+    
     try:
         doc = docx.Document(file_path)
         text = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
@@ -45,6 +81,7 @@ def extract_text_from_docx(file_path):
         raise Exception('Failed to extract text from DOCX')
 
 
+@timed('parser', 'txt')
 def extract_text_from_txt(file_path):
     """
     Extract text content from a TXT file
@@ -56,12 +93,121 @@ def extract_text_from_txt(file_path):
         str: Extracted text content
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
-    except UnicodeDecodeError:
-        # Try with different encoding if UTF-8 fails
-        with open(file_path, 'r', encoding='latin-1') as file:
-            return file.read()
+        try:
+            return _read_text(file_path, 'utf-8')
+        except UnicodeDecodeError:
+            # Try with different encoding if UTF-8 fails
+            return _read_text(file_path, 'latin-1')
     except Exception as e:
         print(f'Error extracting text from TXT: {e}')
-        raise Exception('Failed to extract text from TXT')
\ No newline at end of file
+        raise Exception('Failed to extract text from TXT')
+
+
+def _read_text(file_path, encoding):
+    # Decoded block by block, so the raw bytes are never held in memory as a whole
+    with open(file_path, 'r', encoding=encoding) as file:
+        return ''.join(iter(lambda: file.read(TEXT_BLOCK_SIZE), ''))
+
+
+@timed('parser', 'pptx')
+def extract_slides_from_pptx(file_path):
+    """
+    Extract the text of each slide of a PPTX file, reading the slide XML directly
+    
+    Args:
+        file_path (str): Path to the PPTX file
+        
+    Returns:
+        list: Extracted text per slide, in slide order
+    """
+    try:
+        slides = []
+        with zipfile.ZipFile(file_path) as archive:
+            for name in _pptx_slide_names(archive):
+                with archive.open(name) as slide:
+                    paragraphs = []
+                    for _, element in ET.iterparse(slide):
+                        if element.tag == f'{DRAWINGML_NS}p':
+                            text = ''.join(run.text or '' for run in element.iter(f'{DRAWINGML_NS}t'))
+                            if text.strip():
+                                paragraphs.append(text)
+                            element.clear()
+                    slides.append('\n'.join(paragraphs) + '\n')
+        return slides
+    except Exception as e:
+        print(f'Error extracting text from PPTX: {e}')
+        raise Exception('Failed to extract text from PPTX')
+
+
+def _pptx_slide_names(archive):
+    # Slide order is the order of sldIdLst in the presentation part, not the part names
+    available = set(archive.namelist())
+    try:
+        with archive.open('ppt/_rels/presentation.xml.rels') as rels:
+            targets = {relationship.get('Id'): relationship.get('Target')
+                       for relationship in ET.parse(rels).getroot().iter(f'{PACKAGE_RELS_NS}Relationship')}
+        with archive.open('ppt/presentation.xml') as presentation:
+            slide_ids = ET.parse(presentation).getroot().iter(f'{PRESENTATIONML_NS}sldId')
+            names = []
+            for slide_id in slide_ids:
+                target = targets.get(slide_id.get(RELATIONSHIP_ID))
+                if target:
+                    name = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('ppt', target))
+                    if name in available:
+                        names.append(name)
+        if names:
+            return names
+    except (KeyError, ET.ParseError):
+        pass
+
+    # Fall back to the part names for presentations without a usable slide list
+    names = [name for name in available if re.fullmatch(r'ppt/slides/slide\d+\.xml', name)]
+    return sorted(names, key=lambda name: int(re.search(r'(\d+)\.xml$', name).group(1)))
+
+
+def extract_text_from_pptx(file_path):
+    """
+    Extract text content from a PPTX file
+    
+    Args:
+        file_path (str): Path to the PPTX file
+        
+    Returns:
+        str: Extracted text content
+    """
+    return ''.join(extract_slides_from_pptx(file_path))
+
+
+@timed('parser', 'ole')
+def extract_text_from_ole(file_path, min_run=4):
+    """
+    Best-effort text extraction from legacy binary Office files (DOC/PPT)
+    
+    These formats store text as UTF-16LE or 8-bit runs inside an OLE2
+    container; runs of printable characters are collected in file order.
+    The file is memory-mapped and scanned in place rather than read into memory.
+    
+    Args:
+        file_path (str): Path to the DOC or PPT file
+        min_run (int): Minimum run length, in characters, to keep
+        
+    Returns:
+        str: Extracted text content
+    """
+    try:
+        with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            runs = [(match.start(), match.group().decode('utf-16-le'))
+                    for match in re.finditer(rb'(?:[\x20-\x7e\r\n\t]\x00){%d,}' % min_run, data)]
+            # 8-bit runs need to be longer and contain spaces to tell text from binary noise
+            runs += [(match.start(), match.group().decode('latin-1'))
+                     for match in re.finditer(rb'[\x20-\x7e\r\n\t]{%d,}' % (min_run * 4), data)
+                     if b' ' in match.group()]
+        runs.sort()
+        # Skip the container's own stream names
+        text = '\n'.join(run.strip() for _, run in runs if run.strip() not in OLE_STREAM_NAMES)
+        if len(text.strip()) < 20:
+            raise ValueError('No text runs found')
+        return text
+    except Exception as e:
+        print(f'Error extracting text from legacy Office file: {e}')
+        raise Exception('Failed to extract text from legacy Office file')
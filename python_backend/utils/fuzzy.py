@@ -0,0 +1,124 @@
+import heapq
+
+# Candidates verified with Levenshtein per query term, whatever the vocabulary size
+MAX_FUZZY_CANDIDATES = 300
+
+# Vocabulary terms a misspelled query term expands to
+MAX_EXPANSIONS = 3
+
+
+def trigrams(term):
+    """
+    Character trigrams of a term, padded so its start and end count as well
+    """
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(term):
+    """
+    Edit distance tolerated for a query term; short terms must match exactly
+    """
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 7 else 2
+
+
+def bounded_levenshtein(a, b, max_distance):
+    """
+    Levenshtein distance, giving up as soon as it must exceed max_distance
+
+    Returns:
+        int: The distance, or None if it is greater than max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        # Only cells within max_distance of the diagonal can stay under the bound
+        low = max(1, i - max_distance)
+        high = min(len(b), i + max_distance)
+        current = [max_distance + 1] * (len(b) + 1)
+        if low == 1:
+            current[0] = i
+        for j in range(low, high + 1):
+            cost = 0 if char_a == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+        if min(current[low - 1:high + 1]) > max_distance:
+            return None
+        previous = current
+    return previous[len(b)] if previous[len(b)] <= max_distance else None
+
+
+class TrigramIndex:
+    """
+    Maps character trigrams to the vocabulary terms containing them
+    """
+    def __init__(self, terms=()):
+        self.postings = {}
+        for term in terms:
+            self.add(term)
+
+    def add(self, term):
+        for gram in trigrams(term):
+            self.postings.setdefault(gram, set()).add(term)
+
+    def remove(self, term):
+        for gram in trigrams(term):
+            terms = self.postings.get(gram)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self.postings[gram]
+
+    def expand(self, term, max_distance=None, frequency=None):
+        """
+        Find vocabulary terms within a bounded edit distance of a term
+
+        Candidates come from the term's rarest trigrams only: a term within
+        k edits shares all but at most 3k of its trigrams, so it must appear in
+        one of the 3k + 1 rarest lists. At most MAX_FUZZY_CANDIDATES are verified.
+
+        Args:
+            term (str): Query term
+            max_distance (int): Edit distance bound, by default from the term length
+            frequency (callable): Term -> document frequency, to prefer common terms on ties
+
+        Returns:
+            list: (vocabulary term, distance), closest first
+        """
+        if max_distance is None:
+            max_distance = max_edits(term)
+        if max_distance == 0:
+            return []
+
+        grams = trigrams(term)
+        lists = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        required = len(grams) - 3 * max_distance
+
+        candidates = set()
+        for terms in lists[:3 * max_distance + 1]:
+            for candidate in terms:
+                candidates.add(candidate)
+                if len(candidates) >= MAX_FUZZY_CANDIDATES:
+                    break
+            if len(candidates) >= MAX_FUZZY_CANDIDATES:
+                break
+
+        matches = []
+        for candidate in candidates:
+            if candidate == term or abs(len(candidate) - len(term)) > max_distance:
+                continue
+            if required > 0 and len(grams & trigrams(candidate)) < required:
+                continue
+            distance = bounded_levenshtein(term, candidate, max_distance)
+            if distance is not None:
+                matches.append((candidate, distance))
+
+        return heapq.nsmallest(
+            MAX_EXPANSIONS, matches,
+            key=lambda match: (match[1], -(frequency(match[0]) if frequency else 0), match[0])
+        )
@@ -0,0 +1,60 @@
+import hashlib
+from flask import Response, current_app, request, stream_with_context
+
+# Lists with at least this many items are serialized while being sent
+STREAM_MIN_ITEMS = 100
+
+
+def make_etag(*parts):
+    """
+    Weak ETag over the values a representation depends on
+
+    Weak, because the same representation is also sent compressed.
+
+    Args:
+        *parts: Values identifying the version of the resource (IDs, updatedAt, content hashes)
+
+    Returns:
+        str: ETag header value
+    """
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def not_modified(etag):
+    """
+    Build a 304 response if the client already has this version
+
+    Returns:
+        Response: The 304 response, or None if the client's copy is missing or stale
+    """
+    if request.if_none_match and request.if_none_match.contains_weak(etag[2:].strip('"')):
+        response = Response(status=304)
+        response.headers['ETag'] = etag
+        return response
+    return None
+
+
+def json_response(data, etag=None):
+    """
+    JSON response carrying an ETag; long lists are streamed item by item
+    instead of being serialized into one string first
+    """
+    if isinstance(data, list) and len(data) >= STREAM_MIN_ITEMS:
+        dumps = current_app.json.dumps
+
+        def generate():
+            yield '['
+            for i, item in enumerate(data):
+                yield (',' if i else '') + dumps(item)
+            yield ']\n'
+
+        response = Response(stream_with_context(generate()), mimetype='application/json')
+    else:
+        response = current_app.json.response(data)
+
+    if etag:
+        response.headers['ETag'] = etag
+        # Revalidate on every use; unchanged versions cost a 304 without a body
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
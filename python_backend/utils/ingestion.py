@@ -0,0 +1,200 @@
+import os
+import hashlib
+from bson import ObjectId
+from flask import current_app
+from models.document import Document
+from models.chunk import DocumentChunk
+from models.term_position import TermPositions
+from models.library_stats import LibraryStats
+from models.signature import DocumentSignature
+from models.document_text import DocumentText
+from utils.parser_registry import select_parser, extract
+from utils.single_flight import coalesce
+from utils.metrics import span
+from utils.change_feed import publish_document
+from utils.retrieval import content_hash
+
+ALLOWED_EXTENSIONS = {'.pdf', '.doc', '.docx', '.txt', '.ppt', '.pptx'}
+
+# Characters of extracted text stored on the document record itself; longer texts
+# are kept in full in document_texts, since a record may not exceed 16 MB
+MAX_INLINE_CONTENT = 2000000
+
+
+def allowed_file(filename):
+    """
+    Check whether a filename has an allowed extension
+    """
+    return os.path.splitext(filename.lower())[1] in ALLOWED_EXTENSIONS
+
+
+def hash_file(file_path, length=None):
+    """
+    Hash file contents without reading the whole file into memory
+
+    Args:
+        file_path (str): Path to the file
+        length (int): Only hash this many leading bytes
+
+    Returns:
+        hashlib object: SHA-256 state after the hashed bytes
+    """
+    sha256 = hashlib.sha256()
+    remaining = length
+    with open(file_path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            block = f.read(1024 * 1024 if remaining is None else min(1024 * 1024, remaining))
+            if not block:
+                break
+            sha256.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return sha256
+
+
+def stored_file_path(file_path, detected):
+    """
+    Path of a stored file with the extension of its sniffed format
+    """
+    return f'{os.path.splitext(file_path)[0]}.{detected}'
+
+
+def document_fields(file_path, filename, owner, title, tags, file_hash, content, page_offsets, parser_info):
+    """
+    Build the record of a new document from its stored file and extraction result
+
+    Args:
+        file_path (str): Path of the file in the upload folder
+        filename (str): Secured original filename
+        owner (str): ID of the owning user
+        title (str): Document title (defaults to the filename)
+        tags (str): Comma-separated tags
+        file_hash (str): SHA-256 of the file
+        content (str): Extracted text; only the first MAX_INLINE_CONTENT characters are kept
+        page_offsets (list): Start offset of each page or slide in content
+        parser_info (dict): Parser name, version, format, duration and error if any
+
+    Returns:
+        dict: Document fields, ready for Document.create
+    """
+    truncated = len(content) > MAX_INLINE_CONTENT
+    return {
+        'title': title or filename,
+        'originalFilename': filename,
+        # The sniffed format, since the client's extension may be wrong
+        'fileType': parser_info.get('format') or os.path.splitext(filename)[1][1:].lower(),
+        'fileSize': os.path.getsize(file_path),
+        'filePath': file_path,
+        'fileHash': file_hash,
+        'content': content[:MAX_INLINE_CONTENT] if truncated else content,
+        'contentTruncated': truncated,
+        'contentLength': len(content),
+        'contentHash': content_hash(content),
+        'pageOffsets': page_offsets,
+        'parser': parser_info,
+        'owner': owner,
+        'tags': list(dict.fromkeys(tag.strip() for tag in tags.split(',') if tag.strip())) if tags else []
+    }
+
+
+def ingest_file(file_path, filename, owner, title=None, tags='', file_hash=None):
+    """
+    Extract a stored file's text and create its document record and chunks
+
+    Args:
+        file_path (str): Path of the file in the upload folder; renamed to the extension of its sniffed format
+        filename (str): Secured original filename
+        owner (str): ID of the owning user
+        title (str): Document title (defaults to the filename)
+        tags (str): Comma-separated tags
+        file_hash (str): SHA-256 of the file, if already known
+
+    Returns:
+        dict: The created document
+
+    Raises:
+        UnsupportedFormatError: If the file content matches no registered parser
+    """
+    # Choose the parser from the file's content, not its extension
+    parser, detected = select_parser(file_path)
+
+    if file_hash is None:
+        with span('io', 'file.hash'):
+            file_hash = hash_file(file_path).hexdigest()
+
+    parser_info = {'name': parser.name, 'version': parser.version, 'format': detected}
+    page_offsets = []
+    try:
+        # Identical files uploaded concurrently share one extraction
+        extraction = coalesce(
+            ('extract', parser.name, parser.version, file_hash),
+            lambda: extract(file_path, parser, detected)
+        )
+        content = extraction.text
+        page_offsets = extraction.page_offsets
+        parser_info['durationMs'] = extraction.duration_ms
+    except Exception as e:
+        print(f'Error extracting content: {e}')
+        content = 'Error extracting content from file.'
+        parser_info['error'] = str(e)
+
+    # Flag near-duplicates of documents already in the library
+    with span('dedup', 'minhash'):
+        signature = DocumentSignature.compute({'content': content, 'parser': parser_info})
+    near_duplicate = None
+    try:
+        threshold = current_app.config.get('NEAR_DUPLICATE_THRESHOLD', 0.8)
+        matches = DocumentSignature.find_similar(owner, signature, threshold, 1)
+        if matches:
+            near_duplicate = {'documentId': str(matches[0][1]), 'similarity': matches[0][0]}
+    except Exception as e:
+        print(f'Error finding near-duplicates: {e}')
+
+    # Create document record
+    document_data = document_fields(file_path, filename, owner, title, tags, file_hash,
+                                    content, page_offsets, parser_info)
+    document_data['nearDuplicateOf'] = near_duplicate
+
+    # Store the file under the extension of its actual format; put back if the document is not created
+    stored_path = stored_file_path(file_path, detected)
+    os.replace(file_path, stored_path)
+    document_data['filePath'] = stored_path
+
+    # Long texts are kept in full outside the record, written first so that a document never lacks them
+    document_data['_id'] = ObjectId()
+    try:
+        if document_data['contentTruncated']:
+            DocumentText.replace_for_document(document_data['_id'], document_data['contentHash'], content)
+        document = Document.create(document_data)
+    except Exception:
+        os.replace(stored_path, file_path)
+        if document_data['contentTruncated']:
+            DocumentText.delete_for_documents([document_data['_id']])
+        raise
+    LibraryStats.record_created(document)
+
+    # Derived indexes are built from the full text
+    full_document = dict(document, content=content)
+
+    # Chunk the content once for question answering; rebuilt on demand if this fails
+    try:
+        DocumentChunk.replace_for_document(full_document)
+    except Exception as e:
+        print(f'Error indexing document chunks: {e}')
+
+    # Positional index for in-document find; also rebuilt on demand
+    try:
+        TermPositions.replace_for_document(full_document)
+    except Exception as e:
+        print(f'Error indexing term positions: {e}')
+
+    # Signature for near-duplicate lookups; computed on demand if this fails
+    try:
+        DocumentSignature.store(document['_id'], document['owner'], document['contentHash'], signature)
+    except Exception as e:
+        print(f'Error storing document signature: {e}')
+
+    # Update this worker's in-memory indexes now; others learn of it from the change feed
+    publish_document(document)
+
+    return document
@@ -0,0 +1,29 @@
+import threading
+from flask import current_app
+
+_openai = None
+_lock = threading.Lock()
+
+
+def openai_client():
+    """
+    The openai module, imported and configured on the first AI call
+
+    openai pulls in requests and aiohttp, which account for a large share of
+    startup time, so processes that never call the API do not import it.
+    """
+    global _openai
+    if _openai is None:
+        with _lock:
+            if _openai is None:
+                import openai
+                openai.api_key = current_app.config.get('OPENAI_API_KEY')
+                _openai = openai
+    return _openai
+
+
+def chat_completion(**kwargs):
+    """
+    Create an OpenAI chat completion; arguments are those of openai.ChatCompletion.create
+    """
+    return openai_client().ChatCompletion.create(**kwargs)
@@ -0,0 +1,241 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from flask import g, request, has_request_context, Response
+
+# Upper bounds (seconds) of the histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Switched on by init_metrics; checked first so disabled spans cost one attribute lookup
+_enabled = False
+
+
+class Histogram:
+    """
+    Prometheus-style histogram with a fixed set of buckets per label combination
+    """
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts, plus sum and count
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(labels, list(counts), total, count)
+                     for labels, (counts, total, count) in self._series.items()]
+
+        for label_values, counts, total, count in sorted(items):
+            labels = ','.join(f'{name}="{_escape(value)}"'
+                              for name, value in zip(self.label_names, label_values))
+            prefix = f'{labels},' if labels else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds',
+    'Time spent handling HTTP requests',
+    ('method', 'route', 'status')
+)
+
+span_duration = Histogram(
+    'app_span_duration_seconds',
+    'Time spent in instrumented operations (DB, parser and LLM calls)',
+    ('kind', 'name')
+)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.started = None
+        self.outermost = False
+
+    def __enter__(self):
+        # Only the outermost span of a kind counts towards Server-Timing, so that
+        # a DB call made inside another one is not added twice
+        if has_request_context():
+            active = g.setdefault('active_span_kinds', set())
+            if self.kind not in active:
+                active.add(self.kind)
+                self.outermost = True
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.started
+        span_duration.observe(duration, self.kind, self.name)
+        if self.outermost:
+            g.active_span_kinds.discard(self.kind)
+            timings = g.setdefault('span_timings', {})
+            timings[self.kind] = timings.get(self.kind, 0.0) + duration
+        return False
+
+
+def span(kind, name):
+    """
+    Time a block of code
+
+    Args:
+        kind (str): Category shown in Server-Timing, e.g. 'db', 'parser' or 'llm'
+        name (str): Operation name, e.g. 'documents.find'
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(kind, name)
+
+
+def timed(kind, name):
+    """
+    Decorator timing every call of a function as a span
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not _enabled:
+                return f(*args, **kwargs)
+            with _Span(kind, name):
+                return f(*args, **kwargs)
+
+        return decorated
+
+    return decorator
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval and writes the
+    collapsed stacks (flame graph input format) to a file
+    """
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, output_path):
+        self._stop.set()
+        self._thread.join()
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _profiling_requested(app):
+    if not app.config.get('PROFILING_ENABLED'):
+        return False
+    return request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+
+
+def _profile_filename():
+    return f'{int(time.time() * 1000)}-{request.endpoint or "unmatched"}.folded'
+
+
+def init_metrics(app):
+    """
+    Register request timing hooks and the /metrics endpoint on the app
+    """
+    global _enabled
+    _enabled = app.config.get('METRICS_ENABLED', True)
+    if not _enabled:
+        return
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        if _profiling_requested(app):
+            g.profiler = SamplingProfiler(threading.get_ident())
+            g.profiler.start()
+
+    @app.after_request
+    def record_request_time(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+
+        duration = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_duration.observe(duration, request.method, route, response.status_code)
+
+        # Server-Timing header, one entry per span kind plus the total
+        timings = g.pop('span_timings', {})
+        entries = [f'{kind};dur={seconds * 1000:.2f}' for kind, seconds in timings.items()]
+        entries.append(f'total;dur={duration * 1000:.2f}')
+        response.headers['Server-Timing'] = ', '.join(entries)
+
+        if 'profiler' in g:
+            g.profile_file = _profile_filename()
+            response.headers['X-Profile-File'] = g.profile_file
+
+        return response
+
+    @app.teardown_request
+    def stop_profiler(error=None):
+        # Runs even when after_request does not, so the sampling thread never outlives the request
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            filename = g.pop('profile_file', None) or _profile_filename()
+            profiler.stop(os.path.join(app.config['PROFILE_DIR'], filename))
+
+    @app.route('/metrics')
+    def metrics():
+        body = '\n'.join([request_duration.render(), span_duration.render()]) + '\n'
+        return Response(body, mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,108 @@
+import zlib
+from utils.retrieval import WORD_PATTERN
+
+# Words per shingle
+SHINGLE_SIZE = 5
+
+# One-permutation MinHash: each shingle hash lands in one of NUM_BINS bins, keeping the minimum per bin
+NUM_BINS = 128
+
+# LSH banding of the signature; documents sharing any band are candidates.
+# 16 bands of 8 rows put the 50% detection point near a Jaccard similarity of 0.7
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_BINS // NUM_BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_BASE = 1000003
+_MIX = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+# Stored values must fit a signed 64-bit BSON integer
+_MASK_62 = (1 << 62) - 1
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """
+    Hash every run of `size` consecutive words of a text with a rolling polynomial hash
+
+    Args:
+        text (str): Text to shingle
+        size (int): Words per shingle
+
+    Returns:
+        set: 64-bit shingle hashes; texts shorter than one shingle hash as a single shingle
+    """
+    word_hashes = {}
+    hashes = []
+    for match in WORD_PATTERN.finditer(text.lower()):
+        word = match.group()
+        value = word_hashes.get(word)
+        if value is None:
+            value = word_hashes[word] = zlib.crc32(word.encode()) + 1
+        hashes.append(value)
+    if not hashes:
+        return set()
+
+    size = min(size, len(hashes))
+    leading_power = pow(_BASE, size - 1, _MERSENNE_PRIME)
+    rolling = 0
+    for value in hashes[:size]:
+        rolling = (rolling * _BASE + value) % _MERSENNE_PRIME
+    shingles = {(rolling * _MIX) & _MASK_64}
+    for old, new in zip(hashes, hashes[size:]):
+        rolling = ((rolling - old * leading_power) * _BASE + new) % _MERSENNE_PRIME
+        shingles.add((rolling * _MIX) & _MASK_64)
+    return shingles
+
+
+def signature(text):
+    """
+    One-permutation MinHash signature of a text's shingles
+
+    Each shingle hash is computed once; its top bits pick a bin and the rest are
+    the value kept if smallest. Empty bins borrow from the next non-empty bin
+    (rotation densification) so short texts still get comparable signatures.
+
+    Returns:
+        list: NUM_BINS integers, or an empty list for a text without words
+    """
+    shift = 64 - (NUM_BINS.bit_length() - 1)
+    bins = [None] * NUM_BINS
+    for value in shingle_hashes(text):
+        index = value >> shift
+        value &= _MASK_62
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+
+    if all(value is None for value in bins):
+        return []
+    for index in range(NUM_BINS):
+        if bins[index] is None:
+            distance = 1
+            while bins[(index + distance) % NUM_BINS] is None:
+                distance += 1
+            # Offsetting by the distance keeps borrowed values from matching real ones
+            bins[index] = (bins[(index + distance) % NUM_BINS] + distance * _MIX) & _MASK_62
+    return bins
+
+
+def band_keys(values):
+    """
+    LSH band keys of a signature; the band number is part of each key
+    """
+    keys = []
+    for band in range(NUM_BANDS):
+        rolling = band + 1
+        for value in values[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]:
+            rolling = (rolling * _BASE + value) % _MERSENNE_PRIME
+        keys.append((band << 56) | (rolling & ((1 << 56) - 1)))
+    return keys
+
+
+def similarity(first, second):
+    """
+    Estimated Jaccard similarity of the shingle sets behind two signatures
+    """
+    if not first or len(first) != len(second):
+        return 0.0
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
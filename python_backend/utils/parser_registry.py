@@ -0,0 +1,230 @@
+import struct
+import time
+import zipfile
+from collections import namedtuple
+from utils import document_parser
+
+# Leading bytes identifying each container format
+PDF_MAGIC = b'%PDF-'
+ZIP_MAGIC = b'PK\x03\x04'
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+# Stream names in the OLE directory telling Word and PowerPoint files apart
+OLE_WORD_STREAM = 'WordDocument'
+OLE_POWERPOINT_STREAM = 'PowerPoint Document'
+
+# Highest regular OLE2 sector number (larger values mark chain ends and special sectors),
+# and a bound on the sectors followed in a possibly corrupt file
+OLE_MAX_REGULAR_SECTOR = 0xFFFFFFFA
+OLE_MAX_SECTORS = 4096
+
+Parser = namedtuple('Parser', ['name', 'version', 'formats', 'cost', 'extract'])
+
+# Result of an extraction: full text plus the start offset of each page or slide
+Extraction = namedtuple('Extraction', ['text', 'page_offsets', 'parser', 'format', 'duration_ms'])
+
+_parsers = []
+
+
+class UnsupportedFormatError(Exception):
+    """
+    Raised when no registered parser can handle a file's actual format
+    """
+
+
+def register_parser(name, version, formats, cost):
+    """
+    Decorator registering an extractor
+
+    Args:
+        name (str): Parser name recorded on documents
+        version (str): Parser version recorded on documents
+        formats (tuple): Sniffed formats the parser can handle
+        cost (int): Relative cost; the cheapest capable parser is used
+    """
+    def decorator(f):
+        _parsers.append(Parser(name, version, tuple(formats), cost, f))
+        _parsers.sort(key=lambda parser: parser.cost)
+        return f
+
+    return decorator
+
+
+def sniff_format(file_path):
+    """
+    Detect a file's format from its content rather than its extension
+
+    Returns:
+        str: One of 'pdf', 'docx', 'pptx', 'doc', 'ppt', 'txt', or None if unrecognized
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(8192)
+
+    if head.startswith(PDF_MAGIC):
+        return 'pdf'
+
+    if head.startswith(ZIP_MAGIC):
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                names = set(archive.namelist())
+        except zipfile.BadZipFile:
+            return None
+        if 'word/document.xml' in names:
+            return 'docx'
+        if 'ppt/presentation.xml' in names:
+            return 'pptx'
+        return None
+
+    if head.startswith(OLE_MAGIC):
+        try:
+            names = ole_stream_names(file_path)
+        except (ValueError, struct.error):
+            return None
+        if OLE_WORD_STREAM in names:
+            return 'doc'
+        if OLE_POWERPOINT_STREAM in names:
+            return 'ppt'
+        return None
+
+    # Plain text: no NUL bytes and decodable
+    if b'\x00' in head:
+        return None
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character may be cut off at the end of the sample
+        if e.start < len(head) - 3:
+            try:
+                head.decode('cp1252')
+            except UnicodeDecodeError:
+                return None
+    return 'txt'
+
+
+def ole_stream_names(file_path):
+    """
+    Read the entry names of an OLE2 compound file's directory
+
+    The directory can sit anywhere in the file, so its sector chain is
+    followed through the FAT instead of searching the leading bytes.
+
+    Returns:
+        set: Names of the storages and streams in the file
+
+    Raises:
+        ValueError: If the file is not a well-formed compound file
+    """
+    with open(file_path, 'rb') as f:
+        header = f.read(512)
+        if len(header) < 512:
+            raise ValueError('Truncated OLE header')
+        sector_size = 1 << struct.unpack_from('<H', header, 0x1E)[0]
+        if sector_size not in (512, 4096):
+            raise ValueError('Unexpected OLE sector size')
+        first_directory_sector, = struct.unpack_from('<I', header, 0x30)
+        first_difat_sector, difat_sector_count = struct.unpack_from('<II', header, 0x44)
+        per_sector = sector_size // 4
+
+        def read_sector(sector):
+            f.seek((sector + 1) * sector_size)
+            data = f.read(sector_size)
+            if len(data) < sector_size:
+                raise ValueError('OLE sector beyond the end of the file')
+            return data
+
+        # Locations of the FAT sectors: 109 in the header, the rest in a chain of DIFAT sectors
+        fat_sectors = list(struct.unpack_from('<109I', header, 0x4C))
+        sector = first_difat_sector
+        for _ in range(min(difat_sector_count, OLE_MAX_SECTORS)):
+            entries = struct.unpack(f'<{per_sector}I', read_sector(sector))
+            fat_sectors.extend(entries[:-1])
+            sector = entries[-1]
+
+        fat_cache = {}
+
+        def next_sector(sector):
+            index = sector // per_sector
+            if index not in fat_cache:
+                if index >= len(fat_sectors):
+                    raise ValueError('OLE sector outside the FAT')
+                fat_cache[index] = struct.unpack(f'<{per_sector}I', read_sector(fat_sectors[index]))
+            return fat_cache[index][sector % per_sector]
+
+        # Directory entries are 128 bytes: UTF-16LE name, name length in bytes, entry type
+        names = set()
+        sector = first_directory_sector
+        for _ in range(OLE_MAX_SECTORS):
+            if sector > OLE_MAX_REGULAR_SECTOR:
+                break
+            data = read_sector(sector)
+            for start in range(0, sector_size, 128):
+                name_length, entry_type = struct.unpack_from('<HB', data, start + 0x40)
+                if entry_type and 2 <= name_length <= 64:
+                    names.add(data[start:start + name_length - 2].decode('utf-16-le', 'replace'))
+            sector = next_sector(sector)
+        return names
+
+
+def select_parser(file_path):
+    """
+    Pick the cheapest parser for a file's sniffed format
+
+    Returns:
+        tuple: (Parser, detected format)
+
+    Raises:
+        UnsupportedFormatError: If the format is unknown or has no parser
+    """
+    detected = sniff_format(file_path)
+    for parser in _parsers:
+        if detected in parser.formats:
+            return parser, detected
+    raise UnsupportedFormatError(f'Unsupported or unrecognized file format: {detected or "unknown"}')
+
+
+def extract(file_path, parser=None, detected=None):
+    """
+    Extract text with the selected parser
+
+    Returns:
+        Extraction: Text, page offsets and parser details
+    """
+    if parser is None:
+        parser, detected = select_parser(file_path)
+
+    started = time.perf_counter()
+    pages = parser.extract(file_path)
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    offsets = []
+    position = 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page)
+
+    return Extraction(''.join(pages), offsets, parser.name, detected, round(duration_ms, 2))
+
+
+@register_parser('plain-text', '1', ('txt',), cost=1)
+def _parse_text(file_path):
+    return [document_parser.extract_text_from_txt(file_path)]
+
+
+@register_parser('python-docx', '0.8', ('docx',), cost=5)
+def _parse_docx(file_path):
+    return [document_parser.extract_text_from_docx(file_path)]
+
+
+@register_parser('pptx-xml', '1', ('pptx',), cost=5)
+def _parse_pptx(file_path):
+    return document_parser.extract_slides_from_pptx(file_path)
+
+
+@register_parser('ole-text-runs', '1', ('doc', 'ppt'), cost=8)
+def _parse_ole(file_path):
+    return [document_parser.extract_text_from_ole(file_path)]
+
+
+@register_parser('pypdf2', '3.0', ('pdf',), cost=10)
+def _parse_pdf(file_path):
+    return document_parser.extract_pages_from_pdf(file_path)
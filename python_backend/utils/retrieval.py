@@ -0,0 +1,242 @@
+import bisect
+import hashlib
+import math
+import re
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Matched against the original text so offsets stay exact; terms are lowercased afterwards
+WORD_PATTERN = re.compile(r'[A-Za-z0-9]+')
+
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have he her his i if in into is it its me my no not '
+    'of on or our she so than that the their them then there these they this to was we were what '
+    'when where which who why will with you your do does did can could would should about'.split()
+)
+
+# Default chunking parameters, in characters
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 200
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """
+    Split text into lowercase terms, dropping stopwords and single characters
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        list: Terms in order of appearance
+    """
+    return [term for term in TOKEN_PATTERN.findall(text.lower())
+            if len(term) > 1 and term not in STOPWORDS]
+
+
+def content_hash(text):
+    """
+    Get a stable hash of extracted text, used to key derived data and caches
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def normalize_question(question):
+    """
+    Normalize a question so trivially different phrasings share a cache entry
+    """
+    return ' '.join(re.sub(r'[^\w\s]', ' ', question.lower()).split())
+
+
+def estimate_tokens(text):
+    """
+    Rough token count for English text (about four characters per token)
+    """
+    return len(text) // 4 + 1
+
+
+def split_into_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Split text into overlapping chunks that end on whitespace where possible
+
+    Args:
+        text (str): Text to split
+        chunk_size (int): Maximum chunk length in characters
+        overlap (int): Characters shared by consecutive chunks
+
+    Returns:
+        list: (start_offset, chunk_text) tuples
+    """
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            # Prefer to break at a paragraph, then at any whitespace
+            boundary = text.rfind('\n', start + chunk_size // 2, end)
+            if boundary == -1:
+                boundary = text.rfind(' ', start + chunk_size // 2, end)
+            if boundary != -1:
+                end = boundary
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append((start, chunk))
+        if end >= length:
+            break
+
+        next_start = max(end - overlap, start + 1)
+        space = text.find(' ', next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return chunks
+
+
+def chunk_features(text):
+    """
+    Compute the lexical features stored for each chunk
+
+    Returns:
+        dict: Term frequencies and the chunk length in terms
+    """
+    terms = tokenize(text)
+    return {'terms': dict(Counter(terms)), 'length': len(terms)}
+
+
+def bm25_scores(query_terms, chunks, document_frequency=None, total_chunks=None, average_length=None):
+    """
+    Score chunks against query terms with BM25
+
+    Collection statistics default to those of the given chunks.
+
+    Args:
+        query_terms (list): Tokenized query
+        chunks (list): Dicts with 'terms' (term frequencies) and 'length'
+        document_frequency (dict): Number of chunks containing each term
+        total_chunks (int): Number of chunks in the collection
+        average_length (float): Average chunk length in terms
+
+    Returns:
+        list: Score per chunk, in input order
+    """
+    if total_chunks is None:
+        total_chunks = len(chunks)
+    if average_length is None:
+        average_length = sum(chunk['length'] for chunk in chunks) / max(1, len(chunks))
+    if document_frequency is None:
+        document_frequency = Counter()
+        for chunk in chunks:
+            document_frequency.update(term for term in set(query_terms) if term in chunk['terms'])
+
+    weights = {
+        term: math.log(1 + (total_chunks - document_frequency.get(term, 0) + 0.5)
+                       / (document_frequency.get(term, 0) + 0.5))
+        for term in set(query_terms)
+    }
+
+    scores = []
+    for chunk in chunks:
+        score = 0.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk['length'] / max(average_length, 1))
+        for term, weight in weights.items():
+            frequency = chunk['terms'].get(term)
+            if frequency:
+                score += weight * frequency * (BM25_K1 + 1) / (frequency + norm)
+        scores.append(score)
+    return scores
+
+
+def select_within_budget(chunks, token_budget):
+    """
+    Take chunks in the given order until the token budget is used up
+
+    Args:
+        chunks (list): Dicts with a 'text' key, best first
+        token_budget (int): Maximum estimated tokens of all selected chunks
+
+    Returns:
+        list: The selected chunks
+    """
+    selected = []
+    used = 0
+    for chunk in chunks:
+        cost = estimate_tokens(chunk['text'])
+        if used + cost > token_budget:
+            if selected:
+                break
+            # Always keep at least one chunk, trimmed to the budget
+            chunk = dict(chunk, text=chunk['text'][:token_budget * 4])
+            cost = token_budget
+        selected.append(chunk)
+        used += cost
+    return selected
+
+
+def word_terms(text):
+    """
+    Split text into lowercase terms for in-document find, keeping stopwords
+    and single characters so phrase positions stay consecutive
+    """
+    return [match.group().lower() for match in WORD_PATTERN.finditer(text)]
+
+
+def term_positions(text):
+    """
+    Build the positional index of a text
+
+    Returns:
+        dict: term -> (token positions, character offsets), both ascending
+    """
+    index = {}
+    for position, match in enumerate(WORD_PATTERN.finditer(text)):
+        entry = index.get(match.group().lower())
+        if entry is None:
+            entry = index[match.group().lower()] = ([], [])
+        entry[0].append(position)
+        entry[1].append(match.start())
+    return index
+
+
+def find_phrase(terms, postings):
+    """
+    Find consecutive occurrences of terms by intersecting their positions
+
+    Args:
+        terms (list): Query terms in order
+        postings (dict): term -> (token positions, character offsets)
+
+    Returns:
+        list: (start offset, end offset) of each occurrence, in document order
+    """
+    if not terms or any(term not in postings for term in terms):
+        return []
+
+    # Walk the rarest term and check the others at the implied positions
+    rarest = min(range(len(terms)), key=lambda i: len(postings[terms[i]][0]))
+    others = [(i, set(postings[term][0])) for i, term in enumerate(terms) if i != rarest]
+    starts = []
+    for position in postings[terms[rarest]][0]:
+        start = position - rarest
+        if all(start + i in positions for i, positions in others):
+            starts.append(start)
+
+    first_positions, first_offsets = postings[terms[0]]
+    last_positions, last_offsets = postings[terms[-1]]
+    first = dict(zip(first_positions, first_offsets))
+    last = dict(zip(last_positions, last_offsets))
+    end_shift = len(terms) - 1
+    return [(first[start], last[start + end_shift] + len(terms[-1])) for start in starts]
+
+
+def page_number(page_offsets, offset):
+    """
+    Get the 1-based page (or slide) containing a character offset, or None if the
+    document has no page boundaries
+    """
+    if not page_offsets:
+        return None
+    return max(1, bisect.bisect_right(page_offsets, offset))
@@ -0,0 +1,266 @@
+import bisect
+import heapq
+import math
+import threading
+from collections import OrderedDict
+from flask import current_app
+from utils.metrics import span
+from utils.retrieval import BM25_K1, BM25_B, content_hash
+from utils.fuzzy import TrigramIndex
+
+# Postings scored per query term; common terms are cut to their highest-impact chunks
+MAX_POSTINGS_PER_TERM = 2000
+
+# Documents with this content hash legitimately have no chunks
+EMPTY_CONTENT_HASH = content_hash('')
+
+
+class OwnerIndex:
+    """
+    In-memory inverted index over the chunks of one owner's documents
+    """
+    def __init__(self):
+        self.postings = {}      # term -> {chunk key: term frequency}
+        self.chunks = {}        # chunk key -> (chunk _id, document _id, index, start, length)
+        self.document_chunks = {}
+        self.document_versions = {}  # document _id -> content hash of the indexed chunks
+        self.total_length = 0
+        self._impacts = {}      # term -> [(-BM25 term-frequency component, chunk key)], best first
+        self._impact_average = None
+        self._trigrams = None   # built on the first fuzzy search
+        self._next_key = 0
+        self.lock = threading.RLock()
+
+    def add_document(self, document_id, chunks, version=None):
+        """
+        Index the chunks of a document, replacing any previously indexed version
+        """
+        with self.lock:
+            self.remove_document(document_id)
+            self.document_versions[document_id] = version
+            keys = []
+            new_impacts = {}
+            for chunk in chunks:
+                key = self._next_key
+                self._next_key += 1
+                self.chunks[key] = (chunk['_id'], document_id, chunk['index'], chunk['start'], chunk['length'])
+                self.total_length += chunk['length']
+                for term, frequency in chunk['terms'].items():
+                    if self._trigrams is not None and term not in self.postings:
+                        self._trigrams.add(term)
+                    self.postings.setdefault(term, {})[key] = frequency
+                    if term in self._impacts:
+                        new_impacts.setdefault(term, []).append((-self._impact(frequency, chunk['length']), key))
+                keys.append((key, chunk['terms']))
+            self.document_chunks[document_id] = keys
+
+            # Merge into the cached impact lists instead of rebuilding them
+            for term, entries in new_impacts.items():
+                impacts = self._impacts[term]
+                if len(entries) < 16:
+                    for entry in entries:
+                        bisect.insort(impacts, entry)
+                else:
+                    impacts.extend(entries)
+                    impacts.sort()
+
+    def remove_document(self, document_id):
+        with self.lock:
+            self.document_versions.pop(document_id, None)
+            for key, terms in self.document_chunks.pop(document_id, []):
+                self.total_length -= self.chunks.pop(key)[4]
+                for term in terms:
+                    postings = self.postings.get(term)
+                    if postings is not None:
+                        postings.pop(key, None)
+                        if not postings:
+                            del self.postings[term]
+                            if self._trigrams is not None:
+                                self._trigrams.remove(term)
+                    # Removed keys are skipped at search time; compact lists that are mostly stale
+                    impacts = self._impacts.get(term)
+                    if impacts is not None and len(impacts) > 2 * len(postings or ()):
+                        del self._impacts[term]
+
+    def search(self, query_terms, limit, term_boosts=None):
+        """
+        Rank chunks against the query with BM25
+
+        Args:
+            query_terms (list): Tokenized query
+            limit (int): Maximum number of chunks returned
+            term_boosts (dict): Weight multiplier per term, e.g. for fuzzy expansions
+
+        Returns:
+            list: (score, chunk _id, document _id, chunk index, start offset), best first
+        """
+        with self.lock:
+            total = len(self.chunks)
+            if not total:
+                return []
+            average_length = self.total_length / total
+
+            # Cached impacts depend on the average length; drop them once it drifts
+            if self._impact_average is None or abs(average_length - self._impact_average) > 0.2 * self._impact_average:
+                self._impacts.clear()
+                self._impact_average = average_length
+
+            scores = {}
+            for term in set(query_terms):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                weight = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                if term_boosts:
+                    weight *= term_boosts.get(term, 1.0)
+                scored = 0
+                for negated_impact, key in self._term_impacts(term, postings):
+                    if key not in self.chunks:
+                        continue
+                    scores[key] = scores.get(key, 0.0) - weight * negated_impact
+                    scored += 1
+                    if scored >= MAX_POSTINGS_PER_TERM:
+                        break
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [(score, *self.chunks[key][:4]) for key, score in best]
+
+    def _impact(self, frequency, length):
+        average_length = self._impact_average or length or 1
+        return frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+
+    def _term_impacts(self, term, postings):
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            impacts = sorted((-self._impact(frequency, self.chunks[key][4]), key)
+                             for key, frequency in postings.items())
+            self._impacts[term] = impacts
+        return impacts
+
+    @property
+    def vocabulary(self):
+        return self.postings.keys()
+
+    def expand_terms(self, query_terms):
+        """
+        Expand query terms missing from the vocabulary to close vocabulary terms
+
+        Returns:
+            dict: Misspelled term -> [(vocabulary term, edit distance)]
+        """
+        with self.lock:
+            missing = [term for term in dict.fromkeys(query_terms) if term not in self.postings]
+            if not missing:
+                return {}
+            if self._trigrams is None:
+                self._trigrams = TrigramIndex(self.postings)
+            expansions = {}
+            for term in missing:
+                matches = self._trigrams.expand(term, frequency=lambda t: len(self.postings.get(t, ())))
+                if matches:
+                    expansions[term] = matches
+            return expansions
+
+
+class SearchIndexRegistry:
+    """
+    Lazily loaded per-owner indexes, keeping the most recently used owners in memory
+    """
+    def __init__(self, max_owners=64):
+        self.max_owners = max_owners
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, owner):
+        """
+        Get the index of an owner, loading it from the document_chunks collection if needed
+        """
+        with self._lock:
+            index = self._indexes.get(owner)
+            if index is not None:
+                self._indexes.move_to_end(owner)
+                return index
+            index = self._indexes[owner] = OwnerIndex()
+            # Hold the owner's lock while loading so concurrent searches wait for it
+            index.lock.acquire()
+            while len(self._indexes) > self.max_owners:
+                self._indexes.popitem(last=False)
+
+        try:
+            with span('db', 'document_chunks.load_index'):
+                cursor = current_app.config['DB'].document_chunks.find(
+                    {'owner': owner},
+                    {'document': 1, 'contentHash': 1, 'index': 1, 'start': 1, 'terms': 1, 'length': 1}
+                )
+                by_document = {}
+                for chunk in cursor:
+                    by_document.setdefault(chunk['document'], []).append(chunk)
+            for document_id, chunks in by_document.items():
+                index.add_document(document_id, chunks, chunks[0].get('contentHash'))
+        except Exception:
+            with self._lock:
+                self._indexes.pop(owner, None)
+            raise
+        finally:
+            index.lock.release()
+        return index
+
+    def loaded(self, owner):
+        """
+        Get the index of an owner only if it is already in memory
+        """
+        with self._lock:
+            return self._indexes.get(owner)
+
+    def add_document(self, owner, document_id, chunks, version=None):
+        index = self.loaded(owner)
+        if index is not None:
+            index.add_document(document_id, chunks, version)
+
+    def remove_documents(self, owner, document_ids):
+        """
+        Remove documents from an owner's index, or from every loaded index if the owner is None
+        """
+        with self._lock:
+            indexes = list(self._indexes.values()) if owner is None else [self._indexes.get(owner)]
+        for index in indexes:
+            if index is not None:
+                for document_id in document_ids:
+                    index.remove_document(document_id)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def apply_change(self, change):
+        """
+        Change feed consumer: bring loaded indexes in step with a document written by any worker
+
+        Returns:
+            bool: False if the document's chunks are not stored yet and the change should be retried
+        """
+        if change.operation == 'delete':
+            self.remove_documents(change.owner, [change.document_id])
+            return True
+
+        index = self.loaded(change.owner)
+        if index is None:
+            return True
+
+        # Skip changes that leave the content alone, including this worker's own writes
+        version = change.document.get('contentHash')
+        if version is None or index.document_versions.get(change.document_id) == version:
+            return True
+
+        chunks = list(current_app.config['DB'].document_chunks.find(
+            {'document': change.document_id, 'contentHash': version},
+            {'index': 1, 'start': 1, 'terms': 1, 'length': 1}
+        ))
+        if not chunks and version != EMPTY_CONTENT_HASH:
+            # The writer stores chunks right after the document
+            return False
+        index.add_document(change.document_id, chunks, version)
+        return True
+
+
+search_indexes = SearchIndexRegistry()
@@ -0,0 +1,155 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from pymongo.errors import DuplicateKeyError
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs a function once per key while concurrent callers with the same key
+    wait for and share its result
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Run fn, or wait for the in-flight call with the same key
+
+        Args:
+            key (hashable): Identifies the work being done
+            fn (callable): Function computing the result
+
+        Returns:
+            The result of fn (exceptions are re-raised to every caller)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class MongoLeaseFlight:
+    """
+    Cross-process single flight using short-lived lease documents in MongoDB
+
+    The lease holder runs the function; other processes poll a check function
+    for the stored result until the lease is released or expires.
+    """
+    def __init__(self, collection_name='leases', lease_seconds=120, poll_interval=0.25):
+        self.collection_name = collection_name
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.holder_prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+    def _collection(self):
+        return current_app.config['DB'][self.collection_name]
+
+    def _acquire(self, lease_key, holder):
+        now = datetime.utcnow()
+        try:
+            # Matches a missing or expired lease; an active lease makes the upsert collide
+            self._collection().update_one(
+                {'_id': lease_key, 'expiresAt': {'$lt': now}},
+                {'$set': {'holder': holder, 'expiresAt': now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def _release(self, lease_key, holder):
+        self._collection().delete_one({'_id': lease_key, 'holder': holder})
+
+    def _is_held(self, lease_key):
+        return self._collection().count_documents(
+            {'_id': lease_key, 'expiresAt': {'$gte': datetime.utcnow()}}
+        ) > 0
+
+    def do(self, key, fn, check):
+        """
+        Run fn under a lease, or wait for another process to store the result
+
+        Args:
+            key (tuple or str): Identifies the work being done
+            fn (callable): Function computing and storing the result
+            check (callable): Returns the stored result, or None if not available yet
+
+        Returns:
+            The result of fn or of check
+        """
+        lease_key = ':'.join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+        holder = f'{self.holder_prefix}:{uuid.uuid4().hex}'
+
+        while True:
+            result = check()
+            if result is not None:
+                return result
+
+            if self._acquire(lease_key, holder):
+                try:
+                    return fn()
+                finally:
+                    self._release(lease_key, holder)
+
+            # Someone else holds the lease; wait for their result
+            while self._is_held(lease_key):
+                time.sleep(self.poll_interval)
+                result = check()
+                if result is not None:
+                    return result
+
+
+_local_flight = SingleFlight()
+_lease_flight = MongoLeaseFlight()
+
+
+def coalesce(key, fn, check=None):
+    """
+    Coalesce concurrent identical work into a single call
+
+    Always coalesces across threads of this process. When SINGLE_FLIGHT_BACKEND
+    is 'mongo' and a check function is given, also coalesces across processes.
+
+    Args:
+        key (tuple): Identifies the work, e.g. (document_id, operation)
+        fn (callable): Function computing (and storing) the result
+        check (callable): Returns an already stored result, or None
+
+    Returns:
+        The shared result
+    """
+    if check is not None and current_app.config.get('SINGLE_FLIGHT_BACKEND') == 'mongo':
+        return _local_flight.do(key, lambda: _lease_flight.do(key, fn, check))
+
+    return _local_flight.do(key, fn)
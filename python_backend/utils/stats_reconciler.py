@@ -0,0 +1,74 @@
+import threading
+from datetime import datetime, timedelta
+from models.library_stats import LibraryStats
+
+# Owners reconciled per pass
+RECONCILE_BATCH_SIZE = 100
+
+
+class StatsReconciler:
+    """
+    Periodically recomputes library aggregates, correcting any drift of the
+    incrementally maintained counters
+    """
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self.started = False
+
+    def start(self, app):
+        with self._start_lock:
+            if self.started:
+                return
+            self.started = True
+            interval = app.config.get('STATS_RECONCILE_INTERVAL', 3600)
+            if interval <= 0:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(app, interval),
+                                            name='stats-reconciler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.started = False
+
+    def run_once(self, interval):
+        """
+        Reconcile a batch of aggregates older than the interval
+
+        Returns:
+            int: Number of aggregates reconciled
+        """
+        owners = LibraryStats.find_stale(datetime.now() - timedelta(seconds=interval), RECONCILE_BATCH_SIZE)
+        reconciled = 0
+        for owner in owners:
+            if LibraryStats.reconcile(owner) is not None:
+                reconciled += 1
+        return reconciled
+
+    def _run(self, app, interval):
+        with app.app_context():
+            # Check often enough that each aggregate is at most about one interval old
+            while not self._stop.wait(min(interval, 60)):
+                try:
+                    self.run_once(interval)
+                except Exception as e:
+                    print(f'Stats reconciliation error: {e}')
+
+
+stats_reconciler = StatsReconciler()
+
+
+def init_stats_reconciler(app):
+    """
+    Start reconciliation on the first request of each worker process
+    """
+    @app.before_request
+    def start_stats_reconciler():
+        if not stats_reconciler.started:
+            stats_reconciler.start(app)
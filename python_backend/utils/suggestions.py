@@ -0,0 +1,221 @@
+import bisect
+import heapq
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app
+from utils.metrics import span
+
+WORD_START_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Completions can start at any of the first few words of a title or tag
+MAX_WORD_STARTS = 8
+
+# Matching keys examined per lookup; very short prefixes are ranked among the first ones
+MAX_SCANNED_KEYS = 2000
+
+# Cached lookups per owner, dropped whenever the owner's documents change
+MAX_CACHED_LOOKUPS = 512
+
+
+def normalize(text):
+    return ' '.join(str(text).lower().split())
+
+
+class OwnerSuggestions:
+    """
+    Sorted prefix keys over the titles and tags of one owner's documents
+    """
+    def __init__(self):
+        self.leading_keys = []  # sorted (key, 0, entry) for the whole text
+        self.inner_keys = []    # sorted (key, word index, entry) for the text from a later word on
+        self.entries = {}       # (kind, normalized text) -> {'text', 'kind', 'documents': {document _id: time}, 'last'}
+        self.documents = {}     # document _id -> entries it contributes to
+        self._cache = {}
+        self.lock = threading.RLock()
+
+    def add_document(self, document):
+        """
+        Index the title and tags of a document, replacing what it contributed before
+        """
+        with self.lock:
+            for key in self._add(document):
+                bisect.insort(self._keys_for(key), key)
+
+    def add_documents(self, documents):
+        """
+        Index many documents, sorting the keys once
+        """
+        with self.lock:
+            for document in documents:
+                for key in self._add(document):
+                    self._keys_for(key).append(key)
+            self.leading_keys.sort()
+            self.inner_keys.sort()
+
+    def _add(self, document):
+        # Returns the keys of entries created for the document, for the caller to insert
+        self.remove_document(document['_id'])
+        self._cache.clear()
+        seen = (document.get('updatedAt') or document.get('createdAt') or datetime.min)
+        contributed = []
+        new_keys = []
+        values = [('title', document.get('title'))] + [('tag', tag) for tag in document.get('tags') or []]
+        for kind, text in values:
+            if not isinstance(text, str) or not normalize(text):
+                continue
+            entry_id = (kind, normalize(text))
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                entry = self.entries[entry_id] = {'text': text.strip(), 'kind': kind, 'documents': {}, 'last': seen}
+                new_keys.extend(self._word_starts(entry_id))
+            entry['documents'][document['_id']] = seen
+            entry['last'] = max(entry['last'], seen)
+            contributed.append(entry_id)
+        self.documents[document['_id']] = contributed
+        return new_keys
+
+    def remove_document(self, document_id):
+        with self.lock:
+            self._cache.clear()
+            for entry_id in self.documents.pop(document_id, []):
+                entry = self.entries.get(entry_id)
+                if entry is None:
+                    continue
+                seen = entry['documents'].pop(document_id, None)
+                if not entry['documents']:
+                    del self.entries[entry_id]
+                    self._remove_keys(entry_id)
+                elif seen == entry['last']:
+                    entry['last'] = max(entry['documents'].values())
+
+    def suggest(self, prefix, limit):
+        """
+        Complete a prefix, most used and most recent first
+
+        Returns:
+            list: Dicts with the text, kind and number of documents
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self.lock:
+            cached = self._cache.get((prefix, limit))
+            if cached is not None:
+                return cached
+
+            # Completions of the whole text rank above completions of a later word,
+            # so later words are only scanned when there are too few of the former
+            candidates = {}
+            for keys in (self.leading_keys, self.inner_keys):
+                position = bisect.bisect_left(keys, (prefix,))
+                end = min(len(keys), position + MAX_SCANNED_KEYS)
+                while position < end and keys[position][0].startswith(prefix):
+                    _, word_index, entry_id = keys[position]
+                    candidates.setdefault(entry_id, word_index)
+                    position += 1
+                if len(candidates) >= limit:
+                    break
+
+            def rank(item):
+                entry_id, word_index = item
+                entry = self.entries[entry_id]
+                return (word_index == 0, len(entry['documents']), entry['last'])
+
+            best = heapq.nlargest(limit, candidates.items(), key=rank)
+            results = [{
+                'text': self.entries[entry_id]['text'],
+                'kind': self.entries[entry_id]['kind'],
+                'count': len(self.entries[entry_id]['documents'])
+            } for entry_id, _ in best]
+
+            if len(self._cache) >= MAX_CACHED_LOOKUPS:
+                self._cache.clear()
+            self._cache[(prefix, limit)] = results
+            return results
+
+    def _word_starts(self, entry_id):
+        text = entry_id[1]
+        for word_index, match in enumerate(WORD_START_PATTERN.finditer(text)):
+            if word_index >= MAX_WORD_STARTS:
+                break
+            yield (text[match.start():], word_index, entry_id)
+
+    def _keys_for(self, key):
+        return self.leading_keys if key[1] == 0 else self.inner_keys
+
+    def _remove_keys(self, entry_id):
+        for key in self._word_starts(entry_id):
+            keys = self._keys_for(key)
+            position = bisect.bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+
+
+class SuggestionIndexRegistry:
+    """
+    Lazily loaded per-owner suggestion indexes, keeping the most recently used owners in memory
+    """
+    def __init__(self, max_owners=256):
+        self.max_owners = max_owners
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, owner):
+        """
+        Get the index of an owner, loading it from the documents collection if needed
+        """
+        with self._lock:
+            index = self._indexes.get(owner)
+            if index is not None:
+                self._indexes.move_to_end(owner)
+                return index
+            index = self._indexes[owner] = OwnerSuggestions()
+            # Hold the owner's lock while loading so concurrent lookups wait for it
+            index.lock.acquire()
+            while len(self._indexes) > self.max_owners:
+                self._indexes.popitem(last=False)
+
+        try:
+            with span('db', 'documents.load_suggestions'):
+                documents = list(current_app.config['DB'].documents.find(
+                    {'owner': owner},
+                    {'title': 1, 'tags': 1, 'createdAt': 1, 'updatedAt': 1}
+                ))
+            index.add_documents(documents)
+        except Exception:
+            with self._lock:
+                self._indexes.pop(owner, None)
+            raise
+        finally:
+            index.lock.release()
+        return index
+
+    def loaded(self, owner):
+        with self._lock:
+            return self._indexes.get(owner)
+
+    def apply_change(self, change):
+        """
+        Change feed consumer: apply a document written by this or any other worker
+        """
+        if change.operation == 'delete':
+            with self._lock:
+                indexes = list(self._indexes.values()) if change.owner is None else [self._indexes.get(change.owner)]
+            for index in indexes:
+                if index is not None:
+                    index.remove_document(change.document_id)
+            return True
+
+        index = self.loaded(change.owner)
+        if index is not None:
+            index.add_document(change.document)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+suggestion_indexes = SuggestionIndexRegistry()